@@ -1,20 +1,85 @@
 """Endpoints for running correlations"""
+import io
+from functools import partial
+
+from flask import json
 from flask import jsonify
 from flask import Blueprint
+from flask import current_app
+from flask import Response
 from flask import request
+from flask import stream_with_context
 
-from gn3.computations.correlations import compute_all_sample_correlation
 from gn3.computations.correlations import compute_all_lit_correlation
-from gn3.computations.correlations import compute_tissue_correlation
 from gn3.computations.correlations import map_shared_keys_to_values
+from gn3.computations.columnar_data import NPZ_MIMETYPE
+from gn3.computations.columnar_data import load_columnar_sample_data
+from gn3.computations.dataset_matrix import DATASET_TYPES
+from gn3.computations.dataset_matrix import compute_dataset_correlation
+from gn3.computations.dataset_matrix import load_correlation_index
+from gn3.computations.dataset_matrix import load_dataset_matrix
+from gn3.computations.dataset_matrix import load_search_index
+from gn3.computations.dataset_matrix import refresh_dataset_correlation
+from gn3.computations.dataset_matrix import search_dataset_correlation
+from gn3.computations.lit_matrix import load_lit_matrix
+from gn3.computations.lit_matrix import lookup_lit_correlations
+from gn3.computations.result_cache import result_cache_stats
+from gn3.computations.tissue_matrix import compute_vectorized_tissue_correlation
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+from gn3.computations.vectorized_correlations import compute_vectorized_sample_correlation
+from gn3.computations.vectorized_correlations import format_correlation_results
+from gn3.db.generations import retrieve_dataset_generation
 from gn3.db_utils import database_connector
 
 correlation = Blueprint("correlation", __name__)
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+@correlation.before_request
+def validate_top_n():
+    """Reject a `top_n` query argument that is not a non-negative integer"""
+    top_n = request.args.get("top_n")
+    if top_n is not None and not top_n.isdigit():
+        return jsonify(status=128,
+                       error="top_n must be a non-negative integer"), 400
+    return None
+
+
+def __correlation_response(results, wrap_key=None):
+    """Respond with the sorted correlation RESULTS. A client that accepts
+    `application/x-ndjson` gets one result per line, written as it is
+    serialized; other clients get a JSON list, wrapped in an object under
+    WRAP_KEY if it is given"""
+    if request.accept_mimetypes.best_match(
+            ["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+        return Response(
+            stream_with_context(
+                f"{json.dumps(result)}\n" for result in results),
+            mimetype=NDJSON_MIMETYPE)
+    if wrap_key is not None:
+        return jsonify({wrap_key: results})
+    return jsonify(results)
+
 
 @correlation.route("/sample_x/<string:corr_method>", methods=["POST"])
 def compute_sample_integration(corr_method="pearson"):
-    """temporary api to  help integrate genenetwork2  to genenetwork3 """
+    """temporary api to  help integrate genenetwork2  to genenetwork3. The
+    input can also be sent as an NPZ body (see `gn3.computations.columnar_data`)
+    with the `application/x-npz` content type"""
+
+    if request.mimetype == NPZ_MIMETYPE:
+        try:
+            (primary_vals, target_matrix,
+             trait_names) = load_columnar_sample_data(
+                 io.BytesIO(request.get_data()))
+        except (KeyError, ValueError) as error:
+            return jsonify(status=128,
+                           error=f"Invalid NPZ correlation input: {error}"), 400
+        return __correlation_response(format_correlation_results(
+            trait_names, *compute_correlation_arrays(
+                primary_vals, target_matrix, corr_method),
+            top_n=request.args.get("top_n", type=int)))
 
     correlation_input = request.get_json()
 
@@ -23,11 +88,13 @@ def compute_sample_integration(corr_method="pearson"):
     this_trait_data = correlation_input.get("trait_data")
 
     results = map_shared_keys_to_values(target_samplelist, target_data_values)
-    correlation_results = compute_all_sample_correlation(corr_method=corr_method,
-                                                         this_trait=this_trait_data,
-                                                         target_dataset=results)
+    correlation_results = compute_vectorized_sample_correlation(
+        corr_method=corr_method,
+        this_trait=this_trait_data,
+        target_dataset=results,
+        top_n=request.args.get("top_n", type=int))
 
-    return jsonify(correlation_results)
+    return __correlation_response(correlation_results)
 
 
 @correlation.route("/sample_r/<string:corr_method>", methods=["POST"])
@@ -42,13 +109,115 @@ def compute_sample_r(corr_method="pearson"):
     this_trait_data = correlation_input.get("this_trait")
     target_dataset_data = correlation_input.get("target_dataset")
 
-    correlation_results = compute_all_sample_correlation(corr_method=corr_method,
-                                                         this_trait=this_trait_data,
-                                                         target_dataset=target_dataset_data)
+    correlation_results = compute_vectorized_sample_correlation(
+        corr_method=corr_method,
+        this_trait=this_trait_data,
+        target_dataset=target_dataset_data,
+        top_n=request.args.get("top_n", type=int))
+
+    return __correlation_response(correlation_results, "corr_results")
+
+
+@correlation.route(
+    "/dataset/<string:dataset_type>/<string:dataset_name>/<string:corr_method>",
+    methods=["POST"])
+def compute_dataset_r(dataset_type, dataset_name, corr_method="pearson"):
+    """Correlation endpoint for computing sample r correlations against a
+    whole `ProbeSet`, `Publish` or `Geno` dataset that is loaded on the
+    server, from the dataset matrix cache if it is there; the api expects only
+    the primary trait's sample data. Results are kept in the result cache.
+    With `approximate=true` and a `top_n` the pearson correlations of a large
+    dataset are searched with its approximate search index instead
+    """
+    if dataset_type not in DATASET_TYPES:
+        return jsonify(status=128,
+                       error=f"Unknown dataset type: {dataset_type}"), 400
+    this_trait_data = request.get_json().get("this_trait")
+
+    conn, _cursor_object = database_connector()
+    try:
+        generation = retrieve_dataset_generation(
+            conn, dataset_type, dataset_name)
+        dataset_matrix = load_dataset_matrix(
+            conn, dataset_type, dataset_name, generation,
+            cache_dir=current_app.config.get("DATASET_MATRIX_CACHEDIR"),
+            dtype=current_app.config.get("DATASET_MATRIX_DTYPE", "float32"))
+    finally:
+        conn.close()
+    top_n = request.args.get("top_n", type=int)
+    if (request.args.get("approximate") == "true" and
+            corr_method == "pearson" and top_n is not None and
+            len(dataset_matrix[0]) >= current_app.config.get(
+                "CORRELATION_SEARCH_MIN_TRAITS", 100000)):
+        search_index = load_search_index(
+            current_app.config.get("DATASET_MATRIX_CACHEDIR"), dataset_type,
+            dataset_name, generation, dataset_matrix[2])
+        if search_index is not None:
+            return __correlation_response(search_dataset_correlation(
+                this_trait_samples=this_trait_data["trait_sample_data"],
+                dataset_matrix=dataset_matrix,
+                search_index=search_index,
+                top_n=top_n,
+                num_probes=current_app.config.get(
+                    "CORRELATION_SEARCH_NUM_PROBES", 16)), "corr_results")
 
-    return jsonify({
-        "corr_results": correlation_results
-    })
+    correlation_index = load_correlation_index(
+        current_app.config.get("DATASET_MATRIX_CACHEDIR"), dataset_type,
+        dataset_name, generation, corr_method, dataset_matrix[2])
+
+    correlation_results = compute_dataset_correlation(
+        this_trait_samples=this_trait_data["trait_sample_data"],
+        dataset_matrix=dataset_matrix,
+        corr_method=corr_method,
+        top_n=top_n,
+        dataset_key=(dataset_type, dataset_name, generation),
+        correlation_index=correlation_index)
+
+    return __correlation_response(correlation_results, "corr_results")
+
+
+@correlation.route(
+    "/dataset/<string:dataset_type>/<string:dataset_name>/pearson/refresh",
+    methods=["POST"])
+def refresh_dataset_r(dataset_type, dataset_name):
+    """Correlation endpoint for refreshing the pearson correlations of a
+    primary trait against a whole dataset after a curator edits some of its
+    values; the api expects the primary trait's sample data from before the
+    edit and the `changes`, a dict of samples to their new values. The
+    correlations are updated from the statistics kept by the previous refresh
+    of the same sample data, and computed from scratch when there are none
+    """
+    if dataset_type not in DATASET_TYPES:
+        return jsonify(status=128,
+                       error=f"Unknown dataset type: {dataset_type}"), 400
+    correlation_input = request.get_json()
+
+    conn, _cursor_object = database_connector()
+    try:
+        generation = retrieve_dataset_generation(
+            conn, dataset_type, dataset_name)
+        dataset_matrix = load_dataset_matrix(
+            conn, dataset_type, dataset_name, generation,
+            cache_dir=current_app.config.get("DATASET_MATRIX_CACHEDIR"),
+            dtype=current_app.config.get("DATASET_MATRIX_DTYPE", "float32"))
+    finally:
+        conn.close()
+
+    correlation_results = refresh_dataset_correlation(
+        this_trait_samples=correlation_input.get(
+            "this_trait")["trait_sample_data"],
+        changes=correlation_input.get("changes", {}),
+        dataset_matrix=dataset_matrix,
+        dataset_key=(dataset_type, dataset_name, generation),
+        top_n=request.args.get("top_n", type=int))
+
+    return __correlation_response(correlation_results, "corr_results")
+
+
+@correlation.route("/cache_stats", methods=["GET"])
+def get_cache_stats():
+    """Hit and miss statistics of this worker's correlation result cache"""
+    return jsonify(result_cache_stats())
 
 
 @correlation.route("/lit_corr/<string:species>/<int:gene_id>", methods=["POST"])
@@ -62,13 +231,17 @@ def compute_lit_corr(species=None, gene_id=None):
     target_traits_gene_ids = request.get_json()
     target_trait_gene_list = list(target_traits_gene_ids.items())
 
+    lit_matrix = load_lit_matrix(current_app.config.get("LIT_MATRIX_CACHEDIR"))
     lit_corr_results = compute_all_lit_correlation(
         conn=conn, trait_lists=target_trait_gene_list,
-        species=species, gene_id=gene_id)
+        species=species, gene_id=gene_id,
+        top_n=request.args.get("top_n", type=int),
+        fetch_lit_corrs=(None if lit_matrix is None else
+                         partial(lookup_lit_correlations, lit_matrix)))
 
     conn.close()
 
-    return jsonify(lit_corr_results)
+    return __correlation_response(lit_corr_results)
 
 
 @correlation.route("/tissue_corr/<string:corr_method>", methods=["POST"])
@@ -78,8 +251,10 @@ def compute_tissue_corr(corr_method="pearson"):
     primary_tissue_dict = tissue_input_data["primary_tissue"]
     target_tissues_dict = tissue_input_data["target_tissues_dict"]
 
-    results = compute_tissue_correlation(primary_tissue_dict=primary_tissue_dict,
-                                         target_tissues_data=target_tissues_dict,
-                                         corr_method=corr_method)
+    results = compute_vectorized_tissue_correlation(
+        primary_tissue_dict=primary_tissue_dict,
+        target_tissues_data=target_tissues_dict,
+        corr_method=corr_method,
+        top_n=request.args.get("top_n", type=int))
 
-    return jsonify(results)
+    return __correlation_response(results)
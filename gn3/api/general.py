@@ -7,6 +7,7 @@ from flask import request
 
 from gn3.fs_helpers import extract_uploaded_file
 from gn3.commands import run_cmd
+from gn3.db_utils import db_pool_stats
 
 
 general = Blueprint("general", __name__)
@@ -16,6 +17,11 @@ def version():
     """Get API version."""
     return jsonify("1.0")
 
+@general.route("/db_pool_stats")
+def get_db_pool_stats():
+    """Usage counters of this worker's database connection pool"""
+    return jsonify(db_pool_stats())
+
 @general.route("/metadata/upload/", methods=["POST"],
                strict_slashes=False)
 def upload_metadata_with_no_token():
@@ -1,5 +1,6 @@
 """Entry point from spinning up flask"""
 import os
+import atexit
 
 from typing import Dict
 from typing import Union
@@ -9,6 +10,15 @@ from gn3.api.rqtl import rqtl
 from gn3.api.general import general
 from gn3.api.correlation import correlation
 from gn3.api.data_entry import data_entry
+from gn3.computations.process_pool import configure_pool
+from gn3.computations.process_pool import shutdown_pool
+from gn3.computations.lit_matrix import start_lit_matrix_build
+from gn3.computations.result_cache import configure_result_cache
+from gn3.db.datasets import configure_dataset_metadata_cache
+from gn3.db.datasets import warm_dataset_metadata_cache
+from gn3.db_utils import close_db_connections
+from gn3.db_utils import configure_db_pool
+from gn3.db_utils import database_connector
 
 
 def create_app(config: Union[Dict, str, None] = None) -> Flask:
@@ -27,6 +37,28 @@ def create_app(config: Union[Dict, str, None] = None) -> Flask:
             app.config.update(config)
         elif config.endswith(".py"):
             app.config.from_pyfile(config)
+    configure_pool(processes=app.config["CORRELATION_POOL_SIZE"],
+                   chunksize=app.config["CORRELATION_POOL_CHUNKSIZE"])
+    # Only once however many apps are created
+    atexit.unregister(shutdown_pool)
+    atexit.register(shutdown_pool)
+    configure_result_cache(
+        max_bytes=app.config["CORRELATION_CACHE_MAX_BYTES"],
+        redis_uri=(app.config["REDIS_URI"]
+                   if app.config["CORRELATION_CACHE_USE_REDIS"] else None),
+        redis_ttl=app.config["CORRELATION_CACHE_REDIS_TTL"])
+    configure_db_pool(size=app.config["DB_POOL_SIZE"],
+                      timeout=app.config["DB_POOL_TIMEOUT"],
+                      max_idle_time=app.config["DB_POOL_MAX_IDLE_TIME"])
+    app.teardown_appcontext(close_db_connections)
+    configure_dataset_metadata_cache(ttl=app.config["DATASET_METADATA_TTL"])
+    if app.config["DATASET_METADATA_WARM_UP"]:
+        conn, _cursor = database_connector()
+        warm_dataset_metadata_cache(0, conn)
+        conn.close()
+    if app.config["LIT_MATRIX_CACHEDIR"]:
+        start_lit_matrix_build(app.config["LIT_MATRIX_CACHEDIR"],
+                               app.config["LIT_MATRIX_CHECK_INTERVAL"])
     app.register_blueprint(general, url_prefix="/api/")
     app.register_blueprint(gemma, url_prefix="/api/gemma")
     app.register_blueprint(rqtl, url_prefix="/api/rqtl")
@@ -1,10 +1,15 @@
-"""module contains script to call biweight midcorrelation in R"""
+"""module contains biweight midcorrelation computed in NumPy, and the script
+calling the WGCNA R implementation which it replaces"""
 import subprocess
+import warnings
 
 from typing import List
 from typing import Tuple
 
+import numpy as np
+
 from gn3.settings import BIWEIGHT_RSCRIPT
+from gn3.computations.pvalues import compute_corr_p_values
 
 
 def calculate_biweight_corr(trait_vals: List,
@@ -12,7 +17,8 @@ def calculate_biweight_corr(trait_vals: List,
                             path_to_script: str = BIWEIGHT_RSCRIPT,
                             command: str = "Rscript"
                             ) -> Tuple[float, float]:
-    """biweight function"""
+    """biweight function using WGCNA's bicorAndPvalue; starts an R process per
+    call so use `compute_biweight_corr` instead"""
 
     args_1 = ' '.join(str(trait_val) for trait_val in trait_vals)
     args_2 = ' '.join(str(target_val) for target_val in target_vals)
@@ -25,3 +31,57 @@ def calculate_biweight_corr(trait_vals: List,
         return (corr_coeff, p_val)
     except Exception as error:
         raise error
+
+
+def biweight_transform(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Replace each column of `values` with its biweight weighted deviations
+    from the median over the masked samples, i.e. (x - med) * (1 - u^2)^2 with
+    u = (x - med) / (9 * mad) and zero weight for |u| >= 1. Like WGCNA's
+    default `pearsonFallback = "individual"`, columns with a zero median
+    absolute deviation use their deviations from the mean instead. Samples
+    outside the mask, and constant columns, are 0
+
+    """
+    masked = np.where(mask, values, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        median = np.nanmedian(masked, axis=0)
+        deviation = masked - median
+        mad = np.nanmedian(np.abs(deviation), axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scaled = deviation / (9 * mad)
+        weights = np.where(np.abs(scaled) < 1, (1 - scaled ** 2) ** 2, 0.0)
+        weighted = np.where(
+            mad == 0, masked - np.nanmean(masked, axis=0), deviation * weights)
+        constant = np.nanmax(masked, axis=0) == np.nanmin(masked, axis=0)
+    return np.where(mask & ~constant, weighted, 0.0)
+
+
+def biweight_midcorrelation(primary_vals: np.ndarray,
+                            target_matrix: np.ndarray,
+                            mask: np.ndarray) -> np.ndarray:
+    """Compute the biweight midcorrelation of each column of `target_matrix`
+    against `primary_vals` (a column or a matrix of the same shape) over the
+    masked samples
+
+    """
+    x_weighted = biweight_transform(
+        np.broadcast_to(primary_vals, target_matrix.shape), mask)
+    y_weighted = biweight_transform(target_matrix, mask)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = ((x_weighted * y_weighted).sum(axis=0) /
+                np.sqrt((x_weighted ** 2).sum(axis=0) *
+                        (y_weighted ** 2).sum(axis=0)))
+    return np.clip(corr, -1.0, 1.0)
+
+
+def compute_biweight_corr(trait_vals: List,
+                          target_vals: List) -> Tuple[float, float]:
+    """Compute the biweight midcorrelation and its student p value for two
+    lists of values of the same length, in place of WGCNA's bicorAndPvalue"""
+    trait_array = np.array(trait_vals, dtype=float)[:, None]
+    target_array = np.array(target_vals, dtype=float)[:, None]
+    mask = ~(np.isnan(trait_array) | np.isnan(target_array))
+    corr = biweight_midcorrelation(trait_array, target_array, mask)
+    return (float(corr[0]),
+            float(compute_corr_p_values(corr, mask.sum(axis=0))[0]))
@@ -0,0 +1,102 @@
+"""module contains the binary columnar (NPZ) format for sample correlation
+input. The target dataset is sent as one (traits x samples) float matrix with
+a sample header instead of a JSON dict of lists, and is read straight into the
+arrays used by `gn3.computations.vectorized_correlations`
+
+An NPZ body holds the arrays:
+
+trait_samplelist: (samples,) str -- samples of the primary trait
+trait_values: (samples,) float -- primary trait values, NaN when missing
+target_samplelist: (target samples,) str -- the matrix' sample header
+target_trait_ids: (traits,) str
+target_dataset: (traits, target samples) float32/float64, NaN when missing
+"""
+import zipfile
+
+from typing import IO
+from typing import List
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+NPZ_MIMETYPE = "application/x-npz"
+
+
+def align_sample_matrix(
+        trait_samplelist: Sequence[str], trait_values: np.ndarray,
+        target_samplelist: Sequence[str],
+        target_dataset: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Align a (traits x target samples) matrix to the primary trait's
+    samples. Returns the primary values, with falsy values treated as missing
+    as `normalize_values` does, and the (primary samples x traits) target
+    matrix the engine expects with NaN for samples the targets lack
+
+    """
+    sample_index = {
+        sample: idx for idx, sample in enumerate(target_samplelist)}
+    columns = np.array(
+        [sample_index.get(sample, -1) for sample in trait_samplelist],
+        dtype=int)
+    primary_vals = np.array(trait_values, dtype=float)
+    primary_vals[primary_vals == 0] = np.nan
+    # Select the samples before converting so that only they are read from a
+    # memory-mapped float32 matrix
+    target_matrix = np.asarray(target_dataset).reshape(
+        -1, len(target_samplelist))[:, columns].T.astype(float)
+    target_matrix[columns < 0] = np.nan
+    return (primary_vals, target_matrix)
+
+
+def load_columnar_sample_data(
+        npz_file: Union[str, IO]) -> Tuple[np.ndarray, np.ndarray, List]:
+    """Read an NPZ body into the primary values, the (samples x traits)
+    target matrix and the trait names. Raises `KeyError` for missing arrays
+    and `ValueError` for a malformed file or arrays of mismatched shapes"""
+    try:
+        data = np.load(npz_file, allow_pickle=False)
+    except (EOFError, zipfile.BadZipFile) as error:
+        raise ValueError(f"Not an NPZ file: {error}") from error
+    if not isinstance(data, np.lib.npyio.NpzFile):
+        raise ValueError("Not an NPZ file")
+    with data:
+        (trait_samplelist, trait_values, target_samplelist,
+         target_trait_ids, target_dataset) = (
+             data["trait_samplelist"], data["trait_values"],
+             data["target_samplelist"], data["target_trait_ids"],
+             data["target_dataset"])
+        if trait_values.shape != trait_samplelist.shape or (
+                trait_values.ndim != 1):
+            raise ValueError(
+                f"trait_values has shape {trait_values.shape} but "
+                f"trait_samplelist has shape {trait_samplelist.shape}")
+        if target_samplelist.ndim != 1 or target_samplelist.size == 0:
+            raise ValueError("target_samplelist is empty")
+        if target_dataset.shape != (
+                target_trait_ids.size, target_samplelist.size):
+            raise ValueError(
+                f"target_dataset has shape {target_dataset.shape}, expected "
+                f"({target_trait_ids.size}, {target_samplelist.size})")
+        (primary_vals, target_matrix) = align_sample_matrix(
+            trait_samplelist.tolist(), trait_values,
+            target_samplelist.tolist(), target_dataset)
+        return (primary_vals, target_matrix, target_trait_ids.tolist())
+
+
+def save_columnar_sample_data(npz_file: Union[str, IO],
+                              trait_sample_data: dict,
+                              target_samplelist: List,
+                              target_dataset: dict,
+                              dtype: str = "float64") -> None:
+    """Write the JSON form of the `sample_x` input (the primary trait's sample
+    data and the target dataset dict of lists) as an NPZ body"""
+    np.savez(
+        npz_file,
+        trait_samplelist=np.array(list(trait_sample_data.keys()), dtype=str),
+        trait_values=np.array(list(trait_sample_data.values()), dtype=float),
+        target_samplelist=np.array(target_samplelist, dtype=str),
+        target_trait_ids=np.array(list(target_dataset.keys()), dtype=str),
+        target_dataset=np.array(
+            list(target_dataset.values()), dtype=dtype).reshape(
+                len(target_dataset), len(target_samplelist)))
@@ -1,14 +1,24 @@
 """module contains code for correlations"""
 import math
-import multiprocessing
+from functools import partial
 
+from typing import Dict
 from typing import List
 from typing import Tuple
 from typing import Optional
 from typing import Callable
 
+import numpy as np
 import scipy.stats
-from gn3.computations.biweight import calculate_biweight_corr
+from gn3.computations.biweight import biweight_midcorrelation
+from gn3.computations.biweight import compute_biweight_corr
+from gn3.computations.process_pool import pool_starmap
+from gn3.computations.pvalues import compute_corr_p_values
+
+# Species with a column of gene ids in GeneIDXRef, all the species whose gene
+# ids can be mapped to mouse gene ids; the gene ids of other species map to
+# none, as they did with `map_to_mouse_gene_id`
+GENE_ID_SPECIES = ("mouse", "rat", "human")
 
 
 def map_shared_keys_to_values(target_sample_keys: List,
@@ -37,6 +47,34 @@ def map_shared_keys_to_values(target_sample_keys: List,
     return target_dataset_data
 
 
+def top_n_indices(corr_coefficients, top_n: Optional[int] = None) -> np.ndarray:
+    """Return the indices of the TOP_N coefficients with the largest absolute
+    value in descending order, all of them if TOP_N is None. Ties keep their
+    input order like a stable sort and NaNs come last. Only the selected
+    coefficients are sorted: the rest are split off with `np.argpartition`
+
+    """
+    keys = -np.abs(np.asarray(corr_coefficients, dtype=float))
+    if top_n is None or top_n >= keys.size:
+        return np.argsort(keys, kind="stable")
+    if top_n <= 0:
+        return np.array([], dtype=int)
+    kth_key = keys[np.argpartition(keys, top_n - 1)[top_n - 1]]
+    candidates = (np.arange(keys.size) if np.isnan(kth_key)
+                  else np.flatnonzero(keys <= kth_key))
+    return candidates[
+        np.argsort(keys[candidates], kind="stable")[:top_n]]
+
+
+def sort_correlation_results(corr_results: List, corr_key: str,
+                             top_n: Optional[int] = None) -> List:
+    """Sort a list of single key correlation result dicts by the absolute
+    value of CORR_KEY in descending order keeping only the first TOP_N"""
+    return [corr_results[idx] for idx in top_n_indices(
+        [list(result.values())[0][corr_key] for result in corr_results],
+        top_n).tolist()]
+
+
 def normalize_values(a_values: List,
                      b_values: List) -> Tuple[List[float], List[float], int]:
     """Trim two lists of values to contain only the values they both share Given
@@ -74,6 +112,47 @@ pearson,spearman and biweight mid correlation return value is rho and p_value
     return (corr_coefficient, p_val)
 
 
+def compute_corr_coefficient(primary_values: List, target_values: List,
+                             corr_method: str) -> float:
+    """Compute only the correlation coefficient of the primary and target
+    values; the p values are computed for all the traits at once with
+    `compute_corr_p_values` instead of once per trait by scipy
+
+    """
+    primary_array = np.array(primary_values, dtype=float)
+    target_array = np.array(target_values, dtype=float)
+    if corr_method == "bicor":
+        return float(biweight_midcorrelation(
+            primary_array[:, None], target_array[:, None],
+            np.ones((len(primary_array), 1), dtype=bool))[0])
+    if corr_method == "spearman":
+        primary_array = scipy.stats.rankdata(primary_array)
+        target_array = scipy.stats.rankdata(target_array)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return float(np.clip(
+            np.corrcoef(primary_array, target_array)[0, 1], -1.0, 1.0))
+
+
+def compute_sample_r_coefficient(trait_name, corr_method, trait_vals,
+                                 target_samples_vals) -> Optional[
+                                     Tuple[str, float, int]]:
+    """Like `compute_sample_r_correlation` but leaves out the p value which is
+    computed afterwards for all the traits in one batch
+
+    """
+    (sanitized_traits_vals, sanitized_target_vals,
+     num_overlap) = normalize_values(trait_vals, target_samples_vals)
+
+    if num_overlap > 5:
+        corr_coefficient = compute_corr_coefficient(
+            primary_values=sanitized_traits_vals,
+            target_values=sanitized_target_vals,
+            corr_method=corr_method)
+        if not math.isnan(corr_coefficient):
+            return (trait_name, corr_coefficient, num_overlap)
+    return None
+
+
 def compute_sample_r_correlation(trait_name, corr_method, trait_vals,
                                  target_samples_vals) -> Optional[
                                      Tuple[str, float, float, int]]:
@@ -97,16 +176,11 @@ def compute_sample_r_correlation(trait_name, corr_method, trait_vals,
 
 
 def do_bicor(x_val, y_val) -> Tuple[float, float]:
-    """Not implemented method for doing biweight mid correlation use astropy stats
-package :not packaged in guix
+    """Method for doing biweight mid correlation, computed in NumPy instead of
+    calling WGCNA through Rscript
 
     """
-
-    try:
-        results = calculate_biweight_corr(x_val, y_val)
-        return results
-    except Exception as error:
-        raise error
+    return compute_biweight_corr(x_val, y_val)
 
 
 def filter_shared_sample_keys(this_samplelist,
@@ -126,10 +200,11 @@ def filter_shared_sample_keys(this_samplelist,
 
 def fast_compute_all_sample_correlation(this_trait,
                                         target_dataset,
-                                        corr_method="pearson") -> List:
+                                        corr_method="pearson",
+                                        top_n: Optional[int] = None) -> List:
     """Given a trait data sample-list and target__datasets compute all sample
     correlation
-    this functions uses multiprocessing if not use the normal fun
+    this functions uses the application process pool if not use the normal fun
 
     """
     # xtodo fix trait_name currently returning single one
@@ -142,28 +217,30 @@ def fast_compute_all_sample_correlation(this_trait,
         target_trait_data = target_trait["trait_sample_data"]
         processed_values.append((trait_name, corr_method, *filter_shared_sample_keys(
             this_trait_samples, target_trait_data)))
-    with multiprocessing.Pool(4) as pool:
-        results = pool.starmap(compute_sample_r_correlation, processed_values)
-
-        for sample_correlation in results:
-            if sample_correlation is not None:
-                (trait_name, corr_coefficient, p_value,
-                 num_overlap) = sample_correlation
-                corr_result = {
-                    "corr_coefficient": corr_coefficient,
-                    "p_value": p_value,
-                    "num_overlap": num_overlap
-                }
+    results = [
+        sample_correlation for sample_correlation in
+        pool_starmap(compute_sample_r_coefficient, processed_values)
+        if sample_correlation is not None]
+    p_values = compute_corr_p_values(
+        [corr_coefficient for (_, corr_coefficient, _) in results],
+        [num_overlap for (_, _, num_overlap) in results])
+
+    for ((trait_name, corr_coefficient, num_overlap),
+         p_value) in zip(results, p_values.tolist()):
+        corr_result = {
+            "corr_coefficient": corr_coefficient,
+            "p_value": p_value,
+            "num_overlap": num_overlap
+        }
 
-                corr_results.append({trait_name: corr_result})
-    return sorted(
-        corr_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["corr_coefficient"]))
+        corr_results.append({trait_name: corr_result})
+    return sort_correlation_results(corr_results, "corr_coefficient", top_n)
 
 
 def compute_all_sample_correlation(this_trait,
                                    target_dataset,
-                                   corr_method="pearson") -> List:
+                                   corr_method="pearson",
+                                   top_n: Optional[int] = None) -> List:
     """Temp function to benchmark with compute_all_sample_r alternative to
     compute_all_sample_r where we use multiprocessing
 
@@ -171,30 +248,24 @@ def compute_all_sample_correlation(this_trait,
     this_trait_samples = this_trait["trait_sample_data"]
     corr_results = []
     for target_trait in target_dataset:
-        trait_name = target_trait.get("trait_id")
-        target_trait_data = target_trait["trait_sample_data"]
         this_vals, target_vals = filter_shared_sample_keys(
-            this_trait_samples, target_trait_data)
+            this_trait_samples, target_trait["trait_sample_data"])
 
         sample_correlation = compute_sample_r_correlation(
-            trait_name=trait_name,
+            trait_name=target_trait.get("trait_id"),
             corr_method=corr_method,
             trait_vals=this_vals,
             target_samples_vals=target_vals)
-        if sample_correlation is not None:
-            (trait_name, corr_coefficient,
-             p_value, num_overlap) = sample_correlation
-        else:
+        if sample_correlation is None:
             continue
-        corr_result = {
+        (trait_name, corr_coefficient,
+         p_value, num_overlap) = sample_correlation
+        corr_results.append({trait_name: {
             "corr_coefficient": corr_coefficient,
             "p_value": p_value,
             "num_overlap": num_overlap
-        }
-        corr_results.append({trait_name: corr_result})
-    return sorted(
-        corr_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["corr_coefficient"]))
+        }})
+    return sort_correlation_results(corr_results, "corr_coefficient", top_n)
 
 
 def tissue_correlation_for_trait(
@@ -323,26 +394,106 @@ def map_to_mouse_gene_id(conn, species: Optional[str],
     return mouse_gene_id
 
 
+def map_all_to_mouse_gene_ids(conn, species: Optional[str],
+                              gene_ids: List) -> Dict[str, str]:
+    """Bulk alternative to `map_to_mouse_gene_id`: map all the gene ids of a
+    species to their mouse gene ids in one query. Gene ids without a mouse
+    gene id are left out"""
+    gene_ids = list({str(gene_id) for gene_id in gene_ids
+                     if gene_id is not None})
+    if species is None or not gene_ids:
+        return {}
+    if species == "mouse":
+        return {gene_id: gene_id for gene_id in gene_ids}
+    if species not in GENE_ID_SPECIES:
+        return {}
+    # The species is a column of GeneIDXRef so it cannot be a parameter
+    query = (
+        f"SELECT {species}, mouse FROM GeneIDXRef "
+        f"WHERE {species} IN ({', '.join(['%s'] * len(gene_ids))})")
+    cursor = conn.cursor()
+    cursor.execute(query, gene_ids)
+    return {str(gene_id): str(mouse_gene_id)
+            for (gene_id, mouse_gene_id) in (cursor.fetchall() or [])
+            if mouse_gene_id is not None}
+
+
+def fetch_all_lit_correlation_data(
+        conn, input_mouse_gene_id: Optional[str],
+        mouse_gene_ids: List) -> Dict[str, float]:
+    """Bulk alternative to `fetch_lit_correlation_data`: fetch the lit
+    correlations of the input mouse gene id with all the mouse gene ids, in
+    both directions of LCorrRamin3, in one query. As in
+    `fetch_lit_correlation_data` a value stored with the mouse gene id as
+    GeneId1 is used before one stored with it as GeneId2"""
+    mouse_gene_ids = list({str(mouse_gene_id)
+                           for mouse_gene_id in mouse_gene_ids
+                           if ";" not in str(mouse_gene_id)})
+    if input_mouse_gene_id is None or not mouse_gene_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(mouse_gene_ids))
+    query = (
+        "SELECT GeneId1, GeneId2, value FROM LCorrRamin3 "
+        f"WHERE (GeneId2 = %s AND GeneId1 IN ({placeholders})) "
+        f"OR (GeneId1 = %s AND GeneId2 IN ({placeholders}))")
+    cursor = conn.cursor()
+    cursor.execute(query, (str(input_mouse_gene_id), *mouse_gene_ids,
+                           str(input_mouse_gene_id), *mouse_gene_ids))
+    (forward, reverse) = ({}, {})
+    for (gene_id1, gene_id2, value) in (cursor.fetchall() or []):
+        if str(gene_id2) == str(input_mouse_gene_id):
+            forward[str(gene_id1)] = value
+        if str(gene_id1) == str(input_mouse_gene_id):
+            reverse[str(gene_id2)] = value
+    return {**reverse, **forward}
+
+
+def bulk_lit_correlation_for_trait(
+        conn,
+        target_trait_lists: List,
+        species: Optional[str] = None,
+        trait_gene_id: Optional[str] = None,
+        fetch_lit_corrs: Optional[Callable] = None) -> List:
+    """Bulk alternative to `lit_correlation_for_trait` that gives the same
+    results in a constant number of queries: the gene ids of all the target
+    traits are mapped to mouse gene ids at once, and the lit correlations of
+    all of them with the trait are fetched at once, by FETCH_LIT_CORRS given
+    the mouse gene ids of the trait and the targets if it is given (see
+    `gn3.computations.lit_matrix`)"""
+    mouse_gene_ids = map_all_to_mouse_gene_ids(
+        conn, species, [trait_gene_id, *[
+            gene_id for (_trait_name, gene_id) in target_trait_lists]])
+    if fetch_lit_corrs is None:
+        fetch_lit_corrs = partial(fetch_all_lit_correlation_data, conn)
+    lit_corrs = fetch_lit_corrs(mouse_gene_ids.get(str(trait_gene_id)),
+                                list(mouse_gene_ids.values()))
+    return [
+        {trait_name: {"gene_id": gene_id,
+                      "lit_corr": lit_corrs.get(
+                          mouse_gene_ids.get(str(gene_id), ""), 0)}}
+        for (trait_name, gene_id) in target_trait_lists if gene_id]
+
+
 def compute_all_lit_correlation(conn, trait_lists: List,
-                                species: str, gene_id):
+                                species: str, gene_id,
+                                top_n: Optional[int] = None,
+                                fetch_lit_corrs: Optional[Callable] = None):
     """Function that acts as an abstraction for
-    lit_correlation_for_trait"""
-
-    lit_results = lit_correlation_for_trait(
+    bulk_lit_correlation_for_trait"""
+    # pylint: disable=[R0913]
+    lit_results = bulk_lit_correlation_for_trait(
         conn=conn,
         target_trait_lists=trait_lists,
         species=species,
-        trait_gene_id=gene_id)
-    sorted_lit_results = sorted(
-        lit_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["lit_corr"]))
-
-    return sorted_lit_results
+        trait_gene_id=gene_id,
+        fetch_lit_corrs=fetch_lit_corrs)
+    return sort_correlation_results(lit_results, "lit_corr", top_n)
 
 
 def compute_tissue_correlation(primary_tissue_dict: dict,
                                target_tissues_data: dict,
-                               corr_method: str):
+                               corr_method: str,
+                               top_n: Optional[int] = None):
     """Function acts as an abstraction for tissue_correlation_for_trait\
     required input are target tissue object and primary tissue trait\
     target tissues data contains the trait_symbol_dict and symbol_tissue_vals
@@ -363,9 +514,7 @@ def compute_tissue_correlation(primary_tissue_dict: dict,
             trait_id=trait_id,
             corr_method=corr_method)
         tissues_results.append(tissue_result)
-    return sorted(
-        tissues_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["tissue_corr"]))
+    return sort_correlation_results(tissues_results, "tissue_corr", top_n)
 
 
 def process_trait_symbol_dict(trait_symbol_dict, symbol_tissue_vals_dict) -> List:
@@ -387,11 +536,13 @@ def process_trait_symbol_dict(trait_symbol_dict, symbol_tissue_vals_dict) -> Lis
 
 def fast_compute_tissue_correlation(primary_tissue_dict: dict,
                                     target_tissues_data: dict,
-                                    corr_method: str):
+                                    corr_method: str,
+                                    top_n: Optional[int] = None):
     """Experimental function that uses multiprocessing for computing tissue
     correlation
 
     """
+    # pylint: disable-msg=too-many-locals
     tissues_results = []
     primary_tissue_vals = primary_tissue_dict["tissue_values"]
     traits_symbol_dict = target_tissues_data["trait_symbol_dict"]
@@ -399,20 +550,23 @@ def fast_compute_tissue_correlation(primary_tissue_dict: dict,
     target_tissues_list = process_trait_symbol_dict(
         traits_symbol_dict, symbol_tissue_vals_dict)
     processed_values = []
+    trait_ids = []
 
     for target_tissue_obj in target_tissues_list:
-        trait_id = target_tissue_obj.get("trait_id")
+        trait_ids.append(target_tissue_obj.get("trait_id"))
 
         target_tissue_vals = target_tissue_obj.get("tissue_values")
         processed_values.append(
-            (primary_tissue_vals, target_tissue_vals, corr_method, trait_id))
-
-    with multiprocessing.Pool(4) as pool:
-        results = pool.starmap(
-            tissue_correlation_for_trait, processed_values)
-        for result in results:
-            tissues_results.append(result)
-
-    return sorted(
-        tissues_results,
-        key=lambda trait_name: -abs(list(trait_name.values())[0]["tissue_corr"]))
+            (primary_tissue_vals, target_tissue_vals, corr_method))
+
+    corr_coefficients = pool_starmap(compute_corr_coefficient, processed_values)
+    p_values = compute_corr_p_values(
+        corr_coefficients, [len(primary_tissue_vals)] * len(corr_coefficients))
+    for (trait_id, tissue_corr_coefficient, p_value) in zip(
+            trait_ids, corr_coefficients, p_values.tolist()):
+        tissues_results.append({trait_id: {
+            "tissue_corr": tissue_corr_coefficient,
+            "tissue_number": len(primary_tissue_vals),
+            "tissue_p_val": p_value}})
+
+    return sort_correlation_results(tissues_results, "tissue_corr", top_n)
@@ -0,0 +1,344 @@
+"""module contains the dataset matrix: the values of all the traits of a
+ProbeSet, Publish or Geno dataset loaded on the server as one (strains x
+traits) float matrix, so that correlations against a whole dataset do not need
+the dataset in the request. The dataset's rows are streamed from the database
+straight into the matrix, so loading it takes little more memory than the
+matrix itself.
+
+Matrices are cached on disk, one directory per dataset generation (see
+`gn3.db.generations`) holding three `.npy` files: the matrix and the trait and
+strain names indexing its columns and rows. The correlation indexes of the
+matrix (see `CORRELATION_INDEXES`) and its approximate search index are added
+to the directory the first time they are used. Every worker opens the matrix
+with mmap so reading it does not copy it nor touch the database."""
+import os
+import shutil
+import tempfile
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+from werkzeug.utils import secure_filename
+
+from gn3.computations.columnar_data import align_sample_matrix
+from gn3.computations.incremental_correlations import compute_pearson_sums
+from gn3.computations.incremental_correlations import pearson_from_sums
+from gn3.computations.incremental_correlations import update_pearson_sums
+from gn3.computations.pearson_index import build_pearson_index
+from gn3.computations.pearson_index import compute_indexed_pearson
+from gn3.computations.pearson_index import strain_values
+from gn3.computations.rank_index import build_rank_index
+from gn3.computations.rank_index import compute_indexed_spearman
+from gn3.computations.result_cache import CorrelationArrays
+from gn3.computations.result_cache import cached_correlation_arrays
+from gn3.computations.result_cache import correlation_cache_key
+from gn3.computations.search_index import NUM_PROBES
+from gn3.computations.search_index import SearchIndex
+from gn3.computations.search_index import build_search_index
+from gn3.computations.search_index import compute_approximate_correlation
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+from gn3.computations.vectorized_correlations import format_correlation_results
+from gn3.db.datasets import retrieve_dataset_data_chunks
+from gn3.db.datasets import retrieve_dataset_trait_names
+from gn3.settings import DATASET_MATRIX_DTYPE
+
+DATASET_TYPES = ("ProbeSet", "Publish", "Geno")
+
+# The indexes of a dataset matrix by correlation method: the cache directory
+# of the index, the names of its arrays, the function building them from the
+# matrix and the function correlating against the matrix with them, which
+# returns None when the index does not apply to the primary trait
+CORRELATION_INDEXES: Dict[str, Tuple[str, Tuple[str, ...], Callable,
+                                     Callable]] = {
+    "pearson": ("pearson_index", ("means", "sum_squares"),
+                build_pearson_index, compute_indexed_pearson),
+    "spearman": ("rank_index", ("ranks", "num_missing", "sum_squares"),
+                 build_rank_index, compute_indexed_spearman)
+}
+
+
+def fill_dataset_matrix(
+        chunks: Iterable[Sequence[Tuple[Any, str, Optional[float]]]],
+        trait_names: Sequence, strain_names: Optional[Sequence[str]] = None,
+        dtype: str = "float64") -> Tuple[List, List, np.ndarray]:
+    """Given chunks of (trait name, strain name, value) rows of the traits
+    TRAIT_NAMES return the trait names, the strain names and the (strains x
+    traits) matrix of the values, with NaN for missing values. The values of
+    each chunk are written straight into a matrix allocated up front, so no
+    more than one chunk of rows is held besides the matrix. The traits are in
+    the order of TRAIT_NAMES, those without rows left out, and the strains in
+    the order of STRAIN_NAMES, the rows of other strains left out; without
+    STRAIN_NAMES the strains are in the order they first appear"""
+    # pylint: disable=[R0914]
+    trait_index = {name: idx for (idx, name) in reversed(
+        list(enumerate(trait_names)))}
+    strain_index: Dict[str, int] = (
+        {} if strain_names is None else
+        {name: idx for (idx, name) in reversed(list(enumerate(strain_names)))})
+    matrix = np.full((len(strain_index) if strain_names is not None else 64,
+                      len(trait_names)), np.nan, dtype=dtype)
+    has_rows = np.zeros(len(trait_names), dtype=bool)
+    for chunk in chunks:
+        trait_ids = np.fromiter((trait_index.get(row[0], -1) for row in chunk),
+                                dtype=np.intp, count=len(chunk))
+        strain_ids = np.fromiter(
+            (strain_index.get(row[1], -1) if strain_names is not None else
+             strain_index.setdefault(row[1], len(strain_index))
+             for row in chunk), dtype=np.intp, count=len(chunk))
+        values = np.fromiter(
+            (np.nan if row[2] is None else row[2] for row in chunk),
+            dtype=float, count=len(chunk))
+        if len(strain_index) > len(matrix):
+            # The strains are few, so the matrix rarely grows
+            grown = np.full((2 * len(strain_index), len(trait_names)), np.nan,
+                            dtype=dtype)
+            grown[:len(matrix)] = matrix
+            matrix = grown
+        known = (trait_ids >= 0) & (strain_ids >= 0)
+        matrix[strain_ids[known], trait_ids[known]] = values[known]
+        has_rows[trait_ids[known]] = True
+    # Drop the rows allocated for strains that never came, in place
+    matrix.resize((len(strain_index), len(trait_names)), refcheck=False)
+    if not has_rows.all():
+        matrix = matrix[:, has_rows]
+    return ([name for (name, kept) in zip(trait_names, has_rows) if kept],
+            list(strain_index if strain_names is None else strain_names),
+            matrix)
+
+
+def fetch_dataset_matrix(conn: Any, dataset_type: str, dataset_name: str,
+                         dtype: str = "float64",
+                         strain_names: Optional[Sequence[str]] = None
+                         ) -> Tuple[List, List, np.ndarray]:
+    """Load the trait names, strain names and (strains x traits) matrix of a
+    `ProbeSet`, `Publish` or `Geno` dataset from the database, of the
+    STRAIN_NAMES only if given, streaming the dataset's rows into the
+    matrix (see `fill_dataset_matrix`)"""
+    return fill_dataset_matrix(
+        retrieve_dataset_data_chunks(
+            dataset_type, dataset_name, conn, strain_names),
+        retrieve_dataset_trait_names(dataset_type, dataset_name, conn),
+        strain_names, dtype)
+
+
+def dataset_matrix_cache_path(cache_dir: str, dataset_type: str,
+                              dataset_name: str, generation: int = 0) -> str:
+    """Return the cache directory of a generation of a dataset's matrix"""
+    return os.path.join(cache_dir, dataset_type, secure_filename(dataset_name),
+                        str(generation))
+
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """Write ARRAYS as `.npy` files to the directory PATH. The files are written
+    to a temporary directory that is then renamed, so readers never see a
+    partial directory; if another process wrote PATH first its copy is kept"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+    try:
+        for (name, array) in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        os.rename(tmp_path, path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def save_dataset_matrix(path: str,
+                        dataset_matrix: Tuple[List, List, np.ndarray]) -> None:
+    """Write a dataset matrix to the cache directory PATH atomically"""
+    (trait_names, strain_names, matrix) = dataset_matrix
+    save_arrays(path, {"matrix": matrix,
+                         "trait_names": np.array(trait_names),
+                         "strain_names": np.array(strain_names, dtype=str)})
+
+
+def open_dataset_matrix(path: str) -> Tuple[List, List, np.ndarray]:
+    """Open a cached dataset matrix, the matrix itself read only with mmap"""
+    return (
+        np.load(os.path.join(path, "trait_names.npy")).tolist(),
+        np.load(os.path.join(path, "strain_names.npy")).tolist(),
+        np.load(os.path.join(path, "matrix.npy"), mmap_mode="r"))
+
+
+def load_dataset_matrix(conn: Any, dataset_type: str, dataset_name: str,
+                        generation: int, cache_dir: Optional[str] = None,
+                        dtype: str = DATASET_MATRIX_DTYPE) -> Tuple[
+                            List, List, np.ndarray]:
+    """Return a dataset's matrix from the cache in CACHE_DIR, building the
+    cache entry from the database the first time the GENERATION of the dataset
+    is used; the entries of older generations are removed. Without a CACHE_DIR
+    the matrix is fetched from the database"""
+    # pylint: disable=[R0913]
+    if not cache_dir:
+        return fetch_dataset_matrix(conn, dataset_type, dataset_name, dtype)
+    path = dataset_matrix_cache_path(
+        cache_dir, dataset_type, dataset_name, generation)
+    if not os.path.isdir(path):
+        save_dataset_matrix(path, fetch_dataset_matrix(
+            conn, dataset_type, dataset_name, dtype))
+        for entry in os.scandir(os.path.dirname(path)):
+            if entry.is_dir() and entry.name.isdigit() and (
+                    entry.path != path):
+                # Workers that have an old matrix open keep their mapping
+                shutil.rmtree(entry.path, ignore_errors=True)
+    return open_dataset_matrix(path)
+
+
+def __load_index(path: str, names: Tuple[str, ...],
+                 build: Callable[[], Tuple]) -> Tuple:
+    """Open the index arrays NAMES saved in the directory PATH with mmap,
+    saving the arrays returned by BUILD there first if it does not exist"""
+    if not os.path.isdir(path):
+        save_arrays(path, dict(zip(names, build())))
+    return tuple(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                 for name in names)
+
+
+def load_correlation_index(cache_dir: Optional[str], dataset_type: str,
+                           dataset_name: str, generation: int,
+                           corr_method: str,
+                           matrix: np.ndarray) -> Optional[Tuple]:
+    """Return the index of a cached dataset matrix for CORR_METHOD, building
+    it the first time it is used, or None when the method has no index. There
+    is no index without a CACHE_DIR: building it for one correlation costs as
+    much as the correlation"""
+    # pylint: disable=[R0913]
+    if not cache_dir or corr_method not in CORRELATION_INDEXES:
+        return None
+    (dirname, names, build, _compute) = CORRELATION_INDEXES[corr_method]
+    return __load_index(os.path.join(dataset_matrix_cache_path(
+        cache_dir, dataset_type, dataset_name, generation), dirname),
+                        names, lambda: build(matrix))
+
+
+def load_search_index(cache_dir: Optional[str], dataset_type: str,
+                      dataset_name: str, generation: int,
+                      matrix: np.ndarray) -> Optional[SearchIndex]:
+    """Return the approximate search index of a cached dataset matrix (see
+    `gn3.computations.search_index`), building it the first time it is used,
+    or None without a CACHE_DIR"""
+    # pylint: disable=[R0913]
+    if not cache_dir:
+        return None
+    return __load_index(os.path.join(dataset_matrix_cache_path(
+        cache_dir, dataset_type, dataset_name, generation), "search_index"),
+                        ("centroids", "order", "offsets"),
+                        lambda: build_search_index(matrix))
+
+
+def __primary_values(this_trait_samples: dict) -> np.ndarray:
+    """Return the primary trait's values, NaN for missing or falsy ones"""
+    return np.array([value if value else None
+                     for value in this_trait_samples.values()], dtype=float)
+
+
+def compute_dataset_correlation(
+        this_trait_samples: dict,
+        dataset_matrix: Tuple[List, List, np.ndarray],
+        corr_method: str = "pearson",
+        top_n: Optional[int] = None,
+        dataset_key: Optional[Tuple[str, str, int]] = None,
+        correlation_index: Optional[Tuple] = None) -> List:
+    """Correlate the primary trait's sample data against every trait of a
+    dataset matrix returning the results in the form given by
+    `compute_all_sample_correlation`. With a DATASET_KEY, the dataset's type,
+    name and generation, the correlations are cached in the result cache.
+    The matrix' CORRELATION_INDEX for the method is used when it is given"""
+    # pylint: disable=[R0913, R0914]
+    (trait_names, strain_names, matrix) = dataset_matrix
+    if not trait_names:
+        return []
+    samples = list(this_trait_samples.keys())
+    primary_vals = __primary_values(this_trait_samples)
+
+    def compute() -> CorrelationArrays:
+        if correlation_index is not None:
+            arrays = CORRELATION_INDEXES[corr_method][3](
+                strain_values(samples, primary_vals, strain_names), matrix,
+                correlation_index)
+            if arrays is not None:
+                return arrays
+        return compute_correlation_arrays(
+            *align_sample_matrix(samples, primary_vals, strain_names,
+                                 matrix.T),
+            corr_method)
+
+    if dataset_key is None:
+        arrays = compute()
+    else:
+        arrays = cached_correlation_arrays(
+            correlation_cache_key(*dataset_key, corr_method, samples,
+                                  primary_vals),
+            compute)
+    (corr, p_values, num_overlap) = arrays
+    return format_correlation_results(
+        trait_names, corr, p_values, num_overlap, top_n=top_n)
+
+
+def refresh_dataset_correlation(
+        this_trait_samples: dict, changes: dict,
+        dataset_matrix: Tuple[List, List, np.ndarray],
+        dataset_key: Tuple[str, str, int],
+        top_n: Optional[int] = None) -> List:
+    """Pearson correlate the primary trait's sample data with CHANGES, a dict
+    of samples to their new values, applied against every trait of a dataset
+    matrix. The sufficient statistics of the correlation of the sample data
+    before and after the changes are kept in the result cache, so when a
+    curator edits a few values the correlations are updated from the edited
+    strains only (see `gn3.computations.incremental_correlations`)"""
+    (trait_names, strain_names, matrix) = dataset_matrix
+    if not trait_names:
+        return []
+    changed_samples = {**this_trait_samples, **changes}
+    (old_vals, new_vals) = (
+        strain_values(list(samples), __primary_values(samples), strain_names)
+        for samples in (this_trait_samples, changed_samples))
+    old_sums = cached_correlation_arrays(
+        correlation_cache_key(*dataset_key, "pearson_sums",
+                              list(this_trait_samples),
+                              __primary_values(this_trait_samples)),
+        lambda: compute_pearson_sums(old_vals, matrix))
+    changed_rows = np.flatnonzero(
+        (old_vals != new_vals) & ~(np.isnan(old_vals) & np.isnan(new_vals)))
+    new_sums = cached_correlation_arrays(
+        correlation_cache_key(*dataset_key, "pearson_sums",
+                              list(changed_samples),
+                              __primary_values(changed_samples)),
+        lambda: update_pearson_sums(
+            old_sums, matrix,
+            [(int(row), old_vals[row], new_vals[row])
+             for row in changed_rows]))
+    return format_correlation_results(
+        trait_names, *pearson_from_sums(new_sums), top_n=top_n)
+
+
+def search_dataset_correlation(
+        this_trait_samples: dict,
+        dataset_matrix: Tuple[List, List, np.ndarray],
+        search_index: SearchIndex, top_n: int,
+        num_probes: int = NUM_PROBES) -> List:
+    """Find the TOP_N traits of a dataset matrix most pearson correlated with
+    the primary trait's sample data with the matrix' approximate SEARCH_INDEX,
+    returning the results in the form given by
+    `compute_all_sample_correlation`. The correlations are exact but a trait
+    in a cluster that is not probed can be missed"""
+    (trait_names, strain_names, matrix) = dataset_matrix
+    if not trait_names:
+        return []
+    (candidates, corr, p_values, num_overlap) = (
+        compute_approximate_correlation(
+            strain_values(list(this_trait_samples),
+                          __primary_values(this_trait_samples), strain_names),
+            matrix, search_index, top_n, num_probes))
+    return format_correlation_results(
+        [trait_names[idx] for idx in candidates.tolist()],
+        corr, p_values, num_overlap, top_n=top_n)
@@ -3,15 +3,18 @@ This module will contain functions to be used in computation of the data used to
 generate various kinds of heatmaps.
 """
 
-from functools import reduce
-from typing import Any, Dict, Sequence
+from typing import Any, Dict, Sequence, Union
+
+import numpy as np
+
 from gn3.computations.slink import slink
-from gn3.db.traits import retrieve_trait_data, retrieve_trait_info
+from gn3.db.traits import (
+    TraitData, retrieve_columnar_trait_data, retrieve_traits_info)
 from gn3.computations.correlations2 import compute_correlation
 
 def export_trait_data(
-        trait_data: dict, strainlist: Sequence[str], dtype: str = "val",
-        var_exists: bool = False, n_exists: bool = False):
+        trait_data: Union[dict, TraitData], strainlist: Sequence[str],
+        dtype: str = "val", var_exists: bool = False, n_exists: bool = False):
     """
     Export data according to `strainlist`. Mostly used in calculating
     correlations.
@@ -21,8 +24,8 @@ def export_trait_data(
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L166-L211
 
     PARAMETERS
-    trait: (dict)
-      The dictionary of key-value pairs representing a trait
+    trait: (TraitData or dict)
+      The trait's data, or the dictionary of key-value pairs representing it
     strainlist: (list)
       A list of strain names
     type: (str)
@@ -32,49 +35,39 @@ def export_trait_data(
     n_exists: (bool)
       A flag indicating existence of ndata
     """
-    def __export_all_types(tdata, strain):
-        sample_data = []
-        if tdata[strain]["value"]:
-            sample_data.append(tdata[strain]["value"])
-            if var_exists:
-                if tdata[strain]["variance"]:
-                    sample_data.append(tdata[strain]["variance"])
-                else:
-                    sample_data.append(None)
-            if n_exists:
-                if tdata[strain]["ndata"]:
-                    sample_data.append(tdata[strain]["ndata"])
-                else:
-                    sample_data.append(None)
-        else:
-            if var_exists and n_exists:
-                sample_data += [None, None, None]
-            elif var_exists or n_exists:
-                sample_data += [None, None]
-            else:
-                sample_data.append(None)
-
-        return tuple(sample_data)
-
-    def __exporter(accumulator, strain):
-        # pylint: disable=[R0911]
-        if strain in trait_data["data"]:
-            if dtype == "val":
-                return accumulator + (trait_data["data"][strain]["value"], )
-            if dtype == "var":
-                return accumulator + (trait_data["data"][strain]["variance"], )
-            if dtype == "N":
-                return accumulator + (trait_data["data"][strain]["ndata"], )
-            if dtype == "all":
-                return accumulator + __export_all_types(trait_data["data"], strain)
-            raise KeyError("Type `%s` is incorrect" % dtype)
-        if var_exists and n_exists:
-            return accumulator + (None, None, None)
-        if var_exists or n_exists:
-            return accumulator + (None, None)
-        return accumulator + (None,)
-
-    return reduce(__exporter, strainlist, tuple())
+    # pylint: disable=[R0914]
+    if not isinstance(trait_data, TraitData):
+        trait_data = TraitData.from_dict(trait_data)
+    (present, values, variances, ndata) = trait_data.align(strainlist)
+    # Each strain takes a row of `width` items, None unless set; the strains
+    # the trait has data for take only the first item of their row unless
+    # `dtype` is "all"
+    width = 1 + var_exists + n_exists
+    exported = np.full((len(strainlist), width), None, dtype=object)
+    keep = np.ones((len(strainlist), width), dtype=bool)
+
+    def __set(column, rows, array, integer=False):
+        exported[rows, column] = (
+            array[rows].astype(int) if integer else array[rows]).tolist()
+
+    if dtype == "all":
+        # Falsy values, variances and ndata are exported as None
+        rows = present & (values != 0) & ~np.isnan(values)
+        __set(0, rows, values)
+        column = 1
+        for (exists, array, integer) in [
+                (var_exists, variances, False), (n_exists, ndata, True)]:
+            if exists:
+                __set(column, rows & (array != 0) & ~np.isnan(array), array,
+                      integer)
+                column += 1
+    elif dtype in ("val", "var", "N"):
+        array = {"val": values, "var": variances, "N": ndata}[dtype]
+        __set(0, present & ~np.isnan(array), array, dtype == "N")
+        keep[present, 1:] = False
+    elif present.any():
+        raise KeyError(f"Type `{dtype}` is incorrect")
+    return tuple(exported[keep])
 
 def trait_display_name(trait: Dict):
     """
@@ -147,15 +140,13 @@ def heatmap_data(formd, search_result, conn: Any):
         strain for strain in formd.strainlist if strain not in formd.parlist]
     genotype = formd.genotype
 
-    def __retrieve_traitlist_and_datalist(threshold, fullname):
-        trait = retrieve_trait_info(threshold, fullname, conn)
-        return (
-            trait,
-            export_trait_data(retrieve_trait_data(trait, conn), strainlist))
-
     traits_details = [
-        __retrieve_traitlist_and_datalist(threshold, fullname)
-        for fullname in search_result]
+        (trait,
+         export_trait_data(
+             retrieve_columnar_trait_data(trait, conn)
+             or TraitData.from_rows([]),
+             strainlist))
+        for trait in retrieve_traits_info(threshold, search_result, conn)]
     traits_list = map(lambda x: x[0], traits_details)
     traits_data_list = map(lambda x: x[1], traits_details)
 
@@ -0,0 +1,96 @@
+"""module contains incremental pearson correlations against a dataset matrix.
+A run keeps the sufficient statistics of the correlation of the primary trait
+with every trait of the matrix: the number of shared samples and the sums of
+x, x^2, y, y^2 and xy over them. When a curator edits a few of the primary
+trait's values the statistics are updated from the matrix' rows of the edited
+strains only, in O(changes x traits), instead of correlating again over all
+the samples.
+
+The values are summed less a shift, the primary trait's mean for x and each
+trait's mean for y, so the sums do not lose precision to cancellation"""
+from typing import Iterable
+from typing import Tuple
+
+import numpy as np
+
+from gn3.computations.pvalues import compute_corr_p_values
+
+# (num_overlap, sum_x, sum_xx, sum_y, sum_yy, sum_xy, x_shift, y_shift)
+PearsonSums = Tuple[np.ndarray, ...]
+
+# Number of traits read from the (possibly float32, memory-mapped) matrix and
+# converted to float64 at a time
+CHUNK_SIZE = 65536
+
+
+def compute_pearson_sums(primary_vals: np.ndarray, matrix: np.ndarray,
+                         chunk_size: int = CHUNK_SIZE) -> PearsonSums:
+    """Compute the sufficient statistics of the pearson correlation of the
+    primary values, in the order of the strains of a (strains x traits)
+    MATRIX with NaN for missing values, with every trait of the matrix"""
+    # pylint: disable=[R0914]
+    shared = ~np.isnan(primary_vals)
+    x_shift = np.array(primary_vals[shared].mean() if shared.any() else 0.0)
+    x_vals = np.where(shared, primary_vals - x_shift, 0.0)
+    num_traits = matrix.shape[1]
+    sums = tuple(np.zeros(num_traits) for _ in range(6))
+    y_shift = np.zeros(num_traits)
+    for start in range(0, num_traits, chunk_size):
+        columns = slice(start, start + chunk_size)
+        block = np.asarray(matrix[:, columns], dtype=float)
+        mask = shared[:, None] & ~np.isnan(block)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            y_shift[columns] = np.nan_to_num(
+                np.where(mask, block, 0.0).sum(axis=0) / mask.sum(axis=0))
+        y_vals = np.where(mask, block - y_shift[columns], 0.0)
+        for (total, block_sum) in zip(sums, (
+                mask.sum(axis=0), x_vals @ mask, (x_vals ** 2) @ mask,
+                y_vals.sum(axis=0), (y_vals ** 2).sum(axis=0),
+                x_vals @ y_vals)):
+            total[columns] = block_sum
+    return sums + (x_shift, y_shift)
+
+
+def update_pearson_sums(
+        pearson_sums: PearsonSums, matrix: np.ndarray,
+        changes: Iterable[Tuple[int, float, float]]) -> PearsonSums:
+    """Update the sufficient statistics for CHANGES to the primary values,
+    (strain row, old value, new value) tuples with NaN for missing values,
+    reading only the changed rows of MATRIX. The statistics given are not
+    modified"""
+    # pylint: disable=[R0914]
+    (*sums, x_shift, y_shift) = (np.array(array) for array in pearson_sums)
+    for (row, old_value, new_value) in changes:
+        y_row = np.asarray(matrix[row], dtype=float) - y_shift
+        present = ~np.isnan(y_row)
+        y_row = np.where(present, y_row, 0.0)
+        for (sign, value) in ((-1, old_value), (1, new_value)):
+            if np.isnan(value):
+                continue
+            x_val = value - x_shift
+            for (total, change) in zip(sums, (
+                    present, x_val * present, x_val ** 2 * present,
+                    y_row, y_row ** 2, x_val * y_row)):
+                total += sign * change
+    return tuple(sums) + (x_shift, y_shift)
+
+
+def pearson_from_sums(pearson_sums: PearsonSums) -> Tuple[np.ndarray,
+                                                          np.ndarray,
+                                                          np.ndarray]:
+    """Return the arrays of `compute_correlation_arrays` for the pearson
+    correlation given its sufficient statistics"""
+    (num_overlap, sum_x, sum_xx, sum_y, sum_yy, sum_xy, *_shifts) = (
+        pearson_sums)
+    num_overlap = np.rint(num_overlap).astype(int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = sum_xy - sum_x * sum_y / num_overlap
+        x_variance = sum_xx - sum_x ** 2 / num_overlap
+        y_variance = sum_yy - sum_y ** 2 / num_overlap
+        corr = covariance / np.sqrt(x_variance * y_variance)
+    # Values constant over the shared samples give NaN, as in
+    # `scipy.stats.pearsonr`, even when rounding leaves a tiny variance
+    corr[(x_variance <= 1e-12 * sum_xx) | (y_variance <= 1e-12 * sum_yy)] = (
+        np.nan)
+    corr = np.clip(corr, -1.0, 1.0)
+    return (corr, compute_corr_p_values(corr, num_overlap), num_overlap)
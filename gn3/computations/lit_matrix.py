@@ -0,0 +1,252 @@
+"""module contains the literature correlation matrix: the static LCorrRamin3
+table held as a compressed sparse row (CSR) gene x gene matrix, so that lit
+correlations are looked up without the database.
+
+The matrix is symmetric: the row of a gene holds its correlations with every
+gene it is stored with in either column of the table, a value stored with the
+gene as GeneId2 used before one stored with it as GeneId1 as
+`gn3.computations.correlations.fetch_lit_correlation_data` does. Each row is
+sorted by absolute value in descending order, so all the lit correlations of a
+gene, sorted, are one slice.
+
+The matrix is cached on disk in a directory named after the checksum of the
+table, holding four `.npy` files: the sorted gene ids, the row pointers, the
+column indices and the values, and a `current` file names the directory in
+use. It is built off the request path, by `build_lit_matrix_cache` run in the
+background when a worker starts: a file lock lets one process build it, and
+the checksum of the table is only computed if no worker has checked it in the
+last LIT_MATRIX_CHECK_INTERVAL seconds. The table is not checked again while a
+worker runs, so a changed table is picked up by the next workers started.
+Requests only open the current matrix with mmap, and use the database until
+there is one."""
+import fcntl
+import os
+import shutil
+import threading
+import time
+
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from gn3.computations.dataset_matrix import save_arrays
+from gn3.db.lit_correlations import retrieve_lit_correlation_checksum
+from gn3.db.lit_correlations import retrieve_lit_correlation_chunks
+from gn3.db.lit_correlations import retrieve_lit_correlation_count
+from gn3.db_utils import database_connector
+from gn3.settings import LIT_MATRIX_CHECK_INTERVAL
+
+# (sorted gene ids, row pointers, column indices, values)
+LitMatrix = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+LIT_MATRIX_ARRAYS = ("gene_ids", "indptr", "indices", "values")
+
+__matrix_state: Dict[str, Any] = {
+    "path": None,
+    "lit_matrix": None,
+    # modification time of the `current` file the matrix was opened from
+    "current_mtime": None,
+    "lock": threading.Lock()
+}
+
+
+def build_lit_matrix(chunks: Iterable[Sequence[Tuple[int, int, float]]],
+                     num_rows: int = 0) -> LitMatrix:
+    """Build the lit correlation matrix of chunks of (GeneId1, GeneId2, value)
+    rows. The rows are written into arrays of NUM_ROWS rows allocated up
+    front, grown should more rows come, and the gene ids are replaced by
+    their int32 positions once known, so the table is held once besides the
+    matrix being built"""
+    # pylint: disable=[R0914]
+    (gene_ids1, gene_ids2, values) = (
+        np.empty(num_rows, dtype="int64"), np.empty(num_rows, dtype="int64"),
+        np.empty(num_rows, dtype="float32"))
+    filled = 0
+    for chunk in chunks:
+        if filled + len(chunk) > len(values):
+            for array in (gene_ids1, gene_ids2, values):
+                array.resize(max(2 * len(array), filled + len(chunk)),
+                             refcheck=False)
+        for (column, array) in enumerate((gene_ids1, gene_ids2, values)):
+            array[filled:filled + len(chunk)] = np.fromiter(
+                (row[column] for row in chunk), dtype=array.dtype,
+                count=len(chunk))
+        filled += len(chunk)
+    for array in (gene_ids1, gene_ids2, values):
+        array.resize(filled, refcheck=False)
+    gene_ids = np.union1d(gene_ids1, gene_ids2)
+    (gene_ids1, gene_ids2) = (
+        np.searchsorted(gene_ids, gene_ids1).astype("int32"),
+        np.searchsorted(gene_ids, gene_ids2).astype("int32"))
+    # Each row of the table in both directions, the GeneId2 direction first,
+    # keyed by (row, column): a stable sort keeps the GeneId2 direction
+    # first among the entries of a pair
+    (row_ids, column_ids) = (np.concatenate((gene_ids2, gene_ids1)),
+                             np.concatenate((gene_ids1, gene_ids2)))
+    del gene_ids1, gene_ids2
+    keys = row_ids.astype("int64") * len(gene_ids) + column_ids
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    del keys
+    order = order[first]
+    (row_ids, column_ids) = (row_ids[order], column_ids[order])
+    # Both directions of a table row have its value
+    values = values[order % max(filled, 1)]
+    del order
+    order = np.lexsort((-np.abs(values), row_ids))
+    return (gene_ids,
+            np.concatenate(([0], np.cumsum(np.bincount(
+                row_ids, minlength=len(gene_ids))))).astype("int64"),
+            column_ids[order],
+            values[order])
+
+
+def fetch_lit_matrix(conn: Any) -> LitMatrix:
+    """Build the lit correlation matrix from the LCorrRamin3 table, streaming
+    its rows into arrays sized to its row count"""
+    num_rows = retrieve_lit_correlation_count(conn)
+    return build_lit_matrix(retrieve_lit_correlation_chunks(conn), num_rows)
+
+
+def open_lit_matrix(path: str) -> LitMatrix:
+    """Open a cached lit correlation matrix read only with mmap"""
+    return tuple(  # type: ignore[return-value]
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in LIT_MATRIX_ARRAYS)
+
+
+def build_lit_matrix_cache(
+        conn: Any, cache_dir: str,
+        check_interval: float = LIT_MATRIX_CHECK_INTERVAL) -> Optional[str]:
+    """Build the lit correlation matrix of the current LCorrRamin3 table in
+    CACHE_DIR if it is not there, make it the current one and remove the
+    older ones. Does nothing, returning None, when another process is building
+    it or the table was checked less than CHECK_INTERVAL seconds ago; returns
+    the directory of the current matrix otherwise, None without a table"""
+    lit_dir = os.path.join(cache_dir, "lit_matrix")
+    os.makedirs(lit_dir, exist_ok=True)
+    current = os.path.join(lit_dir, "current")
+    with open(os.path.join(lit_dir, "lock"), "w",
+              encoding="utf-8") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        if os.path.exists(current) and (
+                time.time() - os.path.getmtime(current) < check_interval):
+            return None
+        checksum = retrieve_lit_correlation_checksum(conn)
+        if checksum is None:
+            return None
+        path = os.path.join(lit_dir, str(checksum))
+        if not os.path.isdir(path):
+            save_arrays(path, dict(zip(LIT_MATRIX_ARRAYS,
+                                       fetch_lit_matrix(conn))))
+        with open(f"{current}.tmp", "w", encoding="utf-8") as current_file:
+            current_file.write(str(checksum))
+        # Replacing the file also marks when the table was checked
+        os.replace(f"{current}.tmp", current)
+        for entry in os.scandir(lit_dir):
+            if entry.is_dir() and entry.path != path and (
+                    entry.name.isdigit()):
+                # Workers that have an old matrix open keep their mapping
+                shutil.rmtree(entry.path, ignore_errors=True)
+        return path
+
+
+def start_lit_matrix_build(
+        cache_dir: str,
+        check_interval: float = LIT_MATRIX_CHECK_INTERVAL
+) -> threading.Thread:
+    """Run `build_lit_matrix_cache` in a background thread with its own
+    database connection"""
+    def build():
+        conn, _cursor = database_connector()
+        try:
+            build_lit_matrix_cache(conn, cache_dir, check_interval)
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=build, name="lit-matrix-build",
+                              daemon=True)
+    thread.start()
+    return thread
+
+
+def load_lit_matrix(cache_dir: Optional[str]) -> Optional[LitMatrix]:
+    """Return the current lit correlation matrix cached in CACHE_DIR, opening
+    it again when `build_lit_matrix_cache` has made another one current.
+    Returns None without a CACHE_DIR or a matrix built there"""
+    if not cache_dir:
+        return None
+    current = os.path.join(cache_dir, "lit_matrix", "current")
+    try:
+        mtime = os.path.getmtime(current)
+    except OSError:
+        return None
+    with __matrix_state["lock"]:
+        if (__matrix_state["lit_matrix"] is not None and
+                os.path.dirname(__matrix_state["path"]) == os.path.dirname(
+                    current) and __matrix_state["current_mtime"] == mtime):
+            return __matrix_state["lit_matrix"]
+    try:
+        with open(current, encoding="utf-8") as current_file:
+            path = os.path.join(os.path.dirname(current),
+                                current_file.read().strip())
+        lit_matrix = open_lit_matrix(path)
+    except OSError:
+        return None
+    with __matrix_state["lock"]:
+        if __matrix_state["path"] != path:
+            __matrix_state["lit_matrix"] = lit_matrix
+            __matrix_state["path"] = path
+        __matrix_state["current_mtime"] = mtime
+        return __matrix_state["lit_matrix"]
+
+
+def __gene_row(gene_ids: np.ndarray, gene_id: Any) -> Optional[int]:
+    """Return the row of a gene id in the matrix, None if it has none"""
+    try:
+        gene_id = int(gene_id)
+    except (TypeError, ValueError):
+        return None
+    row = int(np.searchsorted(gene_ids, gene_id))
+    return row if row < len(gene_ids) and gene_ids[row] == gene_id else None
+
+
+def lit_correlations(lit_matrix: LitMatrix,
+                     gene_id: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the gene ids and values of all the lit correlations of a mouse
+    gene id, sorted by absolute value in descending order"""
+    (gene_ids, indptr, indices, values) = lit_matrix
+    row = __gene_row(gene_ids, gene_id)
+    if row is None:
+        return (np.array([], dtype="int64"), np.array([], dtype=float))
+    (start, end) = (indptr[row], indptr[row + 1])
+    return (gene_ids[indices[start:end]],
+            # The shortest repr of the float32 values is the value stored
+            values[start:end].astype(str).astype(float))
+
+
+def lookup_lit_correlations(lit_matrix: LitMatrix,
+                            input_mouse_gene_id: Optional[str],
+                            mouse_gene_ids: List) -> Dict[str, float]:
+    """Matrix alternative to
+    `gn3.computations.correlations.fetch_all_lit_correlation_data` that
+    returns the same dict of the mouse gene ids with a lit correlation with
+    the input mouse gene id to their values"""
+    (row_gene_ids, row_values) = lit_correlations(
+        lit_matrix, input_mouse_gene_id)
+    lit_corrs = dict(zip(map(str, row_gene_ids.tolist()),
+                         row_values.tolist()))
+    return {str(mouse_gene_id): lit_corrs[str(mouse_gene_id)]
+            for mouse_gene_id in mouse_gene_ids
+            if str(mouse_gene_id) in lit_corrs}
@@ -0,0 +1,108 @@
+"""module contains the pearson index of a dataset matrix: the mean and the
+centred sum of squares of every trait over all its strains. Most primary
+traits have values for all or nearly all the strains of a dataset, so the
+pearson r against every trait is one matrix-vector product with the centred
+primary values, the sums of the target traits over the shared strains being
+the stored sums less those of the few excluded strains.
+
+Traits with missing values have NaN in the index and are correlated on the
+masked path of `gn3.computations.vectorized_correlations`"""
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+from gn3.computations.pvalues import compute_corr_p_values
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+# (trait means, trait centred sums of squares)
+PearsonIndex = Tuple[np.ndarray, np.ndarray]
+
+# The index is not used when the primary trait lacks more than this fraction
+# of the dataset's strains
+MAX_EXCLUDED_FRACTION = 0.5
+
+# Number of traits read from the (possibly float32, memory-mapped) matrix and
+# converted to float64 at a time
+CHUNK_SIZE = 65536
+
+
+def build_pearson_index(matrix: np.ndarray,
+                        chunk_size: int = CHUNK_SIZE) -> PearsonIndex:
+    """Compute the pearson index of a (strains x traits) matrix"""
+    num_traits = matrix.shape[1]
+    (means, sum_squares) = (np.empty(num_traits), np.empty(num_traits))
+    for start in range(0, num_traits, chunk_size):
+        block = np.asarray(matrix[:, start:start + chunk_size], dtype=float)
+        means[start:start + chunk_size] = block.mean(axis=0)
+        sum_squares[start:start + chunk_size] = (
+            (block - means[start:start + chunk_size]) ** 2).sum(axis=0)
+    return (means, sum_squares)
+
+
+def strain_values(samples: Sequence[str], primary_vals: np.ndarray,
+                  strain_names: Sequence[str]) -> np.ndarray:
+    """Put the primary values in the order of the dataset's strains, with NaN
+    for the strains the primary trait lacks. Samples that are not strains of
+    the dataset are dropped since no target has values for them"""
+    strain_index = {strain: idx for idx, strain in enumerate(strain_names)}
+    values = np.full(len(strain_names), np.nan)
+    for (sample, value) in zip(samples, primary_vals):
+        if sample in strain_index:
+            values[strain_index[sample]] = value
+    values[values == 0] = np.nan
+    return values
+
+
+def compute_indexed_pearson(
+        primary_vals: np.ndarray, matrix: np.ndarray,
+        pearson_index: PearsonIndex,
+        max_excluded_fraction: float = MAX_EXCLUDED_FRACTION,
+        chunk_size: int = CHUNK_SIZE) -> Optional[Tuple[np.ndarray,
+                                                        np.ndarray,
+                                                        np.ndarray]]:
+    """Given the primary values in the order of the strains of a (strains x
+    traits) MATRIX (see `strain_values`) and the matrix' pearson index return
+    the arrays of `compute_correlation_arrays` for the pearson correlation, or
+    None when the primary trait lacks too many strains for the index to be
+    worth using"""
+    # pylint: disable=[R0913, R0914]
+    (means, sum_squares) = pearson_index
+    shared = ~np.isnan(primary_vals)
+    excluded = np.flatnonzero(~shared)
+    if not shared.any() or (
+            len(excluded) > max_excluded_fraction * len(primary_vals)):
+        return None
+    num_shared = int(shared.sum())
+    centred = np.where(shared, primary_vals - primary_vals[shared].mean(), 0.0)
+    x_sum_squares = (centred ** 2).sum()
+    corr = np.empty(matrix.shape[1])
+    for start in range(0, matrix.shape[1], chunk_size):
+        block = np.asarray(matrix[:, start:start + chunk_size], dtype=float)
+        block_means = means[start:start + chunk_size]
+        excluded_dev = block[excluded] - block_means
+        # The shared deviations from the full mean sum to minus the excluded
+        shared_dev_sum = -excluded_dev.sum(axis=0)
+        y_sum_squares = (sum_squares[start:start + chunk_size] -
+                         (excluded_dev ** 2).sum(axis=0) -
+                         shared_dev_sum ** 2 / num_shared)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            block_corr = (centred @ block) / np.sqrt(
+                x_sum_squares * y_sum_squares)
+        # Traits that are constant over the shared strains are NaN, as in
+        # `scipy.stats.pearsonr`, even when rounding leaves a tiny variance
+        block_corr[y_sum_squares <= 1e-12 * sum_squares[
+            start:start + chunk_size]] = np.nan
+        corr[start:start + chunk_size] = block_corr
+    if np.ptp(primary_vals[shared]) == 0:
+        corr[:] = np.nan
+    num_overlap = np.full(matrix.shape[1], num_shared)
+    incomplete = np.flatnonzero(np.isnan(means))
+    if len(incomplete):
+        (corr[incomplete], _p_values, num_overlap[incomplete]) = (
+            compute_correlation_arrays(
+                primary_vals, np.asarray(matrix[:, incomplete], dtype=float),
+                "pearson"))
+    corr = np.clip(corr, -1.0, 1.0)
+    return (corr, compute_corr_p_values(corr, num_overlap), num_overlap)
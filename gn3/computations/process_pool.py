@@ -0,0 +1,78 @@
+"""module contains the application level process pool used by the
+multiprocessing correlation computations. The pool is created lazily once per
+(worker) process and reused across requests. `create_app` registers
+`shutdown_pool` to run at exit and gunicorn workers call it from the
+`worker_exit` hook in gunicorn.conf.py"""
+import os
+import multiprocessing
+import multiprocessing.pool
+from multiprocessing import resource_tracker
+
+from typing import Any
+from typing import Dict
+from typing import Optional
+
+from gn3.settings import CORRELATION_POOL_SIZE
+from gn3.settings import CORRELATION_POOL_CHUNKSIZE
+
+__pool_state: Dict[str, Any] = {
+    "pool": None,
+    "pid": None,
+    "processes": CORRELATION_POOL_SIZE,
+    "chunksize": CORRELATION_POOL_CHUNKSIZE
+}
+
+
+def configure_pool(processes: Optional[int] = None,
+                   chunksize: Optional[int] = None) -> None:
+    """Set the size of the pool and the number of items submitted per task. A
+    pool that is already running is shut down so the next `get_pool` call
+    creates one with the new size. A `None` chunksize means the chunksize is
+    computed from the number of items
+
+    """
+    shutdown_pool()
+    __pool_state["processes"] = processes
+    __pool_state["chunksize"] = chunksize
+
+
+def get_pool() -> multiprocessing.pool.Pool:
+    """Return the pool for the current process creating it if it does not
+    exist. A pool inherited from a parent process (e.g. after a gunicorn fork)
+    is not usable, so a new one is created in that case
+
+    """
+    if (__pool_state["pool"] is None or
+            __pool_state["pid"] != os.getpid()):
+        # Workers inherit the running resource tracker instead of starting
+        # their own which would unlink shared memory they only attached to
+        resource_tracker.ensure_running()
+        __pool_state["pool"] = multiprocessing.Pool(  # pylint: disable=R1732
+            __pool_state["processes"])
+        __pool_state["pid"] = os.getpid()
+    return __pool_state["pool"]
+
+
+def pool_chunksize(num_items: int) -> int:
+    """Number of items to send to a worker per task: the configured value or,
+    if there is none, enough to give each worker about 4 tasks"""
+    if __pool_state["chunksize"]:
+        return __pool_state["chunksize"]
+    processes = __pool_state["processes"] or os.cpu_count() or 1
+    return max(1, -(-num_items // (processes * 4)))
+
+
+def pool_starmap(func, items: list) -> list:
+    """`starmap` FUNC over ITEMS on the application pool in chunks"""
+    return get_pool().starmap(func, items, chunksize=pool_chunksize(len(items)))
+
+
+def shutdown_pool() -> None:
+    """Close the pool of the current process and wait for its workers to
+    exit"""
+    pool = __pool_state["pool"]
+    if pool is not None and __pool_state["pid"] == os.getpid():
+        pool.close()
+        pool.join()
+    __pool_state["pool"] = None
+    __pool_state["pid"] = None
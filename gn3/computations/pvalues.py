@@ -0,0 +1,29 @@
+"""module contains the batched p value stage used by the correlation
+computations: p values for many correlation coefficients are computed in one
+vectorized call instead of one scipy call per trait"""
+from typing import Sequence
+from typing import Union
+
+import numpy as np
+import scipy.stats
+
+ArrayLike = Union[np.ndarray, Sequence[float]]
+
+
+def compute_corr_p_values(corr_coefficients: ArrayLike,
+                          num_overlaps: ArrayLike) -> np.ndarray:
+    """Given arrays of correlation coefficients and the number of samples each
+    one was computed over return the two sided p values from the student t
+    distribution with n - 2 degrees of freedom. This is the p value given by
+    `scipy.stats.pearsonr`, `scipy.stats.spearmanr` and WGCNA's
+    `corPvalueStudent`. Like `scipy.stats.pearsonr` two samples give a p value
+    of 1
+
+    """
+    corr = np.asarray(corr_coefficients, dtype=float)
+    num_overlap = np.asarray(num_overlaps, dtype=float)
+    dof = num_overlap - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_stat = corr * np.sqrt(dof / ((1.0 - corr) * (1.0 + corr)))
+        p_values = 2 * scipy.stats.t.sf(np.abs(t_stat), dof)
+    return np.where(num_overlap == 2, 1.0, p_values)
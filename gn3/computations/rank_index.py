@@ -0,0 +1,95 @@
+"""module contains the rank index of a dataset matrix: the ranks of every
+trait's values over all its strains, 0 for missing values, with the number of
+missing values and the centred sum of squares of the ranks of each trait.
+
+A trait's stored ranks are its ranks over the samples it shares with a
+primary trait when its missing values are exactly the strains the primary
+trait lacks, which is the case for most traits of a dataset when the primary
+trait has values for all its strains. The spearman rho of those traits is one
+matrix-vector product with the centred ranks of the primary values; only the
+other traits are ranked again, on the masked path of
+`gn3.computations.vectorized_correlations`"""
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import scipy.stats
+
+from gn3.computations.pvalues import compute_corr_p_values
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+# (trait ranks, trait missing value counts, trait centred sums of squares)
+RankIndex = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Number of traits ranked, or read from the ranks and converted to float64, at
+# a time
+CHUNK_SIZE = 65536
+
+
+def build_rank_index(matrix: np.ndarray,
+                     chunk_size: int = CHUNK_SIZE) -> RankIndex:
+    """Compute the rank index of a (strains x traits) matrix. Ties have their
+    average rank as in `scipy.stats.rankdata`; the ranks are float32 which
+    holds them exactly"""
+    (num_strains, num_traits) = matrix.shape
+    ranks = np.zeros(matrix.shape, dtype="float32")
+    num_missing = np.empty(num_traits, dtype=int)
+    sum_squares = np.empty(num_traits)
+    for start in range(0, num_traits, chunk_size):
+        block = np.asarray(matrix[:, start:start + chunk_size], dtype=float)
+        missing = np.isnan(block)
+        # Missing values ranked last leave the ranks of the others unchanged
+        block_ranks = np.where(missing, 0.0, scipy.stats.rankdata(
+            np.where(missing, np.inf, block), axis=0))
+        block_missing = missing.sum(axis=0)
+        ranks[:, start:start + chunk_size] = block_ranks
+        num_missing[start:start + chunk_size] = block_missing
+        sum_squares[start:start + chunk_size] = (np.where(
+            missing, 0.0,
+            block_ranks - (num_strains - block_missing + 1) / 2) ** 2).sum(
+                axis=0)
+    return (ranks, num_missing, sum_squares)
+
+
+def compute_indexed_spearman(
+        primary_vals: np.ndarray, matrix: np.ndarray, rank_index: RankIndex,
+        chunk_size: int = CHUNK_SIZE) -> Optional[Tuple[np.ndarray,
+                                                        np.ndarray,
+                                                        np.ndarray]]:
+    """Given the primary values in the order of the strains of a (strains x
+    traits) MATRIX (see `gn3.computations.pearson_index.strain_values`) and
+    the matrix' rank index return the arrays of `compute_correlation_arrays`
+    for the spearman correlation, or None when no trait's stored ranks can be
+    used"""
+    # pylint: disable=[R0914]
+    (ranks, num_missing, sum_squares) = rank_index
+    shared = ~np.isnan(primary_vals)
+    excluded = np.flatnonzero(~shared)
+    matched = np.asarray(num_missing) == len(excluded)
+    if len(excluded):
+        matched &= (ranks[excluded] == 0).all(axis=0)
+    if not shared.any() or not matched.any():
+        return None
+    num_shared = int(shared.sum())
+    centred = np.zeros(len(primary_vals))
+    centred[shared] = (scipy.stats.rankdata(primary_vals[shared]) -
+                       (num_shared + 1) / 2)
+    x_sum_squares = (centred ** 2).sum()
+    corr = np.empty(ranks.shape[1])
+    for start in range(0, ranks.shape[1], chunk_size):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr[start:start + chunk_size] = (
+                centred @ np.asarray(ranks[:, start:start + chunk_size],
+                                     dtype=float)) / np.sqrt(
+                                         x_sum_squares *
+                                         sum_squares[start:start + chunk_size])
+    corr[np.asarray(sum_squares) == 0] = np.nan
+    num_overlap = np.full(ranks.shape[1], num_shared)
+    unmatched = np.flatnonzero(~matched)
+    if len(unmatched):
+        (corr[unmatched], _p_values, num_overlap[unmatched]) = (
+            compute_correlation_arrays(
+                primary_vals, np.asarray(matrix[:, unmatched], dtype=float),
+                "spearman"))
+    corr = np.clip(corr, -1.0, 1.0)
+    return (corr, compute_corr_p_values(corr, num_overlap), num_overlap)
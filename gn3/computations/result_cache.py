@@ -0,0 +1,164 @@
+"""module contains the correlation result cache. The correlation arrays of a
+primary trait against a dataset are cached under a key made of the dataset's
+identity and generation, the method and a hash of the primary trait's sample
+values, so that paging or re-sorting in GN2 does not recompute them.
+
+There are two tiers: an in-process LRU bounded by the size of the cached
+arrays, and an optional Redis tier on `gn3.settings.REDIS_URI` shared by all
+the workers"""
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+import redis
+
+from gn3.settings import CORRELATION_CACHE_MAX_BYTES
+from gn3.settings import CORRELATION_CACHE_REDIS_TTL
+
+# The (r, p, n) arrays of a correlation, or other arrays computed from the
+# same input such as the sums of `gn3.computations.incremental_correlations`
+CorrelationArrays = Tuple[np.ndarray, ...]
+
+__cache_state: Dict[str, Any] = {
+    "entries": OrderedDict(),
+    "size": 0,
+    "max_bytes": CORRELATION_CACHE_MAX_BYTES,
+    "redis": None,
+    "redis_ttl": CORRELATION_CACHE_REDIS_TTL,
+    "stats": {"hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0},
+    "lock": threading.Lock()
+}
+
+
+def configure_result_cache(max_bytes: int = CORRELATION_CACHE_MAX_BYTES,
+                           redis_uri: Optional[str] = None,
+                           redis_ttl: int = CORRELATION_CACHE_REDIS_TTL
+                           ) -> None:
+    """Empty the cache and set the size of its in-process tier. The Redis tier
+    is used when REDIS_URI is given; its entries expire after REDIS_TTL
+    seconds"""
+    with __cache_state["lock"]:
+        __cache_state["entries"] = OrderedDict()
+        __cache_state["size"] = 0
+        __cache_state["max_bytes"] = max_bytes
+        __cache_state["redis"] = (
+            redis.Redis.from_url(redis_uri) if redis_uri else None)
+        __cache_state["redis_ttl"] = redis_ttl
+    reset_result_cache_stats()
+
+
+def correlation_cache_key(dataset_type: str, dataset_name: str,
+                          generation: int, corr_method: str,
+                          samples: List[str],
+                          primary_vals: np.ndarray) -> str:
+    """Build the cache key of a correlation of the primary trait's values over
+    SAMPLES against a generation of a dataset"""
+    # pylint: disable=[R0913]
+    samples_hash = hashlib.sha256(
+        "\t".join(samples).encode("utf-8") +
+        np.asarray(primary_vals, dtype=float).tobytes()).hexdigest()
+    return (f"GN3::correlation::{dataset_type}::{dataset_name}::"
+            f"{generation}::{corr_method}::{samples_hash}")
+
+
+def __serialize(arrays: CorrelationArrays) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, *arrays)
+    return buffer.getvalue()
+
+
+def __deserialize(data: bytes) -> CorrelationArrays:
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz_file:
+        return tuple(npz_file[f"arr_{idx}"]
+                     for idx in range(len(npz_file.files)))
+
+
+def __fetch_local(key: str) -> Optional[CorrelationArrays]:
+    with __cache_state["lock"]:
+        entries = __cache_state["entries"]
+        if key not in entries:
+            return None
+        entries.move_to_end(key)
+        __cache_state["stats"]["hits"] += 1
+        return entries[key]
+
+
+def __store_local(key: str, arrays: CorrelationArrays) -> None:
+    size = sum(array.nbytes for array in arrays)
+    with __cache_state["lock"]:
+        if size > __cache_state["max_bytes"]:
+            return
+        entries = __cache_state["entries"]
+        if key in entries:
+            __cache_state["size"] -= sum(
+                array.nbytes for array in entries.pop(key))
+        entries[key] = arrays
+        __cache_state["size"] += size
+        while __cache_state["size"] > __cache_state["max_bytes"]:
+            (_, evicted) = entries.popitem(last=False)
+            __cache_state["size"] -= sum(array.nbytes for array in evicted)
+
+
+def __count(stat: str) -> None:
+    with __cache_state["lock"]:
+        __cache_state["stats"][stat] += 1
+
+
+def cached_correlation_arrays(
+        key: str, compute: Callable[[], CorrelationArrays]
+) -> CorrelationArrays:
+    """Return the correlation arrays cached under KEY, calling COMPUTE and
+    caching its result on a miss. Redis errors are counted and handled as
+    misses so the cache never fails a correlation"""
+    arrays = __fetch_local(key)
+    if arrays is not None:
+        return arrays
+    redis_conn = __cache_state["redis"]
+    if redis_conn is not None:
+        try:
+            data = redis_conn.get(key)
+        except redis.exceptions.RedisError:
+            data = None
+            __count("redis_errors")
+        if data is not None:
+            __count("redis_hits")
+            arrays = __deserialize(data)
+            __store_local(key, arrays)
+            return arrays
+    __count("misses")
+    arrays = compute()
+    __store_local(key, arrays)
+    if redis_conn is not None:
+        try:
+            redis_conn.set(key, __serialize(arrays),
+                           ex=__cache_state["redis_ttl"])
+        except redis.exceptions.RedisError:
+            __count("redis_errors")
+    return arrays
+
+
+def result_cache_stats() -> Dict[str, int]:
+    """Return the hit, miss and error counts of the cache of this process and
+    the size of its in-process tier"""
+    with __cache_state["lock"]:
+        return {**__cache_state["stats"],
+                "entries": len(__cache_state["entries"]),
+                "size": __cache_state["size"],
+                "max_bytes": __cache_state["max_bytes"]}
+
+
+def reset_result_cache_stats() -> None:
+    """Zero the hit, miss and error counts"""
+    with __cache_state["lock"]:
+        __cache_state["stats"] = {
+            key: 0
+            for key in ("hits", "redis_hits", "misses", "redis_errors")}
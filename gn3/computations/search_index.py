@@ -0,0 +1,130 @@
+"""module contains the approximate search index of a dataset matrix, for
+finding the top n traits of a very large dataset most correlated with a
+primary trait without correlating against all of them.
+
+The traits are z-scored over all the strains, centred and scaled to unit norm
+with missing values at the mean, so the pearson r of two traits with no
+missing values is the dot product of their vectors. An inverted file groups
+the vectors into clusters by spherical k-means. A query probes the clusters
+whose centroids have the largest absolute dot product with the z-scored
+primary trait, which finds negative correlations too, and the traits of those
+clusters are correlated exactly on the masked path of
+`gn3.computations.vectorized_correlations`. Results are approximate in that a
+trait of an unprobed cluster can be missed; the correlations returned are
+exact"""
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+# (centroids, traits ordered by cluster, offsets of the clusters in the order)
+SearchIndex = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Number of clusters probed, at least; more are probed until there are
+# CANDIDATE_FACTOR times the number of results asked for
+NUM_PROBES = 16
+CANDIDATE_FACTOR = 20
+
+# Number of traits the centroids are computed from, and k-means iterations
+TRAINING_SIZE = 65536
+NUM_ITERATIONS = 10
+
+# Number of (cluster, trait) dot products computed at a time
+CHUNK_SIZE = 1 << 22
+
+
+def zscore_traits(matrix: np.ndarray) -> np.ndarray:
+    """Centre each column of a (strains x traits) matrix and scale it to unit
+    norm. Missing values, and constant columns, are 0"""
+    present = ~np.isnan(matrix)
+    values = np.where(present, matrix, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centred = np.where(
+            present, values - values.sum(axis=0) / present.sum(axis=0), 0.0)
+        norms = np.sqrt((centred ** 2).sum(axis=0))
+        return np.where(norms > 0, centred / norms, 0.0)
+
+
+def __nearest_centroids(centroids: np.ndarray,
+                        vectors: np.ndarray) -> np.ndarray:
+    """Return the index of the centroid nearest to each z-scored vector"""
+    chunk_size = max(1, CHUNK_SIZE // centroids.shape[1])
+    return np.concatenate(
+        [np.argmax(centroids.T @ vectors[:, start:start + chunk_size], axis=0)
+         for start in range(0, vectors.shape[1], chunk_size)] or
+        [np.array([], dtype=int)])
+
+
+def build_search_index(matrix: np.ndarray,
+                       num_clusters: Optional[int] = None,
+                       training_size: int = TRAINING_SIZE,
+                       num_iterations: int = NUM_ITERATIONS,
+                       seed: int = 0) -> SearchIndex:
+    """Build the search index of a (strains x traits) matrix with
+    NUM_CLUSTERS clusters, the square root of the number of traits by
+    default. The centroids are computed from a sample of TRAINING_SIZE traits
+    and every trait is then put in the cluster of its nearest centroid"""
+    # pylint: disable=[R0913]
+    num_traits = matrix.shape[1]
+    rng = np.random.default_rng(seed)
+    training = np.sort(rng.choice(
+        num_traits, min(training_size, num_traits), replace=False))
+    vectors = zscore_traits(np.asarray(matrix[:, training], dtype=float))
+    num_clusters = min(num_clusters or max(1, int(np.sqrt(num_traits))),
+                       len(training))
+    centroids = vectors[:, rng.choice(
+        len(training), num_clusters, replace=False)]
+    for _ in range(num_iterations):
+        sums = np.zeros((num_clusters, matrix.shape[0]))
+        np.add.at(sums, __nearest_centroids(centroids, vectors), vectors.T)
+        norms = np.sqrt((sums ** 2).sum(axis=1))
+        # Clusters left empty keep their centroid
+        centroids = np.where(norms > 0, sums.T / np.where(norms > 0, norms, 1),
+                             centroids)
+    clusters = np.concatenate(
+        [__nearest_centroids(centroids, zscore_traits(
+            np.asarray(matrix[:, start:start + TRAINING_SIZE], dtype=float)))
+         for start in range(0, num_traits, TRAINING_SIZE)] or
+        [np.array([], dtype=int)])
+    return (centroids.astype("float32"),
+            np.argsort(clusters, kind="stable"),
+            np.concatenate(
+                ([0], np.cumsum(np.bincount(clusters,
+                                            minlength=num_clusters)))))
+
+
+def search_candidates(primary_vals: np.ndarray, search_index: SearchIndex,
+                      top_n: int, num_probes: int = NUM_PROBES) -> np.ndarray:
+    """Return the sorted indices of the traits of the clusters probed for the
+    TOP_N traits most correlated with the primary values, given in the order
+    of the strains of the indexed matrix with NaN for missing values"""
+    (centroids, order, offsets) = search_index
+    scores = np.abs(
+        zscore_traits(primary_vals[:, None])[:, 0] @ centroids)
+    probes = np.argsort(-scores, kind="stable")
+    num_candidates = np.cumsum(np.diff(offsets)[probes])
+    num_probed = max(num_probes, int(np.searchsorted(
+        num_candidates, CANDIDATE_FACTOR * top_n)) + 1)
+    return np.sort(np.concatenate(
+        [order[offsets[cluster]:offsets[cluster + 1]]
+         for cluster in probes[:num_probed]]))
+
+
+def compute_approximate_correlation(
+        primary_vals: np.ndarray, matrix: np.ndarray,
+        search_index: SearchIndex, top_n: int,
+        num_probes: int = NUM_PROBES) -> Tuple[np.ndarray, np.ndarray,
+                                               np.ndarray, np.ndarray]:
+    """Correlate the primary values, in the order of the strains of a
+    (strains x traits) MATRIX, with the candidates of the search index for the
+    TOP_N most correlated traits. Returns the indices of the candidates and
+    the arrays of `compute_correlation_arrays` for the pearson correlation
+    with them"""
+    # pylint: disable=[R0913]
+    candidates = search_candidates(
+        primary_vals, search_index, top_n, num_probes)
+    return (candidates, *compute_correlation_arrays(
+        primary_vals, np.asarray(matrix[:, candidates], dtype=float),
+        "pearson"))
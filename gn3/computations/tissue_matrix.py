@@ -0,0 +1,68 @@
+"""module contains the tissue matrix: the tissue values of a tissue dataset held
+as one (symbols x tissues) float matrix with an index of the lowercase gene
+symbols to its rows, so that the tissue correlations of all the target traits
+are computed in one vectorized pass, once per symbol, instead of one scipy
+call per trait.
+
+Every request sends the tissue values, so the matrix is built from them each
+time: building it costs less than fingerprinting them for a cache"""
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from gn3.computations.correlations import top_n_indices
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+# (lowercase symbol -> row, (symbols x tissues) matrix)
+TissueMatrix = Tuple[Dict[str, int], np.ndarray]
+
+
+def build_tissue_matrix(symbol_tissue_vals_dict: dict) -> TissueMatrix:
+    """Given a dict of lowercase gene symbols to their tissue values return the
+    index of the symbols and the (symbols x tissues) matrix of the values.
+    Raises `ValueError` when the symbols have different numbers of values"""
+    rows = list(symbol_tissue_vals_dict.values())
+    if len({len(row) for row in rows}) > 1:
+        raise ValueError("The symbols have different numbers of tissues")
+    return ({symbol: idx for idx, symbol in enumerate(symbol_tissue_vals_dict)},
+            np.array(rows, dtype=float).reshape(
+                len(rows), len(rows[0]) if rows else 0))
+
+
+def compute_vectorized_tissue_correlation(primary_tissue_dict: dict,
+                                          target_tissues_data: dict,
+                                          corr_method: str,
+                                          top_n: Optional[int] = None
+                                          ) -> List:
+    """Vectorized alternative to `compute_tissue_correlation` that takes the
+    same input and gives the same results: the primary tissue values are
+    correlated with the rows of the symbols of all the target traits at once"""
+    # pylint: disable=[R0914]
+    primary_tissue_vals = np.array(
+        primary_tissue_dict["tissue_values"], dtype=float)
+    (symbol_index, matrix) = build_tissue_matrix(
+        target_tissues_data["symbol_tissue_vals_dict"])
+    (trait_names, rows) = ([], [])
+    for (trait, symbol) in target_tissues_data["trait_symbol_dict"].items():
+        if symbol is not None and symbol.lower() in symbol_index:
+            trait_names.append(trait)
+            rows.append(symbol_index[symbol.lower()])
+    if not trait_names:
+        return []
+    (symbol_rows, trait_rows) = np.unique(rows, return_inverse=True)
+    if matrix.shape[1] != len(primary_tissue_vals):
+        raise ValueError("The primary and target tissues differ in number")
+    (corr, p_values, _num_overlap) = compute_correlation_arrays(
+        primary_tissue_vals, matrix[symbol_rows].T, corr_method)
+    (corr, p_values) = (corr[trait_rows], p_values[trait_rows])
+    indices = top_n_indices(corr, top_n)
+    return [
+        {trait_names[idx]: {"tissue_corr": tissue_corr,
+                            "tissue_number": len(primary_tissue_vals),
+                            "tissue_p_val": p_value}}
+        for (idx, tissue_corr, p_value) in zip(
+            indices.tolist(), corr[indices].tolist(),
+            p_values[indices].tolist())]
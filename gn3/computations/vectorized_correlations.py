@@ -0,0 +1,295 @@
+"""module contains a vectorized engine for sample correlations: the primary
+trait and the whole target dataset are turned into a masked (samples x traits)
+matrix and the correlations for all the targets are computed in one pass"""
+from multiprocessing import shared_memory
+from typing import List
+from typing import Tuple
+from typing import Optional
+
+import numpy as np
+import scipy.stats
+
+from gn3.computations.biweight import biweight_midcorrelation
+from gn3.computations.correlations import top_n_indices
+from gn3.computations.process_pool import get_pool
+from gn3.computations.process_pool import pool_chunksize
+from gn3.computations.pvalues import compute_corr_p_values
+
+# Traits sharing a missing value pattern are correlated as one dense block
+# when there are at least this many of them
+MIN_PATTERN_GROUP_SIZE = 8
+
+
+def build_sample_matrix(this_trait_samples: dict,
+                        target_dataset: List) -> Tuple[np.ndarray,
+                                                       np.ndarray, List]:
+    """Given the primary trait sample data and a target dataset in the form
+    accepted by `compute_all_sample_correlation` build the primary values
+    vector and a (samples x traits) matrix of the target values over the
+    primary trait's samples. Missing values are set to NaN; primary values that
+    are falsy are treated as missing, just as `normalize_values` does
+
+    """
+    samples = list(this_trait_samples.keys())
+    primary_vals = np.array(
+        [value if value else None for value in this_trait_samples.values()],
+        dtype=float)
+    target_matrix = np.array(
+        [[target["trait_sample_data"].get(sample) for sample in samples]
+         for target in target_dataset],
+        dtype=float).reshape(len(target_dataset), len(samples)).T
+    trait_names = [target.get("trait_id") for target in target_dataset]
+    return (primary_vals, target_matrix, trait_names)
+
+
+def __is_constant(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Check which columns of `values` are constant over the masked samples"""
+    return (np.where(mask, values, -np.inf).max(axis=0) ==
+            np.where(mask, values, np.inf).min(axis=0))
+
+
+def __masked_pearson(primary_vals: np.ndarray, target_matrix: np.ndarray,
+                     mask: np.ndarray) -> np.ndarray:
+    """Compute the pearson r of each column of `target_matrix` against
+    `primary_vals` (a column or a matrix of the same shape) using only the
+    masked samples. Columns where either input is constant are NaN just like
+    `scipy.stats.pearsonr`
+
+    """
+    x_vals = np.where(mask, primary_vals, 0.0)
+    y_vals = np.where(mask, target_matrix, 0.0)
+    num_overlap = mask.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_dev = np.where(mask, x_vals - x_vals.sum(axis=0) / num_overlap, 0.0)
+        y_dev = np.where(mask, y_vals - y_vals.sum(axis=0) / num_overlap, 0.0)
+        corr = ((x_dev * y_dev).sum(axis=0) /
+                np.sqrt((x_dev ** 2).sum(axis=0) * (y_dev ** 2).sum(axis=0)))
+    corr[__is_constant(x_vals, mask) | __is_constant(y_vals, mask)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def __masked_rank(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Rank each column of `values` over the masked samples giving ties their
+    average rank, the way `scipy.stats.rankdata` does. Samples outside the mask
+    have a NaN rank
+
+    """
+    masked = np.where(mask, values, np.nan)
+    order = np.argsort(masked, axis=0, kind="mergesort")
+    sorted_vals = np.take_along_axis(masked, order, axis=0)
+    positions = np.broadcast_to(
+        np.arange(masked.shape[0])[:, None], masked.shape)
+    group_start = np.ones(masked.shape, dtype=bool)
+    group_start[1:] = sorted_vals[1:] != sorted_vals[:-1]
+    group_end = np.ones(masked.shape, dtype=bool)
+    group_end[:-1] = group_start[1:]
+    starts = np.maximum.accumulate(
+        np.where(group_start, positions, 0), axis=0)
+    ends = np.minimum.accumulate(
+        np.where(group_end, positions, masked.shape[0])[::-1], axis=0)[::-1]
+    ranks = np.empty(masked.shape)
+    np.put_along_axis(ranks, order, (starts + ends) / 2.0 + 1, axis=0)
+    return np.where(mask, ranks, np.nan)
+
+
+def __masked_correlation(primary_vals: np.ndarray, target_matrix: np.ndarray,
+                         mask: np.ndarray, corr_method: str) -> np.ndarray:
+    """Correlate the primary values with each column of `target_matrix` using
+    each column's own mask"""
+    if corr_method == "spearman":
+        return __masked_pearson(
+            __masked_rank(np.broadcast_to(
+                primary_vals[:, None], target_matrix.shape), mask),
+            __masked_rank(target_matrix, mask), mask)
+    if corr_method == "bicor":
+        return biweight_midcorrelation(
+            primary_vals[:, None], target_matrix, mask)
+    return __masked_pearson(primary_vals[:, None], target_matrix, mask)
+
+
+def __dense_correlation(primary_vals: np.ndarray, target_matrix: np.ndarray,
+                        corr_method: str) -> np.ndarray:
+    """Correlate the primary values with each column of `target_matrix` when
+    none of them has missing values, so the primary values are ranked or
+    weighted only once for all the columns"""
+    if corr_method == "bicor":
+        return biweight_midcorrelation(
+            primary_vals[:, None], target_matrix,
+            np.ones(target_matrix.shape, dtype=bool))
+    if corr_method == "spearman":
+        primary_vals = scipy.stats.rankdata(primary_vals)
+        target_matrix = scipy.stats.rankdata(target_matrix, axis=0)
+    x_dev = primary_vals - primary_vals.mean()
+    y_dev = target_matrix - target_matrix.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = (x_dev @ y_dev) / np.sqrt(
+            (x_dev ** 2).sum() * (y_dev ** 2).sum(axis=0))
+    if np.ptp(primary_vals) == 0:
+        corr[:] = np.nan
+    corr[np.ptp(target_matrix, axis=0) == 0] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def __group_by_mask(mask: np.ndarray) -> List[np.ndarray]:
+    """Group the columns of `mask` that have the same missing value pattern
+    returning the column indices of each group"""
+    (_patterns, pattern_index, counts) = np.unique(
+        np.packbits(mask, axis=0).T, axis=0,
+        return_inverse=True, return_counts=True)
+    order = np.argsort(pattern_index.reshape(-1), kind="stable")
+    return np.split(order, np.cumsum(counts)[:-1])
+
+
+def compute_correlation_arrays(
+        primary_vals: np.ndarray, target_matrix: np.ndarray,
+        corr_method: str = "pearson") -> Tuple[np.ndarray, np.ndarray,
+                                                np.ndarray]:
+    """Given the primary values (NaN for missing) and a (samples x traits)
+    target matrix compute the correlation coefficient, p value and number of
+    overlapping samples for every target trait in one vectorized pass
+
+    Traits are grouped by their missing value pattern: each group of at least
+    `MIN_PATTERN_GROUP_SIZE` traits is computed as one dense block over the
+    samples of its pattern, the remaining traits use their own masks.
+
+    """
+    if corr_method not in ("pearson", "spearman", "bicor"):
+        raise ValueError(f"Unsupported correlation method: {corr_method}")
+    mask = ~np.isnan(target_matrix) & ~np.isnan(primary_vals)[:, None]
+    num_overlap = mask.sum(axis=0)
+    if mask.size == 0:
+        corr = np.full(target_matrix.shape[1], np.nan)
+        return (corr, compute_corr_p_values(corr, num_overlap), num_overlap)
+    corr = np.empty(target_matrix.shape[1])
+    ungrouped = []
+    for columns in __group_by_mask(mask):
+        if len(columns) < MIN_PATTERN_GROUP_SIZE:
+            ungrouped.append(columns)
+            continue
+        rows = mask[:, columns[0]]
+        if rows.sum() < 2:
+            # No correlation over fewer than two shared samples
+            corr[columns] = np.nan
+            continue
+        corr[columns] = __dense_correlation(
+            primary_vals[rows], target_matrix[np.ix_(rows, columns)],
+            corr_method)
+    if ungrouped:
+        columns = np.concatenate(ungrouped)
+        corr[columns] = __masked_correlation(
+            primary_vals, target_matrix[:, columns], mask[:, columns],
+            corr_method)
+    return (corr, compute_corr_p_values(corr, num_overlap), num_overlap)
+
+
+def format_correlation_results(trait_names: List, corr: np.ndarray,
+                               p_values: np.ndarray,
+                               num_overlap: np.ndarray,
+                               top_n: Optional[int] = None) -> List:
+    """Convert the correlation arrays to the sorted list of single key dicts
+    returned by `compute_all_sample_correlation` keeping only the traits with
+    more than 5 overlapping samples and a valid correlation coefficient, and of
+    those only the TOP_N strongest if it is given
+
+    """
+    indices = np.flatnonzero((num_overlap > 5) & ~np.isnan(corr))
+    indices = indices[top_n_indices(corr[indices], top_n)]
+    return [
+        {trait_names[idx]: {"corr_coefficient": corr_coefficient,
+                            "p_value": p_value,
+                            "num_overlap": overlap}}
+        for (idx, corr_coefficient, p_value, overlap) in zip(
+            indices.tolist(), corr[indices].tolist(),
+            p_values[indices].tolist(), num_overlap[indices].tolist())]
+
+
+def compute_vectorized_sample_correlation(this_trait,
+                                          target_dataset,
+                                          corr_method="pearson",
+                                          top_n: Optional[int] = None) -> List:
+    """Vectorized alternative to `compute_all_sample_correlation` that takes
+    the same input and gives the same results
+
+    """
+    (primary_vals, target_matrix, trait_names) = build_sample_matrix(
+        this_trait["trait_sample_data"], target_dataset)
+    return format_correlation_results(
+        trait_names,
+        *compute_correlation_arrays(primary_vals, target_matrix, corr_method),
+        top_n=top_n)
+
+
+def __correlate_shared_block(shm_name: str, shape: Tuple[int, int],
+                             dtype: str, primary_vals: np.ndarray,
+                             columns: Tuple[int, int],
+                             corr_method: str) -> Tuple[np.ndarray,
+                                                        np.ndarray,
+                                                        np.ndarray]:
+    """Pool worker: attach to the shared target matrix and correlate the
+    primary values against the range of `columns` without copying the matrix
+    through the pool"""
+    # pylint: disable=[R0913]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        target_matrix = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        results = compute_correlation_arrays(
+            primary_vals, target_matrix[:, columns[0]:columns[1]],
+            corr_method)
+        del target_matrix
+        return results
+    finally:
+        shm.close()
+
+
+def compute_shared_correlation_arrays(
+        primary_vals: np.ndarray, target_matrix: np.ndarray,
+        corr_method: str = "pearson") -> Tuple[np.ndarray, np.ndarray,
+                                                np.ndarray]:
+    """Parallel version of `compute_correlation_arrays`: the target matrix is
+    copied once into shared memory and the application pool workers compute on
+    ranges of its columns
+
+    """
+    (num_samples, num_traits) = target_matrix.shape
+    block_size = pool_chunksize(num_traits)
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(target_matrix.nbytes, 1))
+    try:
+        shared_matrix = np.ndarray(target_matrix.shape,
+                                   dtype=target_matrix.dtype, buffer=shm.buf)
+        shared_matrix[:] = target_matrix
+        del shared_matrix
+        results = get_pool().starmap(
+            __correlate_shared_block,
+            [(shm.name, (num_samples, num_traits), target_matrix.dtype.str,
+              primary_vals, (start, min(start + block_size, num_traits)),
+              corr_method)
+             for start in range(0, num_traits, block_size)],
+            chunksize=1)
+    finally:
+        shm.close()
+        shm.unlink()
+    if not results:
+        return compute_correlation_arrays(
+            primary_vals, target_matrix, corr_method)
+    (corr, p_values, num_overlap) = (
+        np.concatenate(arrays) for arrays in zip(*results))
+    return (corr, p_values, num_overlap)
+
+
+def fast_compute_vectorized_sample_correlation(this_trait,
+                                               target_dataset,
+                                               corr_method="pearson",
+                                               top_n: Optional[int] = None) -> List:
+    """Alternative to `fast_compute_all_sample_correlation` that shares the
+    target matrix with the pool workers instead of pickling one tuple per
+    target trait
+
+    """
+    (primary_vals, target_matrix, trait_names) = build_sample_matrix(
+        this_trait["trait_sample_data"], target_dataset)
+    return format_correlation_results(
+        trait_names,
+        *compute_shared_correlation_arrays(
+            primary_vals, target_matrix, corr_method),
+        top_n=top_n)
@@ -4,6 +4,7 @@ from dataclasses import asdict, astuple
 from typing import Any, Dict, List, Optional, Generator, Tuple, Union
 from typing_extensions import Protocol
 
+from gn3.db.generations import bump_dataset_generations
 from gn3.db.metadata_audit import MetadataAudit
 from gn3.db.phenotypes import Phenotype
 from gn3.db.phenotypes import Probeset
@@ -58,10 +59,16 @@ def update(conn: Any,
     sql += " AND ".join(f"{TABLEMAP[table].get(k)} = "
                         "%s" for k in where_.keys())
     with conn.cursor() as cursor:
+        # Bump the generations first: the update may change the columns
+        # that find the datasets of the rows
+        bump_dataset_generations(
+            cursor, table,
+            {TABLEMAP[table][k]: v for k, v in where_.items()})
         cursor.execute(sql,
                        tuple(data_.values()) + tuple(where_.values()))
+        rowcount = cursor.rowcount
         conn.commit()
-        return cursor.rowcount
+        return rowcount
 
 
 def fetchone(conn: Any,
@@ -114,7 +121,7 @@ def insert(conn: Any,
            table: str,
            data: Dataclass) -> Optional[int]:
     """Run an INSERT into a table"""
-    dict_ = {TABLEMAP[table].get(k): v for k, v in asdict(data).items()
+    dict_ = {TABLEMAP[table][k]: v for k, v in asdict(data).items()
              if v is not None and k in TABLEMAP[table]}
     sql = f"INSERT INTO {table} ("
     sql += ", ".join(f"{k}" for k in dict_.keys())
@@ -123,8 +130,10 @@ def insert(conn: Any,
     sql += ")"
     with conn.cursor() as cursor:
         cursor.execute(sql, tuple(dict_.values()))
+        rowcount = cursor.rowcount
+        bump_dataset_generations(cursor, table, dict_)
         conn.commit()
-        return cursor.rowcount
+        return rowcount
 
 
 def diff_from_dict(old: Dict, new: Dict) -> Dict:
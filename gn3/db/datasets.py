@@ -1,7 +1,96 @@
 """
 This module contains functions relating to specific trait dataset manipulation
+
+The name and RISet metadata of the `ProbeSet`, `Publish` and `Geno` datasets
+that `retrieve_trait_dataset` resolves for each trait are kept in a process
+wide cache keyed by (dataset type, dataset name, threshold), whose entries
+expire after DATASET_METADATA_TTL seconds.
 """
-from typing import Any
+import threading
+import time
+from typing import (
+    Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple)
+
+from MySQLdb.cursors import SSCursor
+
+from gn3.settings import DATASET_METADATA_TTL
+
+# Number of dataset data rows streamed at a time
+FETCH_SIZE = 50000
+
+__metadata_cache: Dict[str, Any] = {
+    # (dataset type, dataset name, threshold) -> (expiry time, metadata)
+    "entries": {},
+    "ttl": DATASET_METADATA_TTL,
+    "lock": threading.Lock()
+}
+
+# How to list the metadata of all the datasets of a type: the columns of the
+# dataset name query, the tables joining the datasets to their RISet and the
+# join conditions
+DATASET_METADATA_SOURCES = {
+    "ProbeSet": (
+        ("Id", "Name", "FullName", "ShortName", "DataScale"),
+        "ProbeSetFreeze, ProbeFreeze, InbredSet",
+        "ProbeFreeze.Id = ProbeSetFreeze.ProbeFreezeId "
+        "AND ProbeFreeze.InbredSetId = InbredSet.Id"),
+    "Publish": (
+        ("Id", "Name", "FullName", "ShortName"),
+        "PublishFreeze, InbredSet",
+        "PublishFreeze.InbredSetId = InbredSet.Id"),
+    "Geno": (
+        ("Id", "Name", "FullName", "ShortName"),
+        "GenoFreeze, InbredSet",
+        "GenoFreeze.InbredSetId = InbredSet.Id")
+}
+
+# The (trait name, strain name, value) rows of all the traits in a dataset
+DATASET_DATA_QUERIES = {
+    "ProbeSet": (
+        "SELECT ProbeSet.Name, Strain.Name, ProbeSetData.value "
+        "FROM (ProbeSetData, ProbeSetFreeze, Strain, ProbeSet, ProbeSetXRef) "
+        "WHERE ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+        "AND ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id "
+        "AND ProbeSetFreeze.Name = %(dataset_name)s "
+        "AND ProbeSetXRef.DataId = ProbeSetData.Id "
+        "AND ProbeSetData.StrainId = Strain.Id"),
+    "Publish": (
+        "SELECT PublishXRef.Id, Strain.Name, PublishData.value "
+        "FROM (PublishData, PublishFreeze, Strain, PublishXRef) "
+        "WHERE PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+        "AND PublishFreeze.Name = %(dataset_name)s "
+        "AND PublishXRef.DataId = PublishData.Id "
+        "AND PublishData.StrainId = Strain.Id"),
+    "Geno": (
+        "SELECT Geno.Name, Strain.Name, GenoData.value "
+        "FROM (GenoData, GenoFreeze, Strain, Geno, GenoXRef) "
+        "WHERE GenoXRef.GenoId = Geno.Id "
+        "AND GenoXRef.GenoFreezeId = GenoFreeze.Id "
+        "AND GenoFreeze.Name = %(dataset_name)s "
+        "AND GenoXRef.DataId = GenoData.Id "
+        "AND GenoData.StrainId = Strain.Id")
+}
+
+# The names of all the traits in a dataset
+DATASET_TRAIT_NAMES_QUERIES = {
+    "ProbeSet": (
+        "SELECT ProbeSet.Name "
+        "FROM (ProbeSetFreeze, ProbeSet, ProbeSetXRef) "
+        "WHERE ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+        "AND ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id "
+        "AND ProbeSetFreeze.Name = %(dataset_name)s"),
+    "Publish": (
+        "SELECT PublishXRef.Id "
+        "FROM (PublishFreeze, PublishXRef) "
+        "WHERE PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+        "AND PublishFreeze.Name = %(dataset_name)s"),
+    "Geno": (
+        "SELECT Geno.Name "
+        "FROM (GenoFreeze, Geno, GenoXRef) "
+        "WHERE GenoXRef.GenoId = Geno.Id "
+        "AND GenoXRef.GenoFreezeId = GenoFreeze.Id "
+        "AND GenoFreeze.Name = %(dataset_name)s")
+}
 
 def retrieve_probeset_trait_dataset_name(
         threshold: int, name: str, connection: Any):
@@ -191,6 +280,12 @@ def retrieve_riset_fields(trait_type, trait_name, dataset_info, conn):
     else:
         riset_info = riset_fns_map[trait_type](dataset_info["dataset_name"], conn)
 
+    return with_riset_fields(dataset_info, riset_info)
+
+def with_riset_fields(dataset_info, riset_info):
+    """
+    Add the RISet, and RISetID values to the dataset information.
+    """
     return {
         **dataset_info,
         **riset_info,
@@ -264,6 +359,87 @@ def retrieve_probeset_trait_dataset():
 	"type": "ProbeSet"
     }
 
+def configure_dataset_metadata_cache(ttl: float = DATASET_METADATA_TTL):
+    """
+    Empty the dataset metadata cache and set how long, in seconds, its
+    entries are kept. A TTL of 0 disables the cache.
+    """
+    with __metadata_cache["lock"]:
+        __metadata_cache["entries"] = {}
+        __metadata_cache["ttl"] = ttl
+
+def invalidate_dataset_metadata(
+        dataset_type: Optional[str] = None,
+        dataset_name: Optional[str] = None) -> int:
+    """
+    Remove the cached metadata of the datasets of DATASET_TYPE named
+    DATASET_NAME, under any of their names; all of them by default. Returns
+    the number of entries removed.
+    """
+    with __metadata_cache["lock"]:
+        entries = __metadata_cache["entries"]
+        keys = [
+            key for (key, (_expires, metadata)) in entries.items()
+            if dataset_type in (None, key[0]) and dataset_name in (
+                None, key[1], metadata.get("dataset_name"))]
+        for key in keys:
+            del entries[key]
+        return len(keys)
+
+def cached_dataset_metadata(
+        key: Tuple[str, str, int], retrieve: Callable[[], Dict]) -> Dict:
+    """
+    Return the cached metadata of KEY, a (dataset type, dataset name,
+    threshold) tuple, calling RETRIEVE for it if it is not cached or has
+    expired.
+    """
+    with __metadata_cache["lock"]:
+        entry = __metadata_cache["entries"].get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+    metadata = retrieve()
+    with __metadata_cache["lock"]:
+        if __metadata_cache["ttl"] > 0:
+            __metadata_cache["entries"][key] = (
+                time.monotonic() + __metadata_cache["ttl"], metadata)
+    return metadata
+
+def warm_dataset_metadata_cache(threshold: int, conn: Any) -> int:
+    """
+    Cache the metadata of all the `ProbeSet`, `Publish` and `Geno` datasets
+    above THRESHOLD under each of their names, with one query per dataset
+    type. Returns the number of entries cached.
+    """
+    entries: Dict[Tuple[str, str, int], Dict] = {}
+    for (dataset_type, (columns, tables, joins)) in (
+            DATASET_METADATA_SOURCES.items()):
+        freeze_table = tables.split(",", maxsplit=1)[0]
+        query = (
+            "SELECT "
+            + ", ".join(f"{freeze_table}.{column}" for column in columns)
+            + f", InbredSet.Name, InbredSet.Id FROM {tables} "
+            f"WHERE {freeze_table}.public > %(threshold)s AND {joins}")
+        with conn.cursor() as cursor:
+            cursor.execute(query, {"threshold": threshold})
+            for row in cursor.fetchall():
+                metadata = with_riset_fields(
+                    dict(zip(
+                        ["dataset_id", "dataset_name", "dataset_fullname",
+                         "dataset_shortname", "dataset_datascale"],
+                        row[:len(columns)])),
+                    dict(zip(["riset", "risetid"], row[len(columns):])))
+                for name in row[1:4]:
+                    if name:
+                        entries.setdefault(
+                            (dataset_type, name, threshold), metadata)
+    with __metadata_cache["lock"]:
+        if __metadata_cache["ttl"] > 0:
+            expires = time.monotonic() + __metadata_cache["ttl"]
+            __metadata_cache["entries"].update(
+                {key: (expires, metadata)
+                 for (key, metadata) in entries.items()})
+    return len(entries)
+
 def retrieve_trait_dataset(trait_type, trait, threshold, conn):
     """
     Retrieve the dataset that relates to a specific trait.
@@ -274,18 +450,68 @@ def retrieve_trait_dataset(trait_type, trait, threshold, conn):
         "Publish": retrieve_publish_trait_dataset,
         "ProbeSet": retrieve_probeset_trait_dataset
     }
-    dataset_name_info = {
-        "dataset_id": None,
-        "dataset_name": trait["db"]["dataset_name"],
-        **retrieve_dataset_name(
-            trait_type, threshold, trait["trait_name"],
-            trait["db"]["dataset_name"], conn)
-    }
-    riset = retrieve_riset_fields(
-        trait_type, trait["trait_name"], dataset_name_info, conn)
+
+    def retrieve_metadata():
+        dataset_name_info = {
+            "dataset_id": None,
+            "dataset_name": trait["db"]["dataset_name"],
+            **retrieve_dataset_name(
+                trait_type, threshold, trait["trait_name"],
+                trait["db"]["dataset_name"], conn)
+        }
+        return retrieve_riset_fields(
+            trait_type, trait["trait_name"], dataset_name_info, conn)
+
+    # The metadata of `Temp` datasets is that of each trait
+    metadata = (retrieve_metadata() if trait_type == "Temp" else
+                cached_dataset_metadata(
+                    (trait_type, trait["db"]["dataset_name"], threshold),
+                    retrieve_metadata))
     return {
-        "display_name": dataset_name_info["dataset_name"],
-        **dataset_name_info,
+        "display_name": metadata["dataset_name"],
+        **metadata,
         **dataset_fns[trait_type](),
-        **riset
+        **metadata
     }
+
+def retrieve_dataset_trait_names(
+        dataset_type: str, dataset_name: str, conn: Any) -> List:
+    """
+    Retrieve the names of all the traits in the `ProbeSet`, `Publish` or
+    `Geno` dataset named DATASET_NAME, without their data.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            DATASET_TRAIT_NAMES_QUERIES[dataset_type],
+            {"dataset_name": dataset_name})
+        return [row[0] for row in cursor.fetchall()]
+    return []
+
+def retrieve_dataset_data_chunks(
+        dataset_type: str, dataset_name: str, conn: Any,
+        strain_names: Optional[Sequence[str]] = None,
+        fetch_size: int = FETCH_SIZE) -> Iterator[Sequence[Tuple]]:
+    """
+    Stream the (trait name, strain name, value) rows of all the traits in the
+    `ProbeSet`, `Publish` or `Geno` dataset named DATASET_NAME, of the
+    STRAIN_NAMES only if given, FETCH_SIZE rows at a time. The rows are read
+    with an unbuffered server side cursor, so the client never holds more than
+    one chunk of them; the connection runs no other query until they are all
+    read.
+    """
+    query = DATASET_DATA_QUERIES[dataset_type]
+    params = {"dataset_name": dataset_name}
+    if strain_names is not None:
+        if not strain_names:
+            return
+        placeholders = ", ".join(
+            f"%(strain{idx})s" for idx in range(len(strain_names)))
+        query = f"{query} AND Strain.Name IN ({placeholders})"
+        params.update({f"strain{idx}": strain_name
+                       for (idx, strain_name) in enumerate(strain_names)})
+    with conn.cursor(SSCursor) as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(fetch_size)
+        while rows:
+            yield rows
+            rows = cursor.fetchmany(fetch_size)
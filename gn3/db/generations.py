@@ -0,0 +1,98 @@
+"""This module contains the dataset generation counters: a number per dataset
+that the write paths in `gn3.db` bump in the same transaction as the write.
+Caches of dataset data include the generation in their keys, so an edit is
+never hidden by data cached before it
+
+"""
+from typing import Any, Dict
+
+# The tables joining a strain to the datasets of the RISets it belongs to
+STRAIN_DATASETS = "Strain JOIN StrainXRef ON StrainXRef.StrainId = Strain.Id "
+
+# How to find the datasets a row of an edited table belongs to: for each type
+# of dataset the row may belong to, the dataset type, the tables joining the
+# row to its datasets and the dataset name column
+DATASET_GENERATION_SOURCES = {
+    "Phenotype": ((
+        "Publish",
+        "Phenotype JOIN PublishXRef ON PublishXRef.PhenotypeId = Phenotype.Id "
+        "JOIN PublishFreeze "
+        "ON PublishFreeze.InbredSetId = PublishXRef.InbredSetId",
+        "PublishFreeze.Name"),),
+    "Publication": ((
+        "Publish",
+        "Publication JOIN PublishXRef "
+        "ON PublishXRef.PublicationId = Publication.Id "
+        "JOIN PublishFreeze "
+        "ON PublishFreeze.InbredSetId = PublishXRef.InbredSetId",
+        "PublishFreeze.Name"),),
+    "PublishXRef": ((
+        "Publish",
+        "PublishXRef JOIN PublishFreeze "
+        "ON PublishFreeze.InbredSetId = PublishXRef.InbredSetId",
+        "PublishFreeze.Name"),),
+    "PublishData": ((
+        "Publish",
+        "PublishData JOIN PublishXRef ON PublishXRef.DataId = PublishData.Id "
+        "JOIN PublishFreeze "
+        "ON PublishFreeze.InbredSetId = PublishXRef.InbredSetId",
+        "PublishFreeze.Name"),),
+    "ProbeSet": ((
+        "ProbeSet",
+        "ProbeSet JOIN ProbeSetXRef ON ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+        "JOIN ProbeSetFreeze "
+        "ON ProbeSetFreeze.Id = ProbeSetXRef.ProbeSetFreezeId",
+        "ProbeSetFreeze.Name"),),
+    # The matrices and indexes of every dataset are keyed by strain name, so
+    # renaming a strain changes all the datasets holding it
+    "Strain": (
+        ("ProbeSet",
+         STRAIN_DATASETS + "JOIN ProbeFreeze "
+         "ON ProbeFreeze.InbredSetId = StrainXRef.InbredSetId "
+         "JOIN ProbeSetFreeze "
+         "ON ProbeSetFreeze.ProbeFreezeId = ProbeFreeze.Id",
+         "ProbeSetFreeze.Name"),
+        ("Publish",
+         STRAIN_DATASETS + "JOIN PublishFreeze "
+         "ON PublishFreeze.InbredSetId = StrainXRef.InbredSetId",
+         "PublishFreeze.Name"),
+        ("Geno",
+         STRAIN_DATASETS + "JOIN GenoFreeze "
+         "ON GenoFreeze.InbredSetId = StrainXRef.InbredSetId",
+         "GenoFreeze.Name")),
+}
+
+
+def bump_dataset_generations(cursor: Any, table: str,
+                             where: Dict[str, Any]) -> int:
+    """Bump the generation of every dataset that the rows of TABLE matching
+    WHERE, a dict of column names to values, belong to. Run it with the
+    cursor of the write so both are committed together. Tables that hold no
+    dataset data are ignored. Returns the number of rows changed"""
+    if table not in DATASET_GENERATION_SOURCES or not where:
+        return 0
+    rowcount = 0
+    for (dataset_type, source, name_column) in (
+            DATASET_GENERATION_SOURCES[table]):
+        sql = ("INSERT INTO dataset_generation "
+               "(dataset_type, dataset_name, generation) "
+               f"SELECT DISTINCT %s, {name_column}, 1 FROM {source} WHERE ")
+        sql += " AND ".join(
+            f"{table}.{column} = %s" for column in where.keys())
+        sql += " ON DUPLICATE KEY UPDATE generation = generation + 1"
+        cursor.execute(sql, (dataset_type,) + tuple(where.values()))
+        rowcount += cursor.rowcount
+    return rowcount
+
+
+def retrieve_dataset_generation(conn: Any, dataset_type: str,
+                                dataset_name: str) -> int:
+    """Return the generation of a dataset, 0 for a dataset never edited"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT generation FROM dataset_generation "
+            "WHERE dataset_type = %s AND dataset_name = %s",
+            (dataset_type, dataset_name))
+        result = cursor.fetchone()
+        return result[0] if result else 0
+    return 0
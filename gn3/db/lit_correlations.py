@@ -0,0 +1,44 @@
+"""This module contains the queries of the literature correlation table
+LCorrRamin3, a static table of (GeneId1, GeneId2, value) rows of mouse gene
+ids
+
+"""
+from typing import Any, Iterator, Optional, Sequence, Tuple
+
+from MySQLdb.cursors import SSCursor
+
+# Number of LCorrRamin3 rows fetched at a time
+FETCH_SIZE = 100000
+
+
+def retrieve_lit_correlation_checksum(conn: Any) -> Optional[int]:
+    """Return the checksum of the LCorrRamin3 table, None if it does not
+    exist"""
+    with conn.cursor() as cursor:
+        cursor.execute("CHECKSUM TABLE LCorrRamin3")
+        row = cursor.fetchone()
+        return None if row is None else row[1]
+
+
+def retrieve_lit_correlation_count(conn: Any) -> int:
+    """Return the number of rows of the LCorrRamin3 table, which MyISAM
+    keeps without counting them"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM LCorrRamin3")
+        row = cursor.fetchone()
+        return 0 if row is None else int(row[0])
+
+
+def retrieve_lit_correlation_chunks(
+        conn: Any,
+        fetch_size: int = FETCH_SIZE) -> Iterator[Sequence[Tuple[int, int,
+                                                                 float]]]:
+    """Yield the (GeneId1, GeneId2, value) rows of LCorrRamin3 FETCH_SIZE at a
+    time, read with an unbuffered server side cursor, so the client never
+    holds more than one chunk of them"""
+    with conn.cursor(SSCursor) as cursor:
+        cursor.execute("SELECT GeneId1, GeneId2, value FROM LCorrRamin3")
+        rows = cursor.fetchmany(fetch_size)
+        while rows:
+            yield rows
+            rows = cursor.fetchmany(fetch_size)
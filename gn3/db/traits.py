@@ -1,7 +1,45 @@
 """This class contains functions relating to trait data manipulation"""
-from typing import Any, Dict, Union, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
 from gn3.function_helpers import compose
 from gn3.db.datasets import retrieve_trait_dataset
+from gn3.db.generations import bump_dataset_generations
+
+
+# The columns of the information of the traits of each type, the first one
+# naming the trait
+PUBLISH_TRAIT_INFO_KEYS = (
+    "Id", "PubMed_ID", "Pre_publication_description",
+    "Post_publication_description", "Original_description",
+    "Pre_publication_abbreviation", "Post_publication_abbreviation",
+    "Lab_code", "Submitter", "Owner", "Authorized_Users", "Authors",
+    "Title", "Abstract", "Journal", "Volume", "Pages", "Month", "Year",
+    "Sequence", "Units", "comments")
+PUBLISH_TRAIT_INFO_COLUMNS = (
+    "PublishXRef.Id, Publication.PubMed_ID, "
+    "Phenotype.Pre_publication_description, "
+    "Phenotype.Post_publication_description, "
+    "Phenotype.Original_description, "
+    "Phenotype.Pre_publication_abbreviation, "
+    "Phenotype.Post_publication_abbreviation, "
+    "Phenotype.Lab_code, Phenotype.Submitter, Phenotype.Owner, "
+    "Phenotype.Authorized_Users, CAST(Publication.Authors AS BINARY), "
+    "Publication.Title, Publication.Abstract, Publication.Journal, "
+    "Publication.Volume, Publication.Pages, Publication.Month, "
+    "Publication.Year, PublishXRef.Sequence, Phenotype.Units, "
+    "PublishXRef.comments")
+PROBESET_TRAIT_INFO_KEYS = (
+    "name", "symbol", "description", "probe_target_description", "chr",
+    "mb", "alias", "geneid", "genbankid", "unigeneid", "omim",
+    "refseq_transcriptid", "blatseq", "targetseq", "chipid", "comments",
+    "strand_probe", "strand_gene", "probe_set_target_region", "proteinid",
+    "probe_set_specificity", "probe_set_blat_score",
+    "probe_set_blat_mb_start", "probe_set_blat_mb_end", "probe_set_strand",
+    "probe_set_note_by_rw", "flag")
+GENO_TRAIT_INFO_KEYS = ("name", "chr", "mb", "source2", "sequence")
+TEMP_TRAIT_INFO_KEYS = ("name", "description")
 
 
 def get_trait_csv_sample_data(conn: Any,
@@ -34,6 +72,17 @@ def get_trait_csv_sample_data(conn: Any,
     return f"# Publish Data Id: {publishdata_id}\n\n" + "\n".join(csv_data)
 
 
+# The updates of the sample data of a `Publish` trait run by
+# `update_sample_data`
+STRAIN_ID_SQL: str = "UPDATE Strain SET Name = %s WHERE Id = %s"
+PUBLISH_DATA_SQL: str = ("UPDATE PublishData SET value = %s "
+                         "WHERE StrainId = %s AND Id = %s")
+PUBLISH_SE_SQL: str = ("UPDATE PublishSE SET error = %s "
+                       "WHERE StrainId = %s AND DataId = %s")
+N_STRAIN_SQL: str = ("UPDATE NStrain SET count = %s "
+                     "WHERE StrainId = %s AND DataId = %s")
+
+
 def update_sample_data(conn: Any,
                        strain_name: str,
                        strain_id: int,
@@ -42,16 +91,9 @@ def update_sample_data(conn: Any,
                        error: Union[int, float, str],
                        count: Union[int, str]):
     """Given the right parameters, update sample-data from the relevant
-    table."""
+    table. Renaming the strain changes every dataset holding it, so the
+    generations of all of them are bumped then."""
     # pylint: disable=[R0913, R0914]
-    STRAIN_ID_SQL: str = "UPDATE Strain SET Name = %s WHERE Id = %s"
-    PUBLISH_DATA_SQL: str = ("UPDATE PublishData SET value = %s "
-                             "WHERE StrainId = %s AND Id = %s")
-    PUBLISH_SE_SQL: str = ("UPDATE PublishSE SET error = %s "
-                           "WHERE StrainId = %s AND DataId = %s")
-    N_STRAIN_SQL: str = ("UPDATE NStrain SET count = %s "
-                         "WHERE StrainId = %s AND DataId = %s")
-
     updated_strains: int = 0
     updated_published_data: int = 0
     updated_se_data: int = 0
@@ -61,6 +103,8 @@ def update_sample_data(conn: Any,
         # Update the Strains table
         cursor.execute(STRAIN_ID_SQL, (strain_name, strain_id))
         updated_strains: int = cursor.rowcount
+        if updated_strains:
+            bump_dataset_generations(cursor, "Strain", {"Id": strain_id})
         # Update the PublishData table
         cursor.execute(PUBLISH_DATA_SQL,
                        (None if value == "x" else value,
@@ -76,6 +120,8 @@ def update_sample_data(conn: Any,
                        (None if count == "x" else count,
                         strain_id, publish_data_id))
         updated_n_strains: int = cursor.rowcount
+        bump_dataset_generations(cursor, "PublishData",
+                                 {"Id": publish_data_id})
     return (updated_strains, updated_published_data,
             updated_se_data, updated_n_strains)
 
@@ -83,26 +129,8 @@ def retrieve_publish_trait_info(trait_data_source: Dict[str, Any], conn: Any):
     """Retrieve trait information for type `Publish` traits.
 
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L399-L421"""
-    keys = (
-        "Id", "PubMed_ID", "Pre_publication_description",
-        "Post_publication_description", "Original_description",
-        "Pre_publication_abbreviation", "Post_publication_abbreviation",
-        "Lab_code", "Submitter", "Owner", "Authorized_Users", "Authors",
-        "Title", "Abstract", "Journal", "Volume", "Pages", "Month", "Year",
-        "Sequence", "Units", "comments")
-    columns = (
-        "PublishXRef.Id, Publication.PubMed_ID, "
-        "Phenotype.Pre_publication_description, "
-        "Phenotype.Post_publication_description, "
-        "Phenotype.Original_description, "
-        "Phenotype.Pre_publication_abbreviation, "
-        "Phenotype.Post_publication_abbreviation, "
-        "Phenotype.Lab_code, Phenotype.Submitter, Phenotype.Owner, "
-        "Phenotype.Authorized_Users, CAST(Publication.Authors AS BINARY), "
-        "Publication.Title, Publication.Abstract, Publication.Journal, "
-        "Publication.Volume, Publication.Pages, Publication.Month, "
-        "Publication.Year, PublishXRef.Sequence, Phenotype.Units, "
-        "PublishXRef.comments")
+    keys = PUBLISH_TRAIT_INFO_KEYS
+    columns = PUBLISH_TRAIT_INFO_COLUMNS
     query = (
         "SELECT "
         "{columns} "
@@ -139,14 +167,7 @@ def retrieve_probeset_trait_info(trait_data_source: Dict[str, Any], conn: Any):
     """Retrieve trait information for type `ProbeSet` traits.
 
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L424-L435"""
-    keys = (
-        "name", "symbol", "description", "probe_target_description", "chr",
-        "mb", "alias", "geneid", "genbankid", "unigeneid", "omim",
-        "refseq_transcriptid", "blatseq", "targetseq", "chipid", "comments",
-        "strand_probe", "strand_gene", "probe_set_target_region", "proteinid",
-        "probe_set_specificity", "probe_set_blat_score",
-        "probe_set_blat_mb_start", "probe_set_blat_mb_end", "probe_set_strand",
-        "probe_set_note_by_rw", "flag")
+    keys = PROBESET_TRAIT_INFO_KEYS
     query = (
         "SELECT "
         "{columns} "
@@ -171,7 +192,7 @@ def retrieve_geno_trait_info(trait_data_source: Dict[str, Any], conn: Any):
     """Retrieve trait information for type `Geno` traits.
 
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L438-L449"""
-    keys = ("name", "chr", "mb", "source2", "sequence")
+    keys = GENO_TRAIT_INFO_KEYS
     query = (
         "SELECT "
         "{columns} "
@@ -195,7 +216,7 @@ def retrieve_temp_trait_info(trait_data_source: Dict[str, Any], conn: Any):
     """Retrieve trait information for type `Temp` traits.
 
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L450-452"""
-    keys = ("name", "description")
+    keys = TEMP_TRAIT_INFO_KEYS
     query = (
         "SELECT {columns} FROM Temp "
         "WHERE Name = %(trait_name)s").format(columns=", ".join(keys))
@@ -424,6 +445,171 @@ def retrieve_trait_info(
         }
     return trait_info
 
+def __placeholders(values: Sequence) -> str:
+    """The `%s` placeholders of an IN list of VALUES"""
+    return ", ".join(["%s"] * len(values))
+
+def __retrieve_info_rows(query: str, params: Sequence, keys: Sequence[str],
+                         conn: Any) -> Dict[str, Dict]:
+    """Run a trait information QUERY returning the information of each trait
+    by its lowercase name, the first column, as the single trait queries match
+    names. The first row of a trait is used, as `fetchone` does"""
+    with conn.cursor() as cursor:
+        cursor.execute(query, tuple(params))
+        infos: Dict[str, Dict] = {}
+        for row in cursor.fetchall():
+            infos.setdefault(str(row[0]).lower(), dict(zip(keys, row)))
+        return infos
+
+def retrieve_publish_traits_info(
+        trait_names: Sequence[str], trait_dataset_id: Any,
+        conn: Any) -> Dict[str, Dict]:
+    """Bulk `retrieve_publish_trait_info` for the traits of one dataset"""
+    query = (
+        f"SELECT {PUBLISH_TRAIT_INFO_COLUMNS} "
+        "FROM PublishXRef, Publication, Phenotype, PublishFreeze "
+        f"WHERE PublishXRef.Id IN ({__placeholders(trait_names)}) "
+        "AND Phenotype.Id = PublishXRef.PhenotypeId "
+        "AND Publication.Id = PublishXRef.PublicationId "
+        "AND PublishXRef.InbredSetId = PublishFreeze.InbredSetId "
+        "AND PublishFreeze.Id = %s")
+    return __retrieve_info_rows(
+        query, (*trait_names, trait_dataset_id),
+        [key.lower() for key in PUBLISH_TRAIT_INFO_KEYS], conn)
+
+def retrieve_probeset_traits_info(
+        trait_names: Sequence[str], trait_dataset_name: str,
+        conn: Any) -> Dict[str, Dict]:
+    """Bulk `retrieve_probeset_trait_info` for the traits of one dataset"""
+    query = (
+        "SELECT "
+        + ", ".join(f"ProbeSet.{key}" for key in PROBESET_TRAIT_INFO_KEYS)
+        + " FROM ProbeSet, ProbeSetFreeze, ProbeSetXRef "
+        "WHERE ProbeSetXRef.ProbeSetFreezeId = ProbeSetFreeze.Id "
+        "AND ProbeSetXRef.ProbeSetId = ProbeSet.Id "
+        "AND ProbeSetFreeze.Name = %s "
+        f"AND ProbeSet.Name IN ({__placeholders(trait_names)})")
+    return __retrieve_info_rows(
+        query, (trait_dataset_name, *trait_names), PROBESET_TRAIT_INFO_KEYS,
+        conn)
+
+def retrieve_geno_traits_info(
+        trait_names: Sequence[str], trait_dataset_name: str,
+        conn: Any) -> Dict[str, Dict]:
+    """Bulk `retrieve_geno_trait_info` for the traits of one dataset"""
+    query = (
+        "SELECT "
+        + ", ".join(f"Geno.{key}" for key in GENO_TRAIT_INFO_KEYS)
+        + " FROM Geno, GenoFreeze, GenoXRef "
+        "WHERE GenoXRef.GenoFreezeId = GenoFreeze.Id "
+        "AND GenoXRef.GenoId = Geno.Id "
+        "AND GenoFreeze.Name = %s "
+        f"AND Geno.Name IN ({__placeholders(trait_names)})")
+    return __retrieve_info_rows(
+        query, (trait_dataset_name, *trait_names), GENO_TRAIT_INFO_KEYS, conn)
+
+def retrieve_temp_traits_info(
+        trait_names: Sequence[str], _trait_dataset_name: str,
+        conn: Any) -> Dict[str, Dict]:
+    """Bulk `retrieve_temp_trait_info`"""
+    query = (
+        f"SELECT {', '.join(TEMP_TRAIT_INFO_KEYS)} FROM Temp "
+        f"WHERE Name IN ({__placeholders(trait_names)})")
+    return __retrieve_info_rows(
+        query, trait_names, TEMP_TRAIT_INFO_KEYS, conn)
+
+def retrieve_homologene_ids(
+        gene_ids: Sequence[Any], riset: str, conn: Any) -> Dict[str, Any]:
+    """Bulk `set_homologene_id_field_probeset`: the homologene ids of the gene
+    ids of the species of RISET"""
+    gene_ids = [gene_id for gene_id in set(gene_ids) if gene_id is not None]
+    if not gene_ids:
+        return {}
+    query = (
+        "SELECT Homologene.GeneId, HomologeneId "
+        "FROM Homologene, Species, InbredSet "
+        f"WHERE Homologene.GeneId IN ({__placeholders(gene_ids)}) "
+        "AND InbredSet.Name = %s "
+        "AND InbredSet.SpeciesId = Species.Id "
+        "AND Species.TaxonomyId = Homologene.TaxonomyId")
+    with conn.cursor() as cursor:
+        cursor.execute(query, (*gene_ids, riset))
+        homologene_ids: Dict[str, Any] = {}
+        for (gene_id, homologene_id) in cursor.fetchall():
+            homologene_ids.setdefault(str(gene_id), homologene_id)
+        return homologene_ids
+
+def retrieve_traits_info(
+        threshold: int, trait_full_names: Sequence[str], conn: Any,
+        qtl=None) -> List[Dict]:
+    """Bulk `retrieve_trait_info`: retrieve the information of many traits
+    returning the same dicts, in the order of TRAIT_FULL_NAMES.
+
+    The dataset of each dataset name (of each trait for `Temp` traits) is
+    retrieved once, the information of the traits of each dataset with one
+    query and the homologene ids of the `ProbeSet` traits with one query per
+    RISet. The sequence of a `ProbeSet` trait is the `blatseq` of its
+    information, which `retrieve_probeset_sequence` queries again."""
+    # pylint: disable=[R0914]
+    traits = [build_trait_name(name) for name in trait_full_names]
+    info_functions_table = {
+        "Publish": lambda names, dataset: retrieve_publish_traits_info(
+            names, dataset["dataset_id"], conn),
+        "ProbeSet": lambda names, dataset: retrieve_probeset_traits_info(
+            names, dataset["dataset_name"], conn),
+        "Geno": lambda names, dataset: retrieve_geno_traits_info(
+            names, dataset["dataset_name"], conn),
+        "Temp": lambda names, dataset: retrieve_temp_traits_info(
+            names, dataset["dataset_name"], conn)
+    }
+
+    def dataset_key(trait):
+        return (trait["db"]["dataset_type"], trait["db"]["dataset_name"],
+                trait["trait_name"] if trait["db"]["dataset_type"] == "Temp"
+                else None)
+
+    groups: Dict[Tuple, List[Dict]] = {}
+    for trait in traits:
+        groups.setdefault(dataset_key(trait), []).append(trait)
+    (datasets, infos) = ({}, {})
+    for (key, group) in groups.items():
+        datasets[key] = retrieve_trait_dataset(key[0], group[0], threshold,
+                                               conn)
+        infos[key] = info_functions_table[key[0]](
+            list({trait["trait_name"]: None for trait in group}),
+            datasets[key])
+    homologene_ids: Dict[str, Dict[str, Any]] = {}
+    for (key, group) in groups.items():
+        if key[0] == "ProbeSet":
+            homologene_ids.setdefault(datasets[key]["riset"], {})
+    for riset in homologene_ids:
+        homologene_ids[riset] = retrieve_homologene_ids(
+            [info.get("geneid") for (key, dataset_infos) in infos.items()
+             if key[0] == "ProbeSet" and datasets[key]["riset"] == riset
+             for info in dataset_infos.values()],
+            riset, conn)
+
+    def trait_info(trait):
+        key = dataset_key(trait)
+        (trait_type, trait_dataset) = (key[0], datasets[key])
+        info = set_haveinfo_field(
+            infos[key].get(trait["trait_name"].lower(), {}))
+        if not info["haveinfo"]:
+            return info
+        info = {"trait_type": trait_type,
+                **trait, **info, "riset": trait_dataset["riset"]}
+        info = {**info, "homologeneid": (
+            homologene_ids[trait_dataset["riset"]].get(str(info["geneid"]))
+            if trait_type == "ProbeSet" else None)}
+        info = load_qtl_info(qtl, trait_type, info, conn)
+        if trait_type == "Publish":
+            info = set_confidential_field(trait_type, info)
+        if trait_type == "ProbeSet":
+            info = {**info, "sequence": info["blatseq"]}
+        return {**info, "db": {**trait["db"], **trait_dataset}}
+
+    return [trait_info(trait) for trait in traits]
+
 def retrieve_temp_trait_data(trait_info: dict, conn: Any):
     """
     Retrieve trait data for `Temp` traits.
@@ -591,8 +777,9 @@ def with_strainlist_data_setup(strainlist: Sequence[str]):
       strain's value, variance and ndata values, only if the strain is present
       in the provided `strainlist` variable.
     """
+    strains = frozenset(strainlist)
     def setup_fn(tdata):
-        if tdata["strain_name"] in strainlist:
+        if tdata["strain_name"] in strains:
             val = tdata["value"]
             if val is not None:
                 return {
@@ -624,6 +811,139 @@ def without_strainlist_data_setup():
         return None
     return setup_fn
 
+class TraitData:
+    """
+    The data of a trait as aligned columns: the names of its strains, an
+    index of their positions, and arrays of their values, variances and
+    ndata, with NaN where the database has none.
+    """
+    __slots__ = ("mysqlid", "strain_names", "strain_index", "values",
+                 "variances", "ndata")
+
+    def __init__(
+            self, mysqlid: Any, strain_names: Sequence[str],
+            values: Sequence, variances: Sequence, ndata: Sequence):
+        # pylint: disable=[R0913]
+        self.mysqlid = mysqlid
+        self.strain_names = list(strain_names)
+        # `from_rows` and `from_dict` give each strain once
+        self.strain_index = {
+            strain: idx for idx, strain in enumerate(self.strain_names)}
+        self.values = np.array(values, dtype=float)
+        self.variances = np.array(variances, dtype=float)
+        self.ndata = np.array(ndata, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.strain_names)
+
+    def __contains__(self, strain: str) -> bool:
+        return strain in self.strain_index
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict],
+                  strainlist: Sequence[str] = tuple()) -> "TraitData":
+        """
+        Build the data of a trait from the rows of one of the
+        `retrieve_*_trait_data` functions, keeping the rows with a value, of
+        the strains in `strainlist` only if it is given. The last row of a
+        strain is its data, as in `retrieve_trait_data`.
+        """
+        strains = frozenset(strainlist)
+        kept = list({
+            row["strain_name"]: row for row in rows
+            if row["value"] is not None and (
+                not strains or row["strain_name"] in strains)}.values())
+        return cls(
+            rows[0]["id"] if rows else None,
+            [row["strain_name"] for row in kept],
+            [row["value"] for row in kept],
+            [row["se_error"] for row in kept],
+            [row.get("nstrain", None) for row in kept])
+
+    @classmethod
+    def from_dict(cls, trait_data: Dict) -> "TraitData":
+        """
+        Build the data of a trait from the dict form returned by
+        `retrieve_trait_data`.
+        """
+        data = trait_data.get("data", {})
+        return cls(
+            trait_data.get("mysqlid"), list(data),
+            [item["value"] for item in data.values()],
+            [item["variance"] for item in data.values()],
+            [item["ndata"] for item in data.values()])
+
+    def align(self, strainlist: Sequence[str]) -> Tuple[
+            np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return whether the trait has data for each strain of `strainlist`,
+        and its values, variances and ndata in the order of `strainlist`,
+        NaN for the strains it has no data for.
+        """
+        indices = np.fromiter(
+            (self.strain_index.get(strain, -1) for strain in strainlist),
+            dtype=np.intp, count=len(strainlist))
+        present = indices >= 0
+
+        def column(array):
+            aligned = np.full(len(indices), np.nan)
+            aligned[present] = array[indices[present]]
+            return aligned
+
+        return (present, column(self.values), column(self.variances),
+                column(self.ndata))
+
+    def as_dict(self) -> Dict:
+        """
+        Return the data in the dict form returned by `retrieve_trait_data`,
+        with the values and variances as floats and the ndata as ints rather
+        than the types the database driver returns.
+        """
+        def item(array, idx, integer=False):
+            return None if np.isnan(array[idx]) else (
+                int(array[idx]) if integer else float(array[idx]))
+
+        return {
+            "mysqlid": self.mysqlid,
+            "data": {
+                strain: {
+                    "strain_name": strain,
+                    "value": item(self.values, idx),
+                    "variance": item(self.variances, idx),
+                    "ndata": item(self.ndata, idx, integer=True)
+                } for strain, idx in self.strain_index.items()}}
+
+def retrieve_trait_data_rows(trait: dict, conn: Any):
+    """
+    Retrieve the rows of a trait's data with the `retrieve_*_trait_data`
+    function for its dataset type.
+    """
+    # I do not like this section, but it retains the flow in the old codebase
+    if trait["db"]["dataset_type"] == "Temp":
+        return retrieve_temp_trait_data(trait, conn)
+    if trait["db"]["dataset_type"] == "Publish":
+        return retrieve_publish_trait_data(trait, conn)
+    if trait["cellid"]:
+        return retrieve_cellid_trait_data(trait, conn)
+    if trait["db"]["dataset_type"] == "ProbeSet":
+        return retrieve_probeset_trait_data(trait, conn)
+    return retrieve_geno_trait_data(trait, conn)
+
+def retrieve_columnar_trait_data(
+        trait: dict, conn: Any,
+        strainlist: Sequence[str] = tuple()) -> Optional[TraitData]:
+    """
+    Retrieve trait data as a `TraitData`, None if the trait has none
+
+    DESCRIPTION
+    Retrieve trait data as is done in
+    https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L258-L386
+    """
+    results = retrieve_trait_data_rows(trait, conn)
+    if results:
+        return TraitData.from_rows(results, strainlist)
+    return None
+
 def retrieve_trait_data(trait: dict, conn: Any, strainlist: Sequence[str] = tuple()):
     """
     Retrieve trait data
@@ -632,18 +952,7 @@ def retrieve_trait_data(trait: dict, conn: Any, strainlist: Sequence[str] = tupl
     Retrieve trait data as is done in
     https://github.com/genenetwork/genenetwork1/blob/master/web/webqtl/base/webqtlTrait.py#L258-L386
     """
-    # I do not like this section, but it retains the flow in the old codebase
-    if trait["db"]["dataset_type"] == "Temp":
-        results = retrieve_temp_trait_data(trait, conn)
-    elif trait["db"]["dataset_type"] == "Publish":
-        results = retrieve_publish_trait_data(trait, conn)
-    elif trait["cellid"]:
-        results = retrieve_cellid_trait_data(trait, conn)
-    elif trait["db"]["dataset_type"] == "ProbeSet":
-        results = retrieve_probeset_trait_data(trait, conn)
-    else:
-        results = retrieve_geno_trait_data(trait, conn)
-
+    results = retrieve_trait_data_rows(trait, conn)
     if results:
         # do something with mysqlid
         mysqlid = results[0]["id"]
@@ -660,9 +969,5 @@ def retrieve_trait_data(trait: dict, conn: Any, strainlist: Sequence[str] = tupl
 
         return {
             "mysqlid": mysqlid,
-            "data": dict(map(
-                lambda x: (
-                    x["strain_name"],
-                    {k:v for k, v in x.items() if x != "strain_name"}),
-                data))}
+            "data": {item["strain_name"]: item for item in data}}
     return {}
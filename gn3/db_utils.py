@@ -1,9 +1,46 @@
-"""module contains all db related stuff"""
+"""module contains all db related stuff
+
+Connections are taken from a per process pool of at most DB_POOL_SIZE
+connections. `database_connector` returns a connection whose `close` gives it
+back to the pool, so the callers and the `gn3.db` helpers they pass it to are
+the same with or without the pool. A connection is pinged before it is handed
+out and closed instead of reused when it has been idle for more than
+DB_POOL_MAX_IDLE_TIME seconds; connections inherited from a parent process are
+never used nor closed by the child."""
+import os
+import threading
+import time
+from collections import deque
+
+from typing import Any
+from typing import Dict
+from typing import Optional
 from typing import Tuple
 from urllib.parse import urlparse
 import MySQLdb as mdb
+from flask import g
+from flask import has_app_context
+from gn3.exceptions import DatabasePoolTimeout
+from gn3.settings import DB_POOL_MAX_IDLE_TIME
+from gn3.settings import DB_POOL_SIZE
+from gn3.settings import DB_POOL_TIMEOUT
 from gn3.settings import SQL_URI
 
+__pool_state: Dict[str, Any] = {
+    "size": DB_POOL_SIZE,
+    "timeout": DB_POOL_TIMEOUT,
+    "max_idle_time": DB_POOL_MAX_IDLE_TIME,
+    # (connection, time it was given back) of the free connections
+    "idle": deque(),
+    "in_use": 0,
+    # Connections of the parent process: closing them would end the parent's
+    # sessions, so they are kept from being garbage collected instead
+    "inherited": [],
+    "stats": {"checkouts": 0, "connects": 0, "reuses": 0, "recycled": 0,
+              "dead": 0, "waits": 0, "timeouts": 0},
+    "condition": threading.Condition()
+}
+
 
 def parse_db_url() -> Tuple:
     """function to parse SQL_URI env variable note:there\
@@ -14,10 +51,182 @@ def parse_db_url() -> Tuple:
             parsed_db.password, parsed_db.path[1:])
 
 
+class PooledConnection:
+    """A connection of the pool: every attribute but `close` is the
+    connection's own, and `close` gives the connection back to the pool, as
+    does leaving a `with` block on it"""
+
+    def __init__(self, connection: Any):
+        self._connection = connection
+        self._pid = os.getpid()
+
+    def __getattr__(self, name: str) -> Any:
+        if self._connection is None:
+            raise mdb.InterfaceError("The connection was given back")
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """Give the connection back to the pool, once"""
+        if self._connection is not None:
+            (connection, self._connection) = (self._connection, None)
+            release_connection(connection, self._pid)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, *_exc_info: Any) -> None:
+        self.close()
+
+
+def __reset_pool() -> None:
+    """Forget the connections of the parent process in a forked child"""
+    __pool_state["inherited"].extend(
+        connection for (connection, _returned_at) in __pool_state["idle"])
+    __pool_state.update({"idle": deque(), "in_use": 0,
+                         "condition": threading.Condition()})
+
+
+os.register_at_fork(after_in_child=__reset_pool)
+
+
+def configure_db_pool(size: int = DB_POOL_SIZE,
+                      timeout: float = DB_POOL_TIMEOUT,
+                      max_idle_time: float = DB_POOL_MAX_IDLE_TIME) -> None:
+    """Set the number of connections of the pool, how long to wait for a
+    free one and how long one can stay idle, closing the idle connections.
+    A size of 0 opens a new connection every time"""
+    with __pool_state["condition"]:
+        for (connection, _returned_at) in __pool_state["idle"]:
+            __close_quietly(connection)
+        __pool_state.update({"size": size, "timeout": timeout,
+                             "max_idle_time": max_idle_time,
+                             "idle": deque()})
+        __pool_state["condition"].notify_all()
+
+
+def __close_quietly(connection: Any) -> None:
+    """Close a connection ignoring the errors of a dead one"""
+    try:
+        connection.close()
+    except mdb.Error:
+        pass
+
+
+def __is_alive(connection: Any) -> bool:
+    """Whether a connection still reaches the database"""
+    try:
+        connection.ping()
+        return True
+    except mdb.Error:
+        return False
+
+
+def __count(stat: str) -> None:
+    """Add one to a usage counter of the pool"""
+    with __pool_state["condition"]:
+        __pool_state["stats"][stat] += 1
+
+
+def __take_idle_connection() -> Any:
+    """Return a live idle connection of the pool, None if there is none,
+    closing the stale and dead ones. The connections are taken from the pool
+    holding its condition and pinged without it, so other threads do not wait
+    on the network"""
+    while True:
+        with __pool_state["condition"]:
+            if not __pool_state["idle"]:
+                return None
+            (connection, returned_at) = __pool_state["idle"].pop()
+        if time.monotonic() - returned_at > __pool_state["max_idle_time"]:
+            __count("recycled")
+        elif __is_alive(connection):
+            __count("reuses")
+            return connection
+        else:
+            __count("dead")
+        __close_quietly(connection)
+
+
+def acquire_connection() -> Any:
+    """Take a connection from the pool, opening one if none is idle and the
+    pool is not full. Waits DB_POOL_TIMEOUT seconds for one to be given back
+    when it is full, raising `DatabasePoolTimeout` if none is"""
+    condition = __pool_state["condition"]
+    with condition:
+        stats = __pool_state["stats"]
+        stats["checkouts"] += 1
+        if 0 < __pool_state["size"] <= __pool_state["in_use"]:
+            stats["waits"] += 1
+            if not condition.wait_for(
+                    lambda: __pool_state["in_use"] < __pool_state["size"],
+                    timeout=__pool_state["timeout"]):
+                stats["timeouts"] += 1
+                raise DatabasePoolTimeout(
+                    f"No database connection was free within "
+                    f"{__pool_state['timeout']} seconds")
+        __pool_state["in_use"] += 1
+    try:
+        connection = __take_idle_connection()
+        if connection is None:
+            host, user, passwd, db_name = parse_db_url()
+            connection = mdb.connect(host, user, passwd, db_name)
+            __count("connects")
+    except Exception:
+        with condition:
+            __pool_state["in_use"] -= 1
+            condition.notify()
+        raise
+    return connection
+
+
+def release_connection(connection: Any, pid: Optional[int] = None) -> None:
+    """Give a connection taken with `acquire_connection` by the process PID,
+    this one by default, back to the pool rolling back what it left
+    uncommitted. Connections beyond the size of the pool are closed, and those
+    of another process are left alone"""
+    if pid not in (None, os.getpid()):
+        __pool_state["inherited"].append(connection)
+        return
+    try:
+        connection.rollback()
+        reusable = True
+    except mdb.Error:
+        reusable = False
+    # The connection is idle before a waiter is woken up, so that the waiter
+    # reuses it instead of opening another one
+    with __pool_state["condition"]:
+        __pool_state["in_use"] = max(0, __pool_state["in_use"] - 1)
+        reusable = reusable and (
+            len(__pool_state["idle"]) < __pool_state["size"])
+        if reusable:
+            __pool_state["idle"].append((connection, time.monotonic()))
+        __pool_state["condition"].notify()
+    if not reusable:
+        __close_quietly(connection)
+
+
+def db_pool_stats() -> Dict[str, int]:
+    """Usage counters of this process' connection pool"""
+    with __pool_state["condition"]:
+        return {**__pool_state["stats"], "size": __pool_state["size"],
+                "in_use": __pool_state["in_use"],
+                "idle": len(__pool_state["idle"])}
+
+
 def database_connector() -> Tuple:
-    """function to create db connector"""
-    host, user, passwd, db_name = parse_db_url()
-    conn = mdb.connect(host, user, passwd, db_name)
+    """function to create db connector. The connection is taken from the
+    pool: closing it gives it back, as does the end of the flask app context
+    it was taken in"""
+    conn = PooledConnection(acquire_connection())
+    if has_app_context():
+        g.setdefault("db_connections", []).append(conn)
     cursor = conn.cursor()
 
     return (conn, cursor)
+
+
+def close_db_connections(_exception: Any = None) -> None:
+    """Flask teardown hook giving back the connections of the app context
+    that were not closed"""
+    for conn in g.pop("db_connections", []):
+        conn.close()
@@ -7,3 +7,7 @@ class FailedToQueue(Exception):
 
 class RedisConnectionError(ConnectionError):
     """Raised when there is no Redis connection"""
+
+
+class DatabasePoolTimeout(Exception):
+    """Raised when no database connection of the pool is free in time"""
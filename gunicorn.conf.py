@@ -0,0 +1,10 @@
+"""gunicorn configuration, loaded from the working directory by default. Only
+the server hooks of the application live here, the rest of the configuration
+is given on the command line"""
+from gn3.computations.process_pool import shutdown_pool
+
+
+def worker_exit(_server, _worker):
+    """Shut down the correlation process pool of a worker as it exits, e.g.
+    after `--max-requests`, so its pool processes do not outlive it"""
+    shutdown_pool()
@@ -0,0 +1,26 @@
+-- dataset_generation.sql ---
+
+-- This program is free software; you can redistribute it and/or
+-- modify it under the terms of the GNU General Public License
+-- as published by the Free Software Foundation; either version 3
+-- of the License, or (at your option) any later version.
+
+-- This program is distributed in the hope that it will be useful,
+-- but WITHOUT ANY WARRANTY; without even the implied warranty of
+-- MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+-- GNU General Public License for more details.
+
+-- You should have received a copy of the GNU General Public License
+-- along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+-- This table stores a generation number per dataset that is bumped, next to
+-- the metadata_audit entries, whenever the dataset's data is edited. Caches
+-- of dataset data include it in their keys.
+CREATE TABLE dataset_generation (
+    PRIMARY KEY (dataset_type, dataset_name),
+    dataset_type    VARCHAR(32)                             NOT NULL,
+    dataset_name    VARCHAR(255)                            NOT NULL,
+    generation      INTEGER       DEFAULT 0                 NOT NULL,
+    time_stamp      timestamp     DEFAULT CURRENT_TIMESTAMP
+                                  ON UPDATE CURRENT_TIMESTAMP NOT NULL
+) CHARACTER SET 'utf8mb4';
@@ -1,7 +1,14 @@
 """module contains integration tests for correlation"""
+import io
+import json
 from unittest import TestCase
 from unittest import mock
+
+import numpy as np
+
 from gn3.app import create_app
+from gn3.computations.columnar_data import save_columnar_sample_data
+from gn3.computations.pearson_index import build_pearson_index
 
 
 class CorrelationIntegrationTest(TestCase):
@@ -10,7 +17,7 @@ class CorrelationIntegrationTest(TestCase):
     def setUp(self):
         self.app = create_app().test_client()
 
-    @mock.patch("gn3.api.correlation.compute_all_sample_correlation")
+    @mock.patch("gn3.api.correlation.compute_vectorized_sample_correlation")
     def test_sample_r_correlation(self, mock_compute_samples):
         """Test /api/correlation/sample_r/{method}"""
         this_trait_data = {
@@ -61,6 +68,197 @@ class CorrelationIntegrationTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.get_json(), api_response)
 
+    @mock.patch("gn3.api.correlation.compute_vectorized_sample_correlation")
+    def test_sample_r_ndjson_correlation(self, mock_compute_samples):
+        """Test /api/correlation/sample_r/{method} streaming the top n results
+        as newline delimited json"""
+        mock_compute_samples.return_value = [
+            {"14192_at": {"corr_coefficient": -0.9, "p_value": 0.01,
+                          "num_overlap": 8}},
+            {"1412_at": {"corr_coefficient": 0.5, "p_value": 0.2,
+                         "num_overlap": 8}}]
+
+        response = self.app.post(
+            "/api/correlation/sample_r/pearson?top_n=2",
+            json={"this_trait": {}, "target_dataset": []},
+            headers={"Accept": "application/x-ndjson"}, follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line) for line in response.data.splitlines()],
+            mock_compute_samples.return_value)
+        mock_compute_samples.assert_called_once_with(
+            corr_method="pearson", this_trait={}, target_dataset=[], top_n=2)
+
+        response = self.app.post(
+            "/api/correlation/sample_r/pearson?top_n=-1",
+            json={"this_trait": {}, "target_dataset": []},
+            follow_redirects=True)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_sample_x_npz_correlation(self):
+        """Test /api/correlation/sample_x/{method} with an NPZ body"""
+        npz_file = io.BytesIO()
+        save_columnar_sample_data(
+            npz_file,
+            {f"BXD{idx}": 6.0 + (idx * 7 % 11) / 10 for idx in range(1, 10)},
+            [f"BXD{idx}" for idx in range(1, 10)],
+            {"14192_at": [5.0 + idx / 10 for idx in range(9)],
+             "1412_at": [5.0 + (idx * 3 % 7) / 10 for idx in range(9)]})
+
+        response = self.app.post("/api/correlation/sample_x/pearson",
+                                 data=npz_file.getvalue(),
+                                 content_type="application/x-npz",
+                                 follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(trait for result in response.get_json()
+                   for trait in result),
+            ["1412_at", "14192_at"])
+
+        response = self.app.post("/api/correlation/sample_x/pearson",
+                                 data=b"not an npz file",
+                                 content_type="application/x-npz",
+                                 follow_redirects=True)
+
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("gn3.api.correlation.load_correlation_index")
+    @mock.patch("gn3.api.correlation.load_dataset_matrix")
+    @mock.patch("gn3.api.correlation.retrieve_dataset_generation")
+    @mock.patch("gn3.api.correlation.database_connector")
+    def test_dataset_correlation(self, database_connector, mock_generation,
+                                 mock_load_matrix, mock_load_index):
+        """Test /api/correlation/dataset/{type}/{name}/{method}"""
+        # pylint: disable=[R0913]
+        database_connector.return_value = (mock.Mock(), mock.Mock())
+        mock_generation.return_value = 3
+        mock_load_index.side_effect = (
+            lambda *args: build_pearson_index(args[-1]))
+        mock_load_matrix.return_value = (
+            ["14192_at", "1412_at"], [f"BXD{idx}" for idx in range(1, 10)],
+            np.array([[5.0 + idx / 10, 5.0 + (idx * 3 % 7) / 10]
+                      for idx in range(9)], dtype="float32"))
+        this_trait_data = {
+            "trait_id": "1455376_at",
+            "trait_sample_data": {
+                f"BXD{idx}": str(6.0 + (idx * 7 % 11) / 10)
+                for idx in range(1, 10)}}
+
+        response = self.app.post(
+            "/api/correlation/dataset/ProbeSet/HC_M2_0606_P/pearson?top_n=1",
+            json={"this_trait": this_trait_data}, follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [list(result) for result in response.get_json()["corr_results"]],
+            [["1412_at"]])
+        self.assertEqual(mock_load_matrix.call_args[0],
+                         (database_connector.return_value[0], "ProbeSet",
+                          "HC_M2_0606_P", 3))
+        database_connector.return_value[0].close.assert_called_once_with()
+        self.assertEqual(mock_load_index.call_args[0][1:5],
+                         ("ProbeSet", "HC_M2_0606_P", 3, "pearson"))
+
+        response = self.app.post(
+            "/api/correlation/dataset/Temp/HC_M2_0606_P/pearson",
+            json={"this_trait": this_trait_data}, follow_redirects=True)
+
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("gn3.api.correlation.search_dataset_correlation")
+    @mock.patch("gn3.api.correlation.load_search_index")
+    @mock.patch("gn3.api.correlation.load_dataset_matrix")
+    @mock.patch("gn3.api.correlation.retrieve_dataset_generation")
+    @mock.patch("gn3.api.correlation.database_connector")
+    def test_approximate_dataset_correlation(
+            self, database_connector, mock_generation, mock_load_matrix,
+            mock_load_index, mock_search):
+        """Test /api/correlation/dataset/{type}/{name}/pearson with
+        approximate=true"""
+        # pylint: disable=[R0913]
+        database_connector.return_value = (mock.Mock(), mock.Mock())
+        mock_generation.return_value = 0
+        mock_load_matrix.return_value = (
+            [f"{idx}_at" for idx in range(5)], ["BXD1"],
+            np.zeros((1, 5), dtype="float32"))
+        mock_search.return_value = [{"3_at": {"corr_coefficient": 0.9,
+                                              "p_value": 0.01,
+                                              "num_overlap": 8}}]
+        this_trait_data = {"trait_id": "1455376_at",
+                           "trait_sample_data": {"BXD1": 6.0}}
+        url = "/api/correlation/dataset/ProbeSet/HC_M2_0606_P/pearson"
+
+        with mock.patch.dict(self.app.application.config,
+                             {"DATASET_MATRIX_CACHEDIR": "",
+                              "CORRELATION_SEARCH_MIN_TRAITS": 5}):
+            response = self.app.post(
+                f"{url}?top_n=1&approximate=true",
+                json={"this_trait": this_trait_data})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(),
+                             {"corr_results": mock_search.return_value})
+            self.assertEqual(mock_load_index.call_args[0][1:4],
+                             ("ProbeSet", "HC_M2_0606_P", 0))
+            self.assertEqual(mock_search.call_args[1]["top_n"], 1)
+
+            # Without approximate=true the correlations are exhaustive
+            response = self.app.post(f"{url}?top_n=1",
+                                     json={"this_trait": this_trait_data})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mock_search.call_count, 1)
+
+        # Small datasets are always correlated exhaustively
+        with mock.patch.dict(self.app.application.config,
+                             {"DATASET_MATRIX_CACHEDIR": ""}):
+            response = self.app.post(f"{url}?top_n=1&approximate=true",
+                                     json={"this_trait": this_trait_data})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_search.call_count, 1)
+
+    @mock.patch("gn3.api.correlation.load_dataset_matrix")
+    @mock.patch("gn3.api.correlation.retrieve_dataset_generation")
+    @mock.patch("gn3.api.correlation.database_connector")
+    def test_refresh_dataset_correlation(self, database_connector,
+                                         mock_generation, mock_load_matrix):
+        """Test /api/correlation/dataset/{type}/{name}/pearson/refresh"""
+        database_connector.return_value = (mock.Mock(), mock.Mock())
+        mock_generation.return_value = 0
+        mock_load_matrix.return_value = (
+            ["14192_at", "1412_at"], [f"BXD{idx}" for idx in range(1, 10)],
+            np.array([[5.0 + idx / 10, 5.0 + (idx * 3 % 7) / 10]
+                      for idx in range(9)], dtype="float32"))
+        this_trait_data = {
+            "trait_id": "1455376_at",
+            "trait_sample_data": {
+                f"BXD{idx}": 6.0 + (idx * 7 % 11) / 10
+                for idx in range(1, 10)}}
+
+        response = self.app.post(
+            "/api/correlation/dataset/ProbeSet/HC_M2_0606_P/pearson/refresh",
+            json={"this_trait": this_trait_data,
+                  "changes": {"BXD2": 6.0, "BXD4": None}},
+            follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        results = dict(
+            item for result in response.get_json()["corr_results"]
+            for item in result.items())
+        self.assertEqual(sorted(results), ["1412_at", "14192_at"])
+        self.assertEqual(results["14192_at"]["num_overlap"], 8)
+
+    def test_cache_stats(self):
+        """Test /api/correlation/cache_stats"""
+        response = self.app.get("/api/correlation/cache_stats")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.get_json()),
+            ["entries", "hits", "max_bytes", "misses", "redis_errors",
+             "redis_hits", "size"])
+
     @mock.patch("gn3.api.correlation.compute_all_lit_correlation")
     @mock.patch("gn3.api.correlation.database_connector")
     def test_lit_correlation(self, database_connector, mock_compute_corr):
@@ -80,7 +278,7 @@ class CorrelationIntegrationTest(TestCase):
         self.assertEqual(mock_compute_corr.call_count, 1)
         self.assertEqual(response.status_code, 200)
 
-    @mock.patch("gn3.api.correlation.compute_tissue_correlation")
+    @mock.patch("gn3.api.correlation.compute_vectorized_tissue_correlation")
     def test_tissue_correlation(self, mock_tissue_corr):
         """Test api/correlation/tissue_corr/{corr_method}"""
         mock_tissue_corr.return_value = {}
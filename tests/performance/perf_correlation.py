@@ -0,0 +1,57 @@
+"""module contains performance tests for the multiprocess sample correlation
+paths: the starmap path that pickles one tuple per target trait against the
+shared memory path that copies the target matrix once"""
+
+import random
+
+
+from gn3.computations.correlations import fast_compute_all_sample_correlation
+from gn3.computations.vectorized_correlations import fast_compute_vectorized_sample_correlation
+from gn3.computations.process_pool import get_pool
+from tests.performance.perf_utils import run_perf_functions
+from tests.performance.perf_utils import time_call
+
+
+def generate_dataset(num_samples: int, num_traits: int):
+    """generate a primary trait and a target dataset of random values with
+    about 5% of the values missing"""
+    samples = [f"BXD{idx}" for idx in range(num_samples)]
+
+    def __sample_data():
+        return {sample: (None if random.random() < 0.05
+                         else random.gauss(8.0, 1.5))
+                for sample in samples}
+
+    this_trait = {"trait_id": "primary_at",
+                  "trait_sample_data": __sample_data()}
+    target_dataset = [{"trait_id": f"{idx}_at",
+                       "trait_sample_data": __sample_data()}
+                      for idx in range(num_traits)]
+    return (this_trait, target_dataset)
+
+
+def compare_paths(num_samples: int, num_traits: int):
+    """time the starmap and the shared memory path on the same dataset"""
+    this_trait, target_dataset = generate_dataset(num_samples, num_traits)
+    get_pool()  # do not count starting the pool
+    print(f"{num_traits} traits x {num_samples} samples")
+    for name, func in (
+            ("starmap", fast_compute_all_sample_correlation),
+            ("shared memory", fast_compute_vectorized_sample_correlation)):
+        (_results, run_time) = time_call(
+            func, this_trait=this_trait, target_dataset=target_dataset)
+        print(f"  {name}: the time taken is {run_time:.3f} seconds")
+
+
+def perf_small_dataset():
+    """dataset about the size of a phenotype dataset"""
+    compare_paths(num_samples=100, num_traits=2000)
+
+
+def perf_probeset_dataset():
+    """dataset about the size of a full ProbeSet dataset"""
+    compare_paths(num_samples=100, num_traits=40000)
+
+
+if __name__ == '__main__':
+    run_perf_functions(__name__)
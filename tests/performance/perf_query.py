@@ -1,28 +1,12 @@
 """module contains performance tests for queries"""
 
-import time
-import sys
-
-from inspect import getmembers
-from inspect import isfunction
-
-from functools import wraps
+from gn3.computations.dataset_matrix import fetch_dataset_matrix
+from gn3.computations.dataset_matrix import load_dataset_matrix
+from gn3.db.generations import retrieve_dataset_generation
 from gn3.db_utils import database_connector
-
-
-def timer(func):
-    """time function"""
-    @wraps(func)
-    def wrapper_time(*args, **kwargs):
-        """time wrapper"""
-        start_time = time.perf_counter()
-        results = func(*args, **kwargs)
-        end_time = time.perf_counter()
-        run_time = end_time - start_time
-        print(f"the time taken is {run_time:.3f} seconds")
-        return results
-
-    return wrapper_time
+from gn3.settings import DATASET_MATRIX_CACHEDIR
+from tests.performance.perf_utils import run_perf_functions
+from tests.performance.perf_utils import timer
 
 
 def query_executor(query: str,
@@ -78,32 +62,34 @@ def perf_umutaffyexon_dataset():
     query_executor(fetch_probeset_query(dataset_name=dataset_name))
 
 
-def fetch_perf_functions():
-    """function to filter all functions strwith perf_"""
-    name_func_dict = {name: func_obj for name, func_obj in
-                      getmembers(sys.modules[__name__], isfunction)if isfunction(
-                          func_obj)
-                      and func_obj.__module__ == __name__ and name.startswith('perf_')}
-
-    return name_func_dict
-
-
-def fetch_cmd_args():
-    """function to fetch cmd args"""
-    cmd_args = sys.argv[1:]
+@timer
+def perf_umutaffyexon_dataset_matrix():
+    """load the largest dataset through the dataset matrix cache; the first
+    run builds the cache and later runs open it with mmap"""
 
-    name_func_dict = fetch_perf_functions()
+    dataset_name = "UMUTAffyExon_0209_RMA"
+    print(f"Performance test for the {dataset_name} dataset matrix")
+    conn, _ = database_connector()
+    with conn:
+        load_dataset_matrix(
+            conn, "ProbeSet", dataset_name,
+            retrieve_dataset_generation(conn, "ProbeSet", dataset_name),
+            cache_dir=DATASET_MATRIX_CACHEDIR)
 
-    if len(cmd_args) > 0:
-        callables = [func_call for name,
-                     func_call in name_func_dict.items() if name in cmd_args]
 
-        return callables
+@timer
+def perf_umutaffyexon_streamed_matrix():
+    """stream the largest dataset from the database into its matrix without
+    the dataset matrix cache"""
 
-    return list(name_func_dict.values())
+    dataset_name = "UMUTAffyExon_0209_RMA"
+    print(f"Performance test for streaming the {dataset_name} dataset")
+    conn, _ = database_connector()
+    with conn:
+        (_trait_names, _strain_names, matrix) = fetch_dataset_matrix(
+            conn, "ProbeSet", dataset_name)
+    print(f"the matrix takes {matrix.nbytes / 2 ** 20:.1f} MiB")
 
 
 if __name__ == '__main__':
-    func_list = fetch_cmd_args()
-    for func_obj in func_list:
-        func_obj()
+    run_perf_functions(__name__)
@@ -0,0 +1,79 @@
+"""module contains the recall/latency benchmark of the approximate search index
+against the exhaustive correlation of every trait, on synthetic datasets of
+traits in co-expression modules about the size of exon level datasets"""
+
+import time
+
+
+import numpy as np
+
+from gn3.computations.correlations import top_n_indices
+from gn3.computations.search_index import build_search_index
+from gn3.computations.search_index import compute_approximate_correlation
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+from tests.performance.perf_utils import run_perf_functions
+from tests.performance.perf_utils import time_call
+
+
+def generate_matrix(num_strains: int, num_traits: int, num_modules: int,
+                    seed: int = 0):
+    """generate a float32 (strains x traits) matrix of traits each made of the
+    factor of its module and noise, with about 1% of the values missing"""
+    rng = np.random.default_rng(seed)
+    matrix = (rng.normal(size=(num_strains, num_modules))[
+        :, rng.integers(0, num_modules, size=num_traits)] *
+              rng.uniform(0.2, 2.0, size=num_traits) +
+              rng.normal(size=(num_strains, num_traits))).astype("float32")
+    matrix[rng.random(matrix.shape) < 0.01] = np.nan
+    return matrix
+
+
+def benchmark(num_strains: int, num_traits: int, top_n: int = 100,
+              num_queries: int = 10):
+    """time building the index, then compare the recall of the top n and the
+    query time with the exhaustive search for several numbers of probes"""
+    # pylint: disable=[R0914]
+    matrix = generate_matrix(num_strains, num_traits,
+                             num_modules=int(np.sqrt(num_traits)))
+    print(f"{num_traits} traits x {num_strains} strains, top {top_n}")
+    (search_index, run_time) = time_call(build_search_index, matrix)
+    print(f"  building the index: {run_time:.3f} seconds")
+    rng = np.random.default_rng(1)
+    queries = [matrix[:, column].astype(float) +
+               rng.normal(size=num_strains) * 0.5
+               for column in rng.integers(0, num_traits, size=num_queries)]
+    exact = []
+    start_time = time.perf_counter()
+    for primary_vals in queries:
+        exact.append(set(top_n_indices(compute_correlation_arrays(
+            primary_vals, matrix.astype(float), "pearson")[0], top_n).tolist()))
+    print(f"  exhaustive: {(time.perf_counter() - start_time) / num_queries:.3f}"
+          " seconds per query")
+    for num_probes in (1, 4, 16, 64):
+        (recall, scanned) = (0.0, 0)
+        start_time = time.perf_counter()
+        for (primary_vals, exact_top_n) in zip(queries, exact):
+            (candidates, corr, _p_values, _num_overlap) = (
+                compute_approximate_correlation(
+                    primary_vals, matrix, search_index, top_n, num_probes))
+            recall += len(exact_top_n & set(
+                candidates[top_n_indices(corr, top_n)].tolist())) / top_n
+            scanned += len(candidates)
+        run_time = (time.perf_counter() - start_time) / num_queries
+        print(f"  {num_probes} probes: recall {recall / num_queries:.3f}, "
+              f"{scanned / num_queries / num_traits:.1%} of the traits, "
+              f"{run_time:.3f} seconds per query")
+
+
+def perf_probeset_dataset():
+    """dataset about the size of a full ProbeSet dataset"""
+    benchmark(num_strains=100, num_traits=45000)
+
+
+def perf_exon_dataset():
+    """dataset about the size of an exon level dataset"""
+    benchmark(num_strains=100, num_traits=300000)
+
+
+if __name__ == '__main__':
+    run_perf_functions(__name__)
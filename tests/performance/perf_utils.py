@@ -0,0 +1,64 @@
+"""module contains the helpers shared by the performance scripts: timing calls
+and running the perf_ functions of a script, those named on the command line
+or all of them. Run a script from the root of the repository with e.g.
+`python -m tests.performance.perf_correlation perf_small_dataset`"""
+
+import sys
+import time
+
+from functools import wraps
+from inspect import getmembers
+from inspect import isfunction
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+
+def timer(func):
+    """time function"""
+    @wraps(func)
+    def wrapper_time(*args, **kwargs):
+        """time wrapper"""
+        (results, run_time) = time_call(func, *args, **kwargs)
+        print(f"the time taken is {run_time:.3f} seconds")
+        return results
+
+    return wrapper_time
+
+
+def time_call(func: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """call FUNC returning its result and the time it took in seconds"""
+    start_time = time.perf_counter()
+    results = func(*args, **kwargs)
+    return (results, time.perf_counter() - start_time)
+
+
+def fetch_perf_functions(module_name: str) -> Dict[str, Callable]:
+    """function to filter all functions of the module MODULE_NAME starting
+    with perf_"""
+    return {name: func_obj for name, func_obj in
+            getmembers(sys.modules[module_name], isfunction)
+            if func_obj.__module__ == module_name and name.startswith("perf_")}
+
+
+def fetch_cmd_args(module_name: str) -> List[Callable]:
+    """function to fetch the perf_ functions of the module MODULE_NAME named
+    in the cmd args, all of them without cmd args"""
+    cmd_args = sys.argv[1:]
+
+    name_func_dict = fetch_perf_functions(module_name)
+
+    if len(cmd_args) > 0:
+        return [func_call for name, func_call in name_func_dict.items()
+                if name in cmd_args]
+
+    return list(name_func_dict.values())
+
+
+def run_perf_functions(module_name: str) -> None:
+    """run the perf_ functions of the module MODULE_NAME given by
+    `fetch_cmd_args`"""
+    for func_obj in fetch_cmd_args(module_name):
+        func_obj()
@@ -2,7 +2,33 @@
 from unittest import TestCase
 from unittest import mock
 
+import numpy as np
+
+from gn3.computations.biweight import biweight_midcorrelation
 from gn3.computations.biweight import calculate_biweight_corr
+from gn3.computations.biweight import compute_biweight_corr
+
+# (trait values, target values, bicor, p value) of WGCNA's bicorAndPvalue
+# with its defaults maxPOutliers = 1 and pearsonFallback = "individual": no
+# outliers, an outlier past 9 mads given zero weight, a negative correlation
+# with such an outlier, and one or both columns with a zero mad falling back
+# to Pearson. R is not available in CI, so these come from a transcription of
+# WGCNA's prepareColBicor, which matches astropy's biweight_midcorrelation
+# (c = 9) to 1e-15 on the cases without a zero mad
+BICOR_REFERENCES = (
+    ([1.2, 2.3, 3.1, 4.8, 5.2, 6.6, 7.1, 8.4],
+     [2.1, 1.9, 3.7, 4.1, 5.6, 5.2, 6.9, 8.3],
+     0.9545041991727299, 0.0002274656764636821),
+    ([1.2, 2.3, 3.1, 4.8, 5.2, 6.6, 7.1, 8.4],
+     [2.1, 1.9, 3.7, 4.1, 5.6, 5.2, 80.0, 8.3],
+     0.897410218423968, 0.0024958776563149213),
+    ([0.5, 1.7, 2.2, 3.9, 4.4, 5.0, 6.3, 7.8, 9.1, 10.2],
+     [9.8, 8.1, 8.5, 6.2, 6.0, 4.9, 4.1, -30.0, 1.6, 0.7],
+     -0.9389846796493811, 5.630861761486987e-05),
+    ([1, 1, 1, 1, 2, 3], [2.0, 3.1, 1.2, 4.1, 5.3, 6.4],
+     0.8466969281283273, 0.03345129625968953),
+    ([1, 1, 1, 1, 2, 3], [2.0, 2.0, 2.0, 2.0, 5.0, 4.0],
+     0.8093123765957438, 0.051075784854046964))
 
 
 class TestBiweight(TestCase):
@@ -19,3 +45,49 @@ class TestBiweight(TestCase):
                                           target_vals=[1.9, 0.4, 1.1])
 
         self.assertEqual(results, (0.1, 0.5))
+
+    def test_compute_biweight_corr(self):
+        """test the numpy biweight midcorrelation and p value"""
+        self.assertEqual(compute_biweight_corr([1, 2, 3, 4], [1, 2, 3, 4]),
+                         (1.0, 0.0))
+        (corr_coeff, p_val) = compute_biweight_corr(
+            [1.2, 2.3, 3.1, 4.8, 5.2, 6.6, 7.1, 8.4],
+            [2.1, 1.9, 3.7, 4.1, 5.6, 5.2, 80.0, 8.3])
+        self.assertAlmostEqual(corr_coeff, 0.897410, places=6)
+        self.assertAlmostEqual(p_val, 0.002496, places=6)
+
+    def test_compute_biweight_corr_references(self):
+        """test against reference values of WGCNA's bicorAndPvalue"""
+        for (trait_vals, target_vals, bicor, p_val) in BICOR_REFERENCES:
+            with self.subTest(trait_vals=trait_vals, target_vals=target_vals):
+                (corr_coeff, result_p_val) = compute_biweight_corr(
+                    trait_vals, target_vals)
+                self.assertAlmostEqual(corr_coeff, bicor, places=12)
+                self.assertAlmostEqual(result_p_val / p_val, 1.0, places=8)
+
+    def test_compute_biweight_corr_zero_mad(self):
+        """test that values with a zero median absolute deviation fall back to
+        the deviation from the mean"""
+        (corr_coeff, _p_val) = compute_biweight_corr(
+            [1, 1, 1, 1, 2, 3], [2.0, 3.1, 1.2, 4.1, 5.3, 6.4])
+        self.assertAlmostEqual(corr_coeff, 0.846697, places=6)
+        self.assertTrue(
+            np.isnan(compute_biweight_corr([1, 1, 1, 1], [1, 2, 3, 4])[0]))
+
+    def test_biweight_midcorrelation(self):
+        """test that one vs matrix results match the pairwise ones using only
+        the masked samples"""
+        primary_vals = np.array([1.2, 2.3, 3.1, 4.8, 5.2, 6.6, 7.1, 8.4])
+        target_matrix = np.array(
+            [[2.1, 1.9, 3.7, 4.1, 5.6, 5.2, 80.0, 8.3],
+             [8.0, 7.1, 6.3, np.nan, 4.4, 3.9, 2.2, 1.0]]).T
+        mask = ~np.isnan(target_matrix)
+        results = biweight_midcorrelation(
+            primary_vals[:, None], target_matrix, mask)
+        for idx, corr_coeff in enumerate(results):
+            column_mask = mask[:, idx]
+            self.assertAlmostEqual(
+                corr_coeff,
+                compute_biweight_corr(
+                    primary_vals[column_mask],
+                    target_matrix[column_mask, idx])[0])
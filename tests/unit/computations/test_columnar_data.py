@@ -0,0 +1,99 @@
+"""Module contains the tests for the binary columnar correlation input"""
+import io
+from unittest import TestCase
+
+import numpy as np
+
+from gn3.computations.columnar_data import align_sample_matrix
+from gn3.computations.columnar_data import load_columnar_sample_data
+from gn3.computations.columnar_data import save_columnar_sample_data
+from gn3.computations.correlations import map_shared_keys_to_values
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+from gn3.computations.vectorized_correlations import compute_vectorized_sample_correlation
+from gn3.computations.vectorized_correlations import format_correlation_results
+
+
+class TestColumnarData(TestCase):
+    """Class for testing the NPZ correlation input"""
+
+    def setUp(self):
+        self.trait_sample_data = {
+            f"BXD{idx}": 6.0 + (idx * 7 % 11) / 10 for idx in range(1, 15)}
+        self.trait_sample_data["BXD3"] = None
+        self.target_samplelist = [f"BXD{idx}" for idx in range(14, 0, -1)]
+        self.target_dataset = {
+            f"{trait}_at": [
+                (None if (idx + trait) % 9 == 0
+                 else 5.0 + (idx * trait % 13) / 10)
+                for idx in range(14)]
+            for trait in range(1, 20)}
+
+    def test_align_sample_matrix(self):
+        """Test that the target matrix is aligned to the primary samples"""
+        (primary_vals, target_matrix) = align_sample_matrix(
+            ["A", "B", "C"], np.array([1.0, 0.0, 3.0]), ["C", "A", "D"],
+            np.array([[1.0, 2.0, np.nan], [4.0, 5.0, 6.0]], dtype="float32"))
+        np.testing.assert_array_equal(primary_vals, [1.0, np.nan, 3.0])
+        np.testing.assert_array_equal(
+            target_matrix, [[2.0, 5.0], [np.nan, np.nan], [1.0, 4.0]])
+
+    def test_matches_json_input(self):
+        """Test that an NPZ body gives the same results as the JSON input"""
+        for dtype in ("float64", "float32"):
+            with self.subTest(dtype=dtype):
+                npz_file = io.BytesIO()
+                save_columnar_sample_data(
+                    npz_file, self.trait_sample_data, self.target_samplelist,
+                    self.target_dataset, dtype=dtype)
+                npz_file.seek(0)
+                (primary_vals, target_matrix,
+                 trait_names) = load_columnar_sample_data(npz_file)
+                results = format_correlation_results(
+                    trait_names,
+                    *compute_correlation_arrays(primary_vals, target_matrix))
+                expected = compute_vectorized_sample_correlation(
+                    this_trait={"trait_id": "1455376_at",
+                                "trait_sample_data": self.trait_sample_data},
+                    target_dataset=map_shared_keys_to_values(
+                        self.target_samplelist, self.target_dataset))
+                self.assertEqual([list(item.keys()) for item in results],
+                                 [list(item.keys()) for item in expected])
+                for result, expected_result in zip(results, expected):
+                    (trait_name, values), = result.items()
+                    self.assertAlmostEqual(
+                        values["corr_coefficient"],
+                        expected_result[trait_name]["corr_coefficient"],
+                        places=5)
+
+    def test_load_invalid_data(self):
+        """Test that malformed bodies raise errors"""
+        for body in (b"", b"not an npz file"):
+            with self.subTest(body=body):
+                with self.assertRaises(ValueError):
+                    load_columnar_sample_data(io.BytesIO(body))
+        npz_file = io.BytesIO()
+        np.savez(npz_file, trait_values=np.ones(3))
+        npz_file.seek(0)
+        with self.assertRaises(KeyError):
+            load_columnar_sample_data(npz_file)
+
+    def test_load_mismatched_data(self):
+        """Test that arrays of mismatched shapes raise a `ValueError`"""
+        arrays = {
+            "trait_samplelist": np.array(["A", "B", "C"]),
+            "trait_values": np.ones(3),
+            "target_samplelist": np.array(["A", "B"]),
+            "target_trait_ids": np.array(["1_at", "2_at"]),
+            "target_dataset": np.ones((2, 2))}
+        for (name, value) in (("trait_values", np.ones(4)),
+                              ("trait_values", np.ones((3, 1))),
+                              ("target_samplelist", np.array([], dtype=str)),
+                              ("target_dataset", np.ones((2, 3))),
+                              ("target_dataset", np.ones(4)),
+                              ("target_trait_ids", np.array(["1_at"]))):
+            with self.subTest(name=name, shape=value.shape):
+                npz_file = io.BytesIO()
+                np.savez(npz_file, **{**arrays, name: value})
+                npz_file.seek(0)
+                with self.assertRaises(ValueError):
+                    load_columnar_sample_data(npz_file)
@@ -15,9 +15,17 @@ from gn3.computations.correlations import fetch_lit_correlation_data
 from gn3.computations.correlations import query_formatter
 from gn3.computations.correlations import map_to_mouse_gene_id
 from gn3.computations.correlations import compute_all_lit_correlation
+from gn3.computations.correlations import bulk_lit_correlation_for_trait
+from gn3.computations.correlations import fetch_all_lit_correlation_data
+from gn3.computations.correlations import map_all_to_mouse_gene_ids
+from gn3.computations.correlations import GENE_ID_SPECIES
 from gn3.computations.correlations import compute_tissue_correlation
 from gn3.computations.correlations import map_shared_keys_to_values
 from gn3.computations.correlations import process_trait_symbol_dict
+from gn3.computations.correlations import compute_corr_coefficient
+from gn3.computations.correlations import compute_corr_coeff_p_value
+from gn3.computations.correlations import top_n_indices
+from gn3.computations.correlations import sort_correlation_results
 from gn3.computations.correlations2 import compute_correlation
 
 
@@ -98,7 +106,7 @@ class TestCorrelation(TestCase):
 
         self.assertEqual(results, expected_results)
 
-    @mock.patch("gn3.computations.correlations.calculate_biweight_corr")
+    @mock.patch("gn3.computations.correlations.compute_biweight_corr")
     def test_bicor(self, mock_biweight):
         """Test for doing biweight mid correlation """
         mock_biweight.return_value = (1.0, 0.0)
@@ -364,10 +372,10 @@ class TestCorrelation(TestCase):
 
         self.assertEqual(results, expected_results)
 
-    @mock.patch("gn3.computations.correlations.lit_correlation_for_trait")
+    @mock.patch("gn3.computations.correlations.bulk_lit_correlation_for_trait")
     def test_compute_all_lit_correlation(self, mock_lit_corr):
         """Test for compute all lit correlation which acts\
-        as an abstraction for lit_correlation_for_trait
+        as an abstraction for bulk_lit_correlation_for_trait
         and is used in the api/correlation/lit
         """
 
@@ -492,3 +500,124 @@ class TestCorrelation(TestCase):
             with self.subTest(dbdata=dbdata, userdata=userdata):
                 self.assertEqual(compute_correlation(
                     dbdata, userdata), expected)
+
+    def test_compute_corr_coefficient(self):
+        """Test that the coefficient alone matches the one computed with the
+        p value"""
+        primary_values = [9.3, 2.2, 5.4, 7.2, 6.4, 7.6, 3.8, 1.8, 8.4, 0.2]
+        target_values = [0.6, 3.97, 5.82, 8.21, 1.65, 4.55, 6.72, 9.5, 7.33,
+                         2.34]
+        for corr_method in ("pearson", "spearman", "bicor"):
+            with self.subTest(corr_method=corr_method):
+                self.assertAlmostEqual(
+                    compute_corr_coefficient(
+                        primary_values, target_values, corr_method),
+                    compute_corr_coeff_p_value(
+                        primary_values, target_values, corr_method)[0])
+
+
+class TestBulkLitCorrelation(TestCase):
+    """Class for testing the lit correlations fetched for all the target
+    traits at once"""
+
+    def test_map_all_to_mouse_gene_ids(self):
+        """Test that gene ids are mapped to mouse gene ids in one
+        parameterized query"""
+        conn = mock.Mock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [(12, 20), (15, None)]
+        self.assertEqual(map_all_to_mouse_gene_ids(conn, "rat", [12, 15, None]),
+                         {"12": "20"})
+        (query, query_values) = cursor.execute.call_args[0]
+        self.assertIn("WHERE rat IN (%s, %s)", query)
+        self.assertEqual(sorted(query_values), ["12", "15"])
+        self.assertEqual(map_all_to_mouse_gene_ids(conn, "mouse", [16]),
+                         {"16": "16"})
+        self.assertEqual(map_all_to_mouse_gene_ids(conn, "rat; --", [16]), {})
+        self.assertEqual(map_all_to_mouse_gene_ids(conn, None, [16]), {})
+        self.assertEqual(cursor.execute.call_count, 1)
+
+    def test_map_other_species_to_mouse_gene_ids(self):
+        """Test that rat and human gene ids are mapped to their mouse gene
+        ids through their GeneIDXRef column. `map_to_mouse_gene_id` compared
+        two string literals and mapped none of them, so lit correlations of
+        these species are no longer all 0"""
+        self.assertEqual(GENE_ID_SPECIES, ("mouse", "rat", "human"))
+        for (species, gene_id, mouse_gene_id) in (
+                ("rat", 24628, 12914), ("human", 1457, 12995)):
+            with self.subTest(species=species):
+                conn = mock.Mock()
+                cursor = conn.cursor.return_value
+                cursor.fetchall.return_value = [(gene_id, mouse_gene_id)]
+                self.assertEqual(
+                    map_all_to_mouse_gene_ids(conn, species, [gene_id]),
+                    {str(gene_id): str(mouse_gene_id)})
+                cursor.execute.assert_called_once_with(
+                    f"SELECT {species}, mouse FROM GeneIDXRef "
+                    f"WHERE {species} IN (%s)", [str(gene_id)])
+        conn = mock.Mock()
+        self.assertEqual(
+            map_all_to_mouse_gene_ids(conn, "drosophila", [31]), {})
+        conn.cursor.assert_not_called()
+
+    def test_fetch_all_lit_correlation_data(self):
+        """Test that both directions of LCorrRamin3 are fetched in one query,
+        preferring the mouse gene id as GeneId1"""
+        conn = mock.Mock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [
+            (15, 20, 0.5), (20, 15, 0.7), (20, 17, 0.3)]
+        self.assertEqual(
+            fetch_all_lit_correlation_data(conn, "20", ["15", "17", "1;2"]),
+            {"15": 0.5, "17": 0.3})
+        (_query, query_values) = cursor.execute.call_args[0]
+        self.assertEqual(len(query_values), 6)
+        self.assertNotIn("1;2", query_values)
+        self.assertEqual(fetch_all_lit_correlation_data(conn, None, ["15"]), {})
+        self.assertEqual(cursor.execute.call_count, 1)
+
+    def test_bulk_lit_correlation_for_trait(self):
+        """Test that the bulk lit correlations are those of
+        `lit_correlation_for_trait` in a constant number of queries"""
+        conn = mock.Mock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.side_effect = [
+            [(12, 20), (15, 25), (17, 27)],
+            [(25, 20, 0.9), (20, 27, 0.4)]]
+        target_trait_lists = [("1426679_at", 15), ("1426702_at", 17),
+                              ("1426682_at", 11), ("1426683_at", None)]
+        self.assertEqual(
+            bulk_lit_correlation_for_trait(
+                conn, target_trait_lists, species="rat", trait_gene_id="12"),
+            [{"1426679_at": {"gene_id": 15, "lit_corr": 0.9}},
+             {"1426702_at": {"gene_id": 17, "lit_corr": 0.4}},
+             {"1426682_at": {"gene_id": 11, "lit_corr": 0}}])
+        self.assertEqual(cursor.execute.call_count, 2)
+
+
+class TestTopNSelection(TestCase):
+    """Class for testing the top n selection of correlation results"""
+
+    def test_top_n_indices(self):
+        """Test that the top n selection matches a stable sort by the
+        absolute value"""
+        corr_coefficients = [0.2, -0.9, 0.5, -0.2, 0.9, float("nan"), -0.5,
+                             0.2, 0.1]
+        expected = sorted(
+            [idx for idx in range(len(corr_coefficients)) if idx != 5],
+            key=lambda idx: -abs(corr_coefficients[idx])) + [5]
+        for top_n in (None, 0, 1, 2, 3, 5, 6, 8, 9, 20):
+            with self.subTest(top_n=top_n):
+                self.assertEqual(
+                    top_n_indices(corr_coefficients, top_n).tolist(),
+                    expected[:top_n])
+
+    def test_sort_correlation_results(self):
+        """Test sorting and cutting single key correlation results"""
+        lit_results = [{"1412_at": {"gene_id": 11, "lit_corr": 0.2}},
+                       {"1418702_a_at": {"gene_id": 12, "lit_corr": -0.7}},
+                       {"1455376_at": {"gene_id": 13, "lit_corr": 0.4}}]
+        self.assertEqual(
+            sort_correlation_results(lit_results, "lit_corr", 2),
+            [lit_results[1], lit_results[2]])
+        self.assertEqual(sort_correlation_results([], "lit_corr"), [])
@@ -0,0 +1,287 @@
+"""Module contains the tests for the server side dataset matrix"""
+import itertools
+import os
+import tempfile
+from unittest import TestCase
+from unittest import mock
+
+import numpy as np
+
+from gn3.computations.dataset_matrix import compute_dataset_correlation
+from gn3.computations.dataset_matrix import dataset_matrix_cache_path
+from gn3.computations.dataset_matrix import fetch_dataset_matrix
+from gn3.computations.dataset_matrix import fill_dataset_matrix
+from gn3.computations.dataset_matrix import load_dataset_matrix
+from gn3.computations.dataset_matrix import load_search_index
+from gn3.computations.dataset_matrix import load_correlation_index
+from gn3.computations.dataset_matrix import open_dataset_matrix
+from gn3.computations.dataset_matrix import refresh_dataset_correlation
+from gn3.computations.dataset_matrix import search_dataset_correlation
+from gn3.computations.dataset_matrix import save_dataset_matrix
+from gn3.computations.pearson_index import build_pearson_index
+from gn3.computations.rank_index import build_rank_index
+from gn3.computations.result_cache import configure_result_cache
+from gn3.computations.result_cache import result_cache_stats
+from gn3.computations.vectorized_correlations import compute_vectorized_sample_correlation
+
+
+def build_dataset_matrix(rows, dtype="float64"):
+    """The dataset matrix `fetch_dataset_matrix` fills from ROWS, with the
+    traits in the order they first appear"""
+    return fill_dataset_matrix(
+        [rows], list(dict.fromkeys(row[0] for row in rows)), dtype=dtype)
+
+
+class TestDatasetMatrix(TestCase):
+    """Class for testing the dataset matrix"""
+
+    def setUp(self):
+        self.this_trait_samples = {
+            f"BXD{idx}": 6.0 + (idx * 7 % 11) / 10 for idx in range(1, 15)}
+        self.this_trait_samples["BXD3"] = None
+        self.rows = [
+            (f"{trait}_at", f"BXD{idx}", 5.0 + (idx * trait % 13) / 10)
+            for trait in range(1, 20) for idx in range(16, 0, -1)
+            if (idx + trait) % 9 != 0]
+
+    def assert_results_almost_equal(self, results, expected):
+        """Check that correlation results are the same traits with the same
+        overlaps and coefficients up to rounding"""
+        self.assertEqual([list(result) for result in results],
+                         [list(result) for result in expected])
+        for (result, expected_result) in zip(results, expected):
+            (result, ) = result.values()
+            (expected_result, ) = expected_result.values()
+            self.assertAlmostEqual(result["corr_coefficient"],
+                                   expected_result["corr_coefficient"])
+            self.assertEqual(result["num_overlap"],
+                             expected_result["num_overlap"])
+
+    def test_fill_dataset_matrix(self):
+        """Test that chunks of rows are written into the matrix of the traits
+        with rows, that of the given strains only when they are given"""
+        (trait_names, strain_names, matrix) = fill_dataset_matrix(
+            iter([[("1412_at", "BXD1", 1.5), ("14192_at", "BXD2", 2.5)],
+                  [("1412_at", "BXD2", 3.5)]]),
+            ["1412_at", "14192_at"])
+        self.assertEqual(trait_names, ["1412_at", "14192_at"])
+        self.assertEqual(strain_names, ["BXD1", "BXD2"])
+        np.testing.assert_array_equal(matrix, [[1.5, np.nan], [3.5, 2.5]])
+        expected_strains = list(dict.fromkeys(row[1] for row in self.rows))
+        expected = np.full((16, 19), np.nan)
+        for (trait_name, strain_name, value) in self.rows:
+            expected[expected_strains.index(strain_name),
+                     int(trait_name.split("_")[0]) - 1] = value
+        chunks = [self.rows[idx:idx + 50]
+                  for idx in range(0, len(self.rows), 50)]
+        (trait_names, strain_names, matrix) = fill_dataset_matrix(
+            iter(chunks), [f"{trait}_at" for trait in range(20, 0, -1)],
+            dtype="float32")
+        self.assertEqual(trait_names,
+                         [f"{trait}_at" for trait in range(19, 0, -1)])
+        self.assertEqual(strain_names, expected_strains)
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_allclose(matrix, expected[:, ::-1], rtol=1e-6)
+        (trait_names, strain_names, matrix) = fill_dataset_matrix(
+            chunks + [[("unknown_at", "BXD1", 1.0), ("1_at", "BXD1", None)]],
+            ["1_at", "2_at"], ["BXD2", "BXD99", "BXD1"])
+        self.assertEqual((trait_names, strain_names),
+                         (["1_at", "2_at"], ["BXD2", "BXD99", "BXD1"]))
+        (bxd2, bxd1) = (expected_strains.index("BXD2"),
+                        expected_strains.index("BXD1"))
+        np.testing.assert_array_equal(
+            matrix, [expected[bxd2, :2], [np.nan, np.nan],
+                     [np.nan, expected[bxd1, 1]]])
+        self.assertEqual(
+            [array.shape if isinstance(array, np.ndarray) else array
+             for array in fill_dataset_matrix([], ["1_at"])],
+            [[], [], (0, 0)])
+
+    def test_fetch_dataset_matrix(self):
+        """Test that the matrix is streamed from the dataset's rows"""
+        with mock.patch("gn3.computations.dataset_matrix."
+                        "retrieve_dataset_data_chunks") as mock_retrieve, \
+             mock.patch("gn3.computations.dataset_matrix."
+                        "retrieve_dataset_trait_names") as mock_names:
+            mock_retrieve.return_value = iter([[("1412_at", "BXD1", 1.5)]])
+            mock_names.return_value = ["1412_at", "14192_at"]
+            conn = mock.Mock()
+            (trait_names, strain_names, matrix) = fetch_dataset_matrix(
+                conn, "ProbeSet", "HC_M2_0606_P", strain_names=["BXD1"])
+            mock_retrieve.assert_called_once_with(
+                "ProbeSet", "HC_M2_0606_P", conn, ["BXD1"])
+            mock_names.assert_called_once_with(
+                "ProbeSet", "HC_M2_0606_P", conn)
+            self.assertEqual((trait_names, strain_names, matrix.tolist()),
+                             (["1412_at"], ["BXD1"], [[1.5]]))
+
+    def test_save_dataset_matrix(self):
+        """Test that a saved matrix is opened with mmap and left alone when it
+        is saved again"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            path = dataset_matrix_cache_path(
+                cache_dir, "ProbeSet", "HC_M2_0606_P")
+            save_dataset_matrix(
+                path, build_dataset_matrix(self.rows, "float32"))
+            save_dataset_matrix(path, build_dataset_matrix([]))
+            (trait_names, strain_names, matrix) = open_dataset_matrix(path)
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["0"])
+        self.assertIsInstance(matrix, np.memmap)
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertEqual(matrix.shape, (16, 19))
+        self.assertEqual((trait_names[0], strain_names[0]), ("1_at", "BXD16"))
+
+    @mock.patch("gn3.computations.dataset_matrix.retrieve_dataset_trait_names")
+    @mock.patch("gn3.computations.dataset_matrix.retrieve_dataset_data_chunks")
+    def test_load_dataset_matrix(self, mock_retrieve, mock_names):
+        """Test that the dataset is only fetched from the database when its
+        generation is not cached, and that older generations are removed"""
+        conn = mock.Mock()
+        mock_retrieve.side_effect = lambda *_args: iter([self.rows])
+        mock_names.return_value = [f"{trait}_at" for trait in range(1, 20)]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for generation in (0, 0, 1):
+                (trait_names, _strain_names, matrix) = load_dataset_matrix(
+                    conn, "ProbeSet", "HC_M2_0606_P", generation, cache_dir)
+                self.assertEqual(len(trait_names), 19)
+                self.assertIsInstance(matrix, np.memmap)
+            self.assertEqual(mock_retrieve.call_count, 2)
+            self.assertEqual(
+                os.listdir(os.path.join(cache_dir, "ProbeSet", "HC_M2_0606_P")),
+                ["1"])
+            del matrix
+
+        (_, _, matrix) = load_dataset_matrix(
+            conn, "ProbeSet", "HC_M2_0606_P", 1, cache_dir=None)
+        self.assertEqual(mock_retrieve.call_count, 3)
+        self.assertNotIsInstance(matrix, np.memmap)
+
+    def test_load_correlation_index(self):
+        """Test that the correlation indexes are saved with the cached
+        matrix"""
+        matrix = build_dataset_matrix(self.rows, "float32")[2]
+        self.assertIsNone(load_correlation_index(
+            None, "ProbeSet", "HC_M2_0606_P", 0, "pearson", matrix))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertIsNone(load_correlation_index(
+                cache_dir, "ProbeSet", "HC_M2_0606_P", 0, "bicor", matrix))
+            (means, sum_squares) = load_correlation_index(
+                cache_dir, "ProbeSet", "HC_M2_0606_P", 0, "pearson", matrix)
+            (ranks, _num_missing, _sum_squares) = load_correlation_index(
+                cache_dir, "ProbeSet", "HC_M2_0606_P", 0, "spearman", matrix)
+            self.assertEqual(
+                sorted(os.listdir(dataset_matrix_cache_path(
+                    cache_dir, "ProbeSet", "HC_M2_0606_P"))),
+                ["pearson_index", "rank_index"])
+            self.assertEqual((means.shape, sum_squares.shape, ranks.shape),
+                             ((19,), (19,), (16, 19)))
+            np.testing.assert_array_equal(
+                load_correlation_index(
+                    cache_dir, "ProbeSet", "HC_M2_0606_P", 0, "pearson",
+                    None)[0],
+                means)
+            del means, sum_squares, ranks
+
+    def test_compute_indexed_dataset_correlation(self):
+        """Test that correlations with the correlation indexes give the
+        results of the masked path"""
+        rows = [row for row in self.rows if row[0] != "8_at"]
+        rows += [("8_at", f"BXD{idx}", 4.0 + idx % 5) for idx in range(1, 17)]
+        dataset_matrix = build_dataset_matrix(rows)
+        for ((corr_method, build_index), (sample, value)) in itertools.product(
+                (("pearson", build_pearson_index),
+                 ("spearman", build_rank_index)),
+                (("BXD3", 6.5), ("BXD7", None))):
+            this_trait_samples = {
+                **self.this_trait_samples, "BXD15": 6.1, "BXD16": 7.2,
+                sample: value}
+            results = compute_dataset_correlation(
+                this_trait_samples, dataset_matrix, corr_method,
+                correlation_index=build_index(dataset_matrix[2]))
+            expected = compute_dataset_correlation(
+                this_trait_samples, dataset_matrix, corr_method)
+            self.assert_results_almost_equal(results, expected)
+
+    def test_compute_cached_dataset_correlation(self):
+        """Test that correlations with a dataset key go through the result
+        cache"""
+        configure_result_cache()
+        dataset_matrix = build_dataset_matrix(self.rows)
+        results = [
+            compute_dataset_correlation(
+                self.this_trait_samples, dataset_matrix, top_n=top_n,
+                dataset_key=("ProbeSet", "HC_M2_0606_P", 0))
+            for top_n in (None, 5)]
+        self.assertEqual(results[0][:5], results[1])
+        self.assertEqual(results[0], compute_dataset_correlation(
+            self.this_trait_samples, dataset_matrix))
+        self.assertEqual(
+            (result_cache_stats()["hits"], result_cache_stats()["misses"]),
+            (1, 1))
+
+    def test_refresh_dataset_correlation(self):
+        """Test that refreshed correlations are those of the changed sample
+        data, updated from the sums kept by the previous refresh"""
+        configure_result_cache()
+        dataset_matrix = build_dataset_matrix(self.rows)
+        dataset_key = ("ProbeSet", "HC_M2_0606_P", 0)
+        this_trait_samples = dict(self.this_trait_samples)
+        for changes in ({}, {"BXD3": 6.2, "BXD5": None, "BXD16": 6.6},
+                        {"BXD5": 7.1}):
+            results = refresh_dataset_correlation(
+                this_trait_samples, changes, dataset_matrix, dataset_key)
+            this_trait_samples.update(changes)
+            expected = compute_dataset_correlation(
+                this_trait_samples, dataset_matrix)
+            self.assert_results_almost_equal(results, expected)
+        # The sums of the first sample data are computed, then updated twice
+        self.assertEqual(
+            (result_cache_stats()["hits"], result_cache_stats()["misses"]),
+            (3, 3))
+
+    def test_search_dataset_correlation(self):
+        """Test that the approximate search gives the exact top n when every
+        cluster is probed"""
+        dataset_matrix = build_dataset_matrix(self.rows)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertIsNone(load_search_index(
+                None, "ProbeSet", "HC_M2_0606_P", 0, dataset_matrix[2]))
+            search_index = load_search_index(
+                cache_dir, "ProbeSet", "HC_M2_0606_P", 0, dataset_matrix[2])
+            self.assertEqual(
+                os.listdir(dataset_matrix_cache_path(
+                    cache_dir, "ProbeSet", "HC_M2_0606_P")),
+                ["search_index"])
+            self.assert_results_almost_equal(
+                search_dataset_correlation(
+                    self.this_trait_samples, dataset_matrix, search_index,
+                    top_n=5, num_probes=len(search_index[0].T)),
+                compute_dataset_correlation(
+                    self.this_trait_samples, dataset_matrix, top_n=5))
+            del search_index
+        self.assertEqual(search_dataset_correlation(
+            self.this_trait_samples, build_dataset_matrix([]), None, 5), [])
+
+    def test_compute_dataset_correlation(self):
+        """Test that correlating against the dataset matrix gives the results
+        of correlating against the same dataset sent as a target dataset"""
+        target_dataset = {}
+        for (trait_name, strain_name, value) in self.rows:
+            target_dataset.setdefault(trait_name, {})[strain_name] = value
+        for corr_method in ("pearson", "spearman", "bicor"):
+            with self.subTest(corr_method=corr_method):
+                self.assertEqual(
+                    compute_dataset_correlation(
+                        self.this_trait_samples,
+                        build_dataset_matrix(self.rows),
+                        corr_method, top_n=10),
+                    compute_vectorized_sample_correlation(
+                        {"trait_id": "1455376_at",
+                         "trait_sample_data": self.this_trait_samples},
+                        [{"trait_id": trait_name,
+                          "trait_sample_data": sample_data}
+                         for (trait_name, sample_data)
+                         in target_dataset.items()],
+                        corr_method, top_n=10))
+        self.assertEqual(compute_dataset_correlation(
+            self.this_trait_samples, build_dataset_matrix([])), [])
@@ -1,6 +1,7 @@
 """Module contains tests for gn3.computations.heatmap"""
 from unittest import TestCase
 from gn3.computations.heatmap import cluster_traits, export_trait_data
+from gn3.db.traits import TraitData
 
 strainlist = ["B6cC3-1", "BXD1", "BXD12", "BXD16", "BXD19", "BXD2"]
 trait_data = {
@@ -93,6 +94,42 @@ class TestHeatmap(TestCase):
                         n_exists=nflag),
                     expected)
 
+    def test_export_trait_data_missing(self):
+        """
+        Test that `export_trait_data` exports the strains without data, and
+        the missing or falsy items in "all", as None, from the columnar or
+        dict form of the data alike
+        """
+        columnar = TraitData(
+            36688172, ["BXD1", "BXD2", "BXD5"], [7.5, 0.0, 8.1],
+            [0.2, 0.3, None], [4, None, 0])
+        for data in (columnar, columnar.as_dict()):
+            for dtype, vflag, nflag, expected in [
+                    ["val", False, False, (None, 7.5, 0.0, 8.1)],
+                    ["val", True, True,
+                     (None, None, None, 7.5, 0.0, 8.1)],
+                    ["var", False, True, (None, None, 0.2, 0.3, None)],
+                    ["N", False, False, (None, 4, None, 0)],
+                    ["all", True, False, (None, None, 7.5, 0.2, None, None,
+                                          8.1, None)],
+                    ["all", True, True, (None, None, None, 7.5, 0.2, 4,
+                                         None, None, None, 8.1, None, None)]]:
+                with self.subTest(data=type(data), dtype=dtype, vflag=vflag,
+                                  nflag=nflag):
+                    self.assertEqual(
+                        export_trait_data(
+                            data, ["BXD3", "BXD1", "BXD2", "BXD5"],
+                            dtype=dtype, var_exists=vflag, n_exists=nflag),
+                        expected)
+            with self.assertRaises(KeyError):
+                export_trait_data(data, ["BXD1"], dtype="values")
+            self.assertEqual(
+                export_trait_data(data, ["BXD3"], dtype="values"), (None,))
+        self.assertEqual(
+            [type(item) for item in export_trait_data(
+                columnar, ["BXD1"], dtype="all", n_exists=True)],
+            [float, int])
+
     def test_cluster_traits(self):
         """
         Test that the clustering is working as expected.
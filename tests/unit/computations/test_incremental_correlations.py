@@ -0,0 +1,57 @@
+"""Module contains the tests for incremental pearson correlations"""
+from unittest import TestCase
+
+import numpy as np
+
+from gn3.computations.incremental_correlations import compute_pearson_sums
+from gn3.computations.incremental_correlations import pearson_from_sums
+from gn3.computations.incremental_correlations import update_pearson_sums
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+
+class TestIncrementalCorrelations(TestCase):
+    """Class for testing incremental pearson correlations"""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.matrix = 9.0 + rng.normal(size=(30, 20)).astype("float32")
+        self.matrix[:, 2] = 4.0
+        self.matrix[[3, 8, 21], 5] = np.nan
+        self.primary_vals = 120.0 + rng.normal(size=30)
+        self.primary_vals[[0, 8]] = np.nan
+
+    def assert_arrays_equal(self, arrays, expected_arrays):
+        """Check that correlation arrays match up to rounding"""
+        (corr, p_values, num_overlap) = arrays
+        (expected_corr, expected_p_values, expected_overlap) = expected_arrays
+        np.testing.assert_allclose(corr, expected_corr, atol=1e-9)
+        np.testing.assert_allclose(p_values, expected_p_values, atol=1e-9)
+        np.testing.assert_array_equal(num_overlap, expected_overlap)
+
+    def test_pearson_from_sums(self):
+        """Test that the sums give the correlations of the masked path"""
+        self.assert_arrays_equal(
+            pearson_from_sums(compute_pearson_sums(
+                self.primary_vals, self.matrix, chunk_size=6)),
+            compute_correlation_arrays(
+                self.primary_vals, self.matrix.astype(float), "pearson"))
+
+    def test_update_pearson_sums(self):
+        """Test that updated sums give the correlations of the changed
+        values"""
+        pearson_sums = compute_pearson_sums(self.primary_vals, self.matrix)
+        changed_vals = self.primary_vals.copy()
+        changed_vals[[0, 3, 10, 21]] = [119.5, 121.25, np.nan, 118.0]
+        updated_sums = update_pearson_sums(
+            pearson_sums, self.matrix,
+            [(row, self.primary_vals[row], changed_vals[row])
+             for row in (0, 3, 10, 21)])
+        self.assert_arrays_equal(
+            pearson_from_sums(updated_sums),
+            compute_correlation_arrays(
+                changed_vals, self.matrix.astype(float), "pearson"))
+        self.assertTrue(np.isnan(pearson_from_sums(updated_sums)[0][2]))
+        self.assert_arrays_equal(
+            pearson_from_sums(pearson_sums),
+            compute_correlation_arrays(
+                self.primary_vals, self.matrix.astype(float), "pearson"))
@@ -0,0 +1,128 @@
+"""Module contains the tests for the lit correlation matrix"""
+import fcntl
+import os
+import tempfile
+from unittest import TestCase
+from unittest import mock
+
+import numpy as np
+
+from gn3.computations.correlations import fetch_all_lit_correlation_data
+from gn3.computations.lit_matrix import build_lit_matrix
+from gn3.computations.lit_matrix import build_lit_matrix_cache
+from gn3.computations.lit_matrix import lit_correlations
+from gn3.computations.lit_matrix import load_lit_matrix
+from gn3.computations.lit_matrix import lookup_lit_correlations
+
+LIT_ROWS = [(15, 20, 0.5), (20, 15, 0.7), (20, 17, 0.3), (25, 20, -0.9),
+            (17, 25, 0.1), (30, 40, 0.25)]
+
+
+class TestLitMatrix(TestCase):
+    """Class for testing the lit correlation matrix"""
+
+    def test_build_lit_matrix(self):
+        """Test that the rows hold the correlations of both directions of the
+        table sorted by absolute value"""
+        (gene_ids, indptr, indices, values) = build_lit_matrix(
+            [LIT_ROWS[:4], LIT_ROWS[4:]], num_rows=3)
+        np.testing.assert_array_equal(gene_ids, [15, 17, 20, 25, 30, 40])
+        np.testing.assert_array_equal(indptr, [0, 1, 3, 6, 8, 9, 10])
+        np.testing.assert_array_equal(gene_ids[indices[3:6]], [25, 15, 17])
+        np.testing.assert_allclose(values[3:6], [-0.9, 0.5, 0.3])
+        self.assertEqual(len(build_lit_matrix([])[0]), 0)
+
+    def test_lit_correlations(self):
+        """Test that all the lit correlations of a gene are one sorted
+        slice"""
+        lit_matrix = build_lit_matrix([LIT_ROWS])
+        (gene_ids, values) = lit_correlations(lit_matrix, "20")
+        self.assertEqual(gene_ids.tolist(), [25, 15, 17])
+        self.assertEqual(values.tolist(), [-0.9, 0.5, 0.3])
+        for gene_id in (21, None, "1;2"):
+            self.assertEqual(
+                [array.tolist() for array in lit_correlations(
+                    lit_matrix, gene_id)], [[], []])
+
+    def test_lookup_lit_correlations(self):
+        """Test that the lookups are those of the database"""
+        random = np.random.default_rng(7)
+        # The table has one row per (GeneId1, GeneId2)
+        random_rows = [
+            (gene_id1, gene_id2, value)
+            for ((gene_id1, gene_id2), value) in dict(zip(
+                zip(random.integers(1, 40, 300).tolist(),
+                    random.integers(1, 40, 300).tolist()),
+                random.uniform(-1, 1, 300).round(3).tolist())).items()]
+        for (rows, lookups) in (
+                (LIT_ROWS, (("20", ["15", "17", "25", "30"]),
+                            ("25", ["17", "20"]), ("40", ["30"]),
+                            ("41", ["30"]), (None, ["30"]))),
+                (random_rows, tuple(
+                    (str(gene_id), [str(idx) for idx in range(1, 40)])
+                    for gene_id in range(1, 41)))):
+            lit_matrix = build_lit_matrix(
+                [rows[idx:idx + 64] for idx in range(0, len(rows), 64)])
+            for (input_gene_id, gene_ids) in lookups:
+                conn = mock.Mock()
+                conn.cursor.return_value.fetchall.return_value = [
+                    row for row in rows
+                    if str(input_gene_id) in (str(row[0]), str(row[1]))]
+                self.assertEqual(
+                    lookup_lit_correlations(
+                        lit_matrix, input_gene_id, gene_ids),
+                    fetch_all_lit_correlation_data(
+                        conn, input_gene_id, gene_ids))
+
+    @mock.patch("gn3.computations.lit_matrix.retrieve_lit_correlation_count")
+    @mock.patch("gn3.computations.lit_matrix.retrieve_lit_correlation_chunks")
+    @mock.patch("gn3.computations.lit_matrix.retrieve_lit_correlation_checksum")
+    def test_build_lit_matrix_cache(self, mock_checksum, mock_rows,
+                                    mock_count):
+        """Test that the matrix is built once per checksum of the table, at
+        most every check interval, and that requests open the current one"""
+        mock_count.return_value = len(LIT_ROWS)
+        (mock_checksum.return_value, mock_rows.return_value) = (
+            1234, [LIT_ROWS])
+        self.assertIsNone(load_lit_matrix(""))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.assertIsNone(load_lit_matrix(cache_dir))
+            self.assertEqual(
+                build_lit_matrix_cache(mock.Mock(), cache_dir),
+                os.path.join(cache_dir, "lit_matrix", "1234"))
+            lit_matrix = load_lit_matrix(cache_dir)
+            self.assertTrue(all(isinstance(array, np.memmap)
+                                for array in lit_matrix or ()))
+            self.assertIs(load_lit_matrix(cache_dir), lit_matrix)
+            self.assertIsNone(build_lit_matrix_cache(mock.Mock(), cache_dir))
+            self.assertEqual(mock_checksum.call_count, 1)
+            build_lit_matrix_cache(mock.Mock(), cache_dir, check_interval=0)
+            self.assertEqual(
+                (mock_checksum.call_count, mock_rows.call_count), (2, 1))
+            self.assertIs(load_lit_matrix(cache_dir), lit_matrix)
+            (mock_checksum.return_value, mock_rows.return_value) = (
+                5678, [LIT_ROWS[:2]])
+            build_lit_matrix_cache(mock.Mock(), cache_dir, check_interval=0)
+            (gene_ids, _values) = lit_correlations(
+                load_lit_matrix(cache_dir), 15)
+            self.assertEqual(gene_ids.tolist(), [20])
+            self.assertEqual(
+                sorted(entry for entry in os.listdir(
+                    os.path.join(cache_dir, "lit_matrix"))
+                       if entry.isdigit()), ["5678"])
+            mock_checksum.return_value = None
+            self.assertIsNone(build_lit_matrix_cache(
+                mock.Mock(), cache_dir, check_interval=0))
+
+    @mock.patch("gn3.computations.lit_matrix.retrieve_lit_correlation_checksum")
+    def test_build_lit_matrix_cache_locked(self, mock_checksum):
+        """Test that the matrix is not built while another process holds the
+        lock"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.makedirs(os.path.join(cache_dir, "lit_matrix"))
+            with open(os.path.join(cache_dir, "lit_matrix", "lock"), "w",
+                      encoding="utf-8") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self.assertIsNone(
+                    build_lit_matrix_cache(mock.Mock(), cache_dir))
+        mock_checksum.assert_not_called()
@@ -0,0 +1,72 @@
+"""Module contains the tests for the pearson index of dataset matrices"""
+from unittest import TestCase
+
+import numpy as np
+
+from gn3.computations.pearson_index import build_pearson_index
+from gn3.computations.pearson_index import compute_indexed_pearson
+from gn3.computations.pearson_index import strain_values
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+
+class TestPearsonIndex(TestCase):
+    """Class for testing the pearson index"""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.matrix = 8.0 + rng.normal(size=(40, 30)).astype("float32")
+        self.matrix[:, 3] = 7.5
+        self.matrix[5, 7] = np.nan
+        self.matrix[[1, 2], 11] = np.nan
+        self.primary_vals = 3.0 + rng.normal(size=40)
+
+    def test_build_pearson_index(self):
+        """Test that the index holds the means and centred sums of squares of
+        the traits, NaN for traits with missing values"""
+        (means, sum_squares) = build_pearson_index(self.matrix, chunk_size=7)
+        expected = self.matrix.astype(float)
+        np.testing.assert_allclose(means, expected.mean(axis=0))
+        np.testing.assert_allclose(
+            sum_squares, ((expected - expected.mean(axis=0)) ** 2).sum(axis=0))
+        self.assertEqual(np.flatnonzero(np.isnan(means)).tolist(), [7, 11])
+
+    def test_strain_values(self):
+        """Test that primary values are put in the order of the strains"""
+        np.testing.assert_array_equal(
+            strain_values(["BXD2", "BXD9", "BXD1", "BXD5"],
+                          np.array([2.0, 9.0, 0.0, 5.0]),
+                          ["BXD1", "BXD2", "BXD3", "BXD5"]),
+            [np.nan, 2.0, np.nan, 5.0])
+
+    def test_compute_indexed_pearson(self):
+        """Test that the indexed pearson gives the results of the masked
+        path"""
+        pearson_index = build_pearson_index(self.matrix)
+        for excluded in ([], [0], [4, 5, 6, 30, 39], list(range(0, 40, 3))):
+            with self.subTest(excluded=excluded):
+                primary_vals = self.primary_vals.copy()
+                primary_vals[excluded] = np.nan
+                (corr, p_values, num_overlap) = compute_indexed_pearson(
+                    primary_vals, self.matrix, pearson_index, chunk_size=8)
+                (expected_corr, expected_p_values, expected_overlap) = (
+                    compute_correlation_arrays(
+                        primary_vals, self.matrix.astype(float), "pearson"))
+                np.testing.assert_allclose(corr, expected_corr, atol=1e-9)
+                np.testing.assert_allclose(
+                    p_values, expected_p_values, atol=1e-9)
+                np.testing.assert_array_equal(num_overlap, expected_overlap)
+                self.assertTrue(np.isnan(corr[3]))
+
+    def test_compute_indexed_pearson_fallback(self):
+        """Test that the index is not used when the primary trait lacks too
+        many strains"""
+        pearson_index = build_pearson_index(self.matrix)
+        primary_vals = self.primary_vals.copy()
+        primary_vals[:25] = np.nan
+        self.assertIsNone(compute_indexed_pearson(
+            primary_vals, self.matrix, pearson_index))
+        self.assertIsNone(compute_indexed_pearson(
+            np.full(40, np.nan), self.matrix, pearson_index))
+        self.assertIsNotNone(compute_indexed_pearson(
+            primary_vals, self.matrix, pearson_index,
+            max_excluded_fraction=0.75))
@@ -0,0 +1,67 @@
+"""Module contains the tests for the application process pool"""
+from operator import add
+from unittest import TestCase
+
+from gn3.computations.correlations import compute_all_sample_correlation
+from gn3.computations.correlations import fast_compute_all_sample_correlation
+from gn3.computations.process_pool import configure_pool
+from gn3.computations.process_pool import get_pool
+from gn3.computations.process_pool import pool_chunksize
+from gn3.computations.process_pool import pool_starmap
+from gn3.computations.process_pool import shutdown_pool
+
+
+class TestProcessPool(TestCase):
+    """Class for testing the process pool"""
+
+    def setUp(self):
+        configure_pool(processes=2)
+
+    def tearDown(self):
+        shutdown_pool()
+
+    def test_get_pool_reuses_pool(self):
+        """Test that the pool is created once and reused"""
+        self.assertIs(get_pool(), get_pool())
+
+    def test_shutdown_pool(self):
+        """Test that a new pool is created after a shutdown"""
+        pool = get_pool()
+        shutdown_pool()
+        self.assertIsNot(get_pool(), pool)
+
+    def test_pool_chunksize(self):
+        """Test the configured and the computed chunksizes"""
+        self.assertEqual(pool_chunksize(100), 13)
+        self.assertEqual(pool_chunksize(0), 1)
+        configure_pool(processes=2, chunksize=50)
+        self.assertEqual(pool_chunksize(100), 50)
+
+    def test_pool_starmap(self):
+        """Test that starmap results keep the order of the items"""
+        self.assertEqual(pool_starmap(add, [(idx, idx) for idx in range(20)]),
+                         [2 * idx for idx in range(20)])
+
+    def test_fast_compute_all_sample_correlation(self):
+        """Test that the pool computation gives the same results as the
+        sequential one"""
+        this_trait = {
+            "trait_id": "1455376_at",
+            "trait_sample_data": {
+                f"BXD{idx}": 5.0 + (idx * 7 % 11) / 10 for idx in range(1, 20)}}
+        target_dataset = [
+            {"trait_id": f"{trait}_at",
+             "trait_sample_data": {
+                 f"BXD{idx}": 5.0 + (idx * trait % 13) / 10
+                 for idx in range(1, 20)}}
+            for trait in range(1, 30)]
+        results = fast_compute_all_sample_correlation(
+            this_trait=this_trait, target_dataset=target_dataset)
+        expected = compute_all_sample_correlation(
+            this_trait=this_trait, target_dataset=target_dataset)
+        self.assertEqual([list(item.keys()) for item in results],
+                         [list(item.keys()) for item in expected])
+        for result, expected_result in zip(results, expected):
+            (trait_name, values), = result.items()
+            for key, value in values.items():
+                self.assertAlmostEqual(value, expected_result[trait_name][key])
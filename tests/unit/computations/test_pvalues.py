@@ -0,0 +1,33 @@
+"""Module contains the tests for the batched p value stage"""
+from unittest import TestCase
+
+import numpy as np
+import scipy.stats
+
+from gn3.computations.pvalues import compute_corr_p_values
+
+
+class TestPValues(TestCase):
+    """Class for testing the batched p values"""
+
+    def test_compute_corr_p_values(self):
+        """Test that the batched p values match scipy's per call ones"""
+        primary_values = [9.3, 2.2, 5.4, 7.2, 6.4, 7.6, 3.8, 1.8, 8.4, 0.2]
+        targets = [
+            [0.6, 3.97, 5.82, 8.21, 1.65, 4.55, 6.72, 9.5, 7.33, 2.34],
+            [9.1, 2.5, 5.0, 7.1, 6.9, 7.0, 3.1, 1.2, 8.8, 0.9],
+            [1.1, 1.3, 5.2, 2.2, 6.1, 1.0, 3.8, 2.9, 3.3, 4.1]]
+        for corr_fn in (scipy.stats.pearsonr, scipy.stats.spearmanr):
+            with self.subTest(corr_fn=corr_fn):
+                expected = [corr_fn(primary_values, target)
+                            for target in targets]
+                p_values = compute_corr_p_values(
+                    [corr for corr, _ in expected], [10, 10, 10])
+                np.testing.assert_allclose(
+                    p_values, [p_value for _, p_value in expected])
+
+    def test_compute_corr_p_values_edge_cases(self):
+        """Test perfect correlations, two samples and missing coefficients"""
+        np.testing.assert_array_equal(
+            compute_corr_p_values([1.0, -1.0, 0.5, np.nan], [8, 8, 2, 8]),
+            [0.0, 0.0, 1.0, np.nan])
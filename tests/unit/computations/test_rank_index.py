@@ -0,0 +1,69 @@
+"""Module contains the tests for the rank index of dataset matrices"""
+from unittest import TestCase
+
+import numpy as np
+import scipy.stats
+
+from gn3.computations.rank_index import build_rank_index
+from gn3.computations.rank_index import compute_indexed_spearman
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+
+class TestRankIndex(TestCase):
+    """Class for testing the rank index"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.matrix = rng.integers(0, 6, size=(30, 25)).astype("float32")
+        self.matrix[:, 3] = 2.0
+        self.matrix[[4, 9], 5] = np.nan
+        self.matrix[[4, 9], 6] = np.nan
+        self.matrix[12, 7] = np.nan
+        self.primary_vals = 1.0 + rng.integers(0, 8, size=30)
+
+    def test_build_rank_index(self):
+        """Test that the index holds the ranks of every trait over its own
+        strains and their centred sums of squares"""
+        (ranks, num_missing, sum_squares) = build_rank_index(
+            self.matrix, chunk_size=4)
+        self.assertEqual(ranks.dtype, np.float32)
+        np.testing.assert_array_equal(
+            ranks[:, 0], scipy.stats.rankdata(self.matrix[:, 0]))
+        np.testing.assert_array_equal(
+            ranks[:, 7], np.insert(scipy.stats.rankdata(
+                np.delete(self.matrix[:, 7], 12)), 12, 0))
+        self.assertEqual(num_missing[[0, 5, 7]].tolist(), [0, 2, 1])
+        self.assertEqual(sum_squares[3], 0)
+        self.assertAlmostEqual(
+            sum_squares[5],
+            ((scipy.stats.rankdata(np.delete(self.matrix[:, 5], [4, 9])) -
+              14.5) ** 2).sum())
+
+    def test_compute_indexed_spearman(self):
+        """Test that the indexed spearman gives the results of the masked
+        path"""
+        rank_index = build_rank_index(self.matrix)
+        for excluded in ([], [4, 9]):
+            with self.subTest(excluded=excluded):
+                primary_vals = self.primary_vals.copy()
+                primary_vals[excluded] = np.nan
+                (corr, p_values, num_overlap) = compute_indexed_spearman(
+                    primary_vals, self.matrix, rank_index, chunk_size=6)
+                (expected_corr, expected_p_values, expected_overlap) = (
+                    compute_correlation_arrays(
+                        primary_vals, self.matrix.astype(float), "spearman"))
+                np.testing.assert_allclose(corr, expected_corr, atol=1e-12)
+                np.testing.assert_allclose(
+                    p_values, expected_p_values, atol=1e-12)
+                np.testing.assert_array_equal(num_overlap, expected_overlap)
+                self.assertTrue(np.isnan(corr[3]))
+
+    def test_compute_indexed_spearman_fallback(self):
+        """Test that the index is not used when no trait's ranks apply"""
+        rank_index = build_rank_index(self.matrix[:, :5])
+        primary_vals = self.primary_vals.copy()
+        primary_vals[10] = np.nan
+        self.assertIsNone(compute_indexed_spearman(
+            primary_vals, self.matrix[:, :5], rank_index))
+        self.assertIsNone(compute_indexed_spearman(
+            np.full(30, np.nan), self.matrix, build_rank_index(self.matrix)))
@@ -0,0 +1,102 @@
+"""Module contains the tests for the correlation result cache"""
+from unittest import TestCase
+from unittest import mock
+
+import numpy as np
+import redis
+
+from gn3.computations.result_cache import cached_correlation_arrays
+from gn3.computations.result_cache import configure_result_cache
+from gn3.computations.result_cache import correlation_cache_key
+from gn3.computations.result_cache import result_cache_stats
+
+
+def correlation_arrays(num_traits):
+    """Return correlation arrays of NUM_TRAITS float64 values each"""
+    return (np.zeros(num_traits), np.ones(num_traits), np.full(num_traits, 9.0))
+
+
+class TestResultCache(TestCase):
+    """Class for testing the correlation result cache"""
+
+    def setUp(self):
+        configure_result_cache(max_bytes=3 * 3 * 8 * 10)
+
+    def tearDown(self):
+        configure_result_cache()
+
+    def test_correlation_cache_key(self):
+        """Test that the key changes with every part of the input"""
+        samples = ["BXD1", "BXD2"]
+        key = correlation_cache_key(
+            "ProbeSet", "HC_M2_0606_P", 0, "pearson", samples,
+            np.array([1.0, np.nan]))
+        self.assertEqual(key, correlation_cache_key(
+            "ProbeSet", "HC_M2_0606_P", 0, "pearson", samples,
+            np.array([1.0, np.nan])))
+        for other_key in (
+                correlation_cache_key("ProbeSet", "HC_M2_0606_P", 1,
+                                      "pearson", samples,
+                                      np.array([1.0, np.nan])),
+                correlation_cache_key("ProbeSet", "HC_M2_0606_P", 0,
+                                      "spearman", samples,
+                                      np.array([1.0, np.nan])),
+                correlation_cache_key("ProbeSet", "HC_M2_0606_P", 0,
+                                      "pearson", samples,
+                                      np.array([1.0, 2.0]))):
+            self.assertNotEqual(key, other_key)
+
+    def test_hits_and_misses(self):
+        """Test that cached arrays are returned without computing them"""
+        compute = mock.Mock(return_value=correlation_arrays(10))
+        for _ in range(3):
+            arrays = cached_correlation_arrays("key", compute)
+        compute.assert_called_once_with()
+        self.assertIs(arrays, compute.return_value)
+        self.assertEqual(
+            result_cache_stats(),
+            {"hits": 2, "redis_hits": 0, "misses": 1, "redis_errors": 0,
+             "entries": 1, "size": 240, "max_bytes": 720})
+
+    def test_least_recently_used_eviction(self):
+        """Test that the least recently used entries are evicted to keep the
+        cache within its size"""
+        for key in ("a", "b", "c"):
+            cached_correlation_arrays(key, lambda: correlation_arrays(10))
+        cached_correlation_arrays("a", mock.Mock())
+        cached_correlation_arrays("d", lambda: correlation_arrays(10))
+        self.assertEqual(result_cache_stats()["entries"], 3)
+        compute = mock.Mock(return_value=correlation_arrays(10))
+        cached_correlation_arrays("a", compute)
+        compute.assert_not_called()
+        cached_correlation_arrays("b", compute)
+        compute.assert_called_once_with()
+        cached_correlation_arrays("big", lambda: correlation_arrays(100))
+        self.assertEqual(result_cache_stats()["size"], 720)
+
+    @mock.patch("gn3.computations.result_cache.redis.Redis.from_url")
+    def test_redis_tier(self, mock_from_url):
+        """Test that the redis tier is read on a local miss and written on a
+        miss of both tiers, and that its errors are handled as misses"""
+        redis_conn = mock_from_url.return_value
+        stored = {}
+        redis_conn.get.side_effect = stored.get
+        redis_conn.set.side_effect = (
+            lambda key, value, ex: stored.__setitem__(key, value))
+        configure_result_cache(redis_uri="redis://localhost:6379/0",
+                               redis_ttl=60)
+        cached_correlation_arrays("key", lambda: correlation_arrays(5))
+        redis_conn.set.assert_called_once_with("key", mock.ANY, ex=60)
+
+        configure_result_cache(redis_uri="redis://localhost:6379/0")
+        arrays = cached_correlation_arrays("key", mock.Mock())
+        for (array, expected) in zip(arrays, correlation_arrays(5)):
+            np.testing.assert_array_equal(array, expected)
+        self.assertEqual(result_cache_stats()["redis_hits"], 1)
+
+        redis_conn.get.side_effect = redis.exceptions.ConnectionError
+        redis_conn.set.side_effect = redis.exceptions.ConnectionError
+        compute = mock.Mock(return_value=correlation_arrays(5))
+        self.assertIs(cached_correlation_arrays("other", compute),
+                      compute.return_value)
+        self.assertEqual(result_cache_stats()["redis_errors"], 2)
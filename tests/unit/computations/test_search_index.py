@@ -0,0 +1,82 @@
+"""Module contains the tests for the approximate search index"""
+from unittest import TestCase
+
+import numpy as np
+
+from gn3.computations.correlations import top_n_indices
+from gn3.computations.search_index import build_search_index
+from gn3.computations.search_index import compute_approximate_correlation
+from gn3.computations.search_index import search_candidates
+from gn3.computations.search_index import zscore_traits
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+
+
+class TestSearchIndex(TestCase):
+    """Class for testing the approximate search index"""
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        # Traits in modules sharing a factor, like co-expressed genes
+        modules = rng.integers(0, 12, size=900)
+        self.matrix = (
+            rng.normal(size=(40, 12))[:, modules] *
+            rng.uniform(0.5, 2.0, size=900) +
+            rng.normal(size=(40, 900))).astype("float32")
+        self.matrix[3, 10] = np.nan
+        self.primary_vals = (self.matrix[:, 17].astype(float) +
+                             rng.normal(size=40) * 0.5)
+
+    def test_zscore_traits(self):
+        """Test that dot products of z-scored traits are pearson r"""
+        vectors = zscore_traits(self.matrix[:, 20:40].astype(float))
+        np.testing.assert_allclose(
+            (vectors.T @ vectors)[0, 1:],
+            compute_correlation_arrays(self.matrix[:, 20].astype(float),
+                                       self.matrix[:, 21:40].astype(float))[0],
+            atol=1e-6)
+        self.assertEqual(
+            zscore_traits(self.matrix[:, 10:11].astype(float))[3, 0], 0)
+        np.testing.assert_array_equal(
+            zscore_traits(np.array([[1.0], [1.0]])), [[0.0], [0.0]])
+
+    def test_build_search_index(self):
+        """Test that every trait is in exactly one cluster"""
+        (centroids, order, offsets) = build_search_index(
+            self.matrix, num_clusters=30, training_size=500)
+        self.assertEqual(centroids.shape, (40, 30))
+        self.assertEqual(sorted(order.tolist()), list(range(900)))
+        self.assertEqual((offsets[0], offsets[-1], len(offsets)),
+                         (0, 900, 31))
+        np.testing.assert_allclose(
+            np.sqrt((centroids ** 2).sum(axis=0)), 1.0, rtol=1e-5)
+
+    def test_search_candidates(self):
+        """Test that clusters are probed until there are enough candidates"""
+        search_index = build_search_index(self.matrix, num_clusters=30)
+        few = search_candidates(
+            self.primary_vals, search_index, top_n=1, num_probes=2)
+        many = search_candidates(
+            self.primary_vals, search_index, top_n=30, num_probes=2)
+        self.assertLess(len(few), len(many))
+        self.assertGreaterEqual(len(many), 600)
+        self.assertTrue(set(few.tolist()) <= set(many.tolist()))
+        self.assertEqual(few.tolist(), sorted(few.tolist()))
+
+    def test_compute_approximate_correlation(self):
+        """Test that the approximate top n are exact correlations that mostly
+        agree with an exhaustive search"""
+        search_index = build_search_index(self.matrix)
+        (candidates, corr, _p_values, num_overlap) = (
+            compute_approximate_correlation(
+                self.primary_vals, self.matrix, search_index, top_n=10,
+                num_probes=4))
+        (exact_corr, _exact_p_values, exact_overlap) = (
+            compute_correlation_arrays(
+                self.primary_vals, self.matrix.astype(float)))
+        np.testing.assert_allclose(corr, exact_corr[candidates])
+        np.testing.assert_array_equal(num_overlap, exact_overlap[candidates])
+        self.assertLess(len(candidates), 900)
+        top_n = candidates[top_n_indices(corr, 10)]
+        self.assertEqual(top_n[0], 17)
+        self.assertEqual(sorted(top_n.tolist()),
+                         sorted(top_n_indices(exact_corr, 10).tolist()))
@@ -0,0 +1,86 @@
+"""Module contains the tests for the vectorized tissue correlations"""
+from unittest import TestCase
+
+import numpy as np
+
+from gn3.computations.correlations import compute_tissue_correlation
+from gn3.computations.tissue_matrix import build_tissue_matrix
+from gn3.computations.tissue_matrix import compute_vectorized_tissue_correlation
+
+
+class TestTissueMatrix(TestCase):
+    """Class for testing the vectorized tissue correlations"""
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.symbol_tissue_vals_dict = {
+            f"gene{idx}": rng.normal(size=12).round(3).tolist()
+            for idx in range(20)}
+        self.trait_symbol_dict = {
+            f"{idx}_at": (f"Gene{idx % 25}" if idx % 7 else None)
+            for idx in range(40)}
+        self.primary_tissue_dict = {
+            "trait_id": "1449593_at",
+            "tissue_values": rng.normal(size=12).round(3).tolist()}
+
+    def assert_results_almost_equal(self, results, expected_results):
+        """Check that the results of the traits match up to rounding"""
+        (results, expected_results) = (
+            {trait: values for result in results
+             for (trait, values) in result.items()},
+            {trait: values for result in expected_results
+             for (trait, values) in result.items()})
+        self.assertEqual(results.keys(), expected_results.keys())
+        for (trait, values) in results.items():
+            self.assertEqual(values["tissue_number"],
+                             expected_results[trait]["tissue_number"])
+            for key in ("tissue_corr", "tissue_p_val"):
+                self.assertAlmostEqual(values[key],
+                                       expected_results[trait][key])
+
+    def test_build_tissue_matrix(self):
+        """Test that the matrix has a row of tissue values per symbol"""
+        (symbol_index, matrix) = build_tissue_matrix(
+            {"gene1": [1, 2, 3], "gene2": [4, 5, 6]})
+        self.assertEqual(symbol_index, {"gene1": 0, "gene2": 1})
+        np.testing.assert_array_equal(matrix, [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(build_tissue_matrix({})[1].shape, (0, 0))
+        with self.assertRaises(ValueError):
+            build_tissue_matrix({"gene1": [1, 2, 3], "gene2": [4, 5]})
+
+    def test_compute_vectorized_tissue_correlation(self):
+        """Test that the results are those of `compute_tissue_correlation`"""
+        target_tissues_data = {
+            "trait_symbol_dict": self.trait_symbol_dict,
+            "symbol_tissue_vals_dict": self.symbol_tissue_vals_dict}
+        for corr_method in ("pearson", "spearman"):
+            for top_n in (None, 5):
+                results = compute_vectorized_tissue_correlation(
+                    self.primary_tissue_dict, target_tissues_data,
+                    corr_method, top_n)
+                expected_results = compute_tissue_correlation(
+                    self.primary_tissue_dict, target_tissues_data,
+                    corr_method, top_n)
+                # Traits of the same symbol tie, so compare the correlations
+                # in order and the values by trait
+                np.testing.assert_allclose(
+                    [values["tissue_corr"] for result in results
+                     for values in result.values()],
+                    [values["tissue_corr"] for result in expected_results
+                     for values in result.values()])
+                if top_n is None:
+                    self.assert_results_almost_equal(results, expected_results)
+
+    def test_compute_vectorized_tissue_correlation_no_traits(self):
+        """Test that traits without tissue values give no results"""
+        self.assertEqual(compute_vectorized_tissue_correlation(
+            self.primary_tissue_dict,
+            {"trait_symbol_dict": {"1_at": None, "2_at": "missing"},
+             "symbol_tissue_vals_dict": self.symbol_tissue_vals_dict},
+            "pearson"), [])
+        with self.assertRaises(ValueError):
+            compute_vectorized_tissue_correlation(
+                {"tissue_values": [1, 2, 3]},
+                {"trait_symbol_dict": self.trait_symbol_dict,
+                 "symbol_tissue_vals_dict": self.symbol_tissue_vals_dict},
+                "pearson")
@@ -0,0 +1,181 @@
+"""Module contains the tests for the vectorized correlation engine"""
+import json
+import os
+from unittest import TestCase
+
+import numpy as np
+
+from gn3.computations.correlations import compute_all_sample_correlation
+from gn3.computations.vectorized_correlations import build_sample_matrix
+from gn3.computations.vectorized_correlations import compute_correlation_arrays
+from gn3.computations.vectorized_correlations import format_correlation_results
+from gn3.computations.vectorized_correlations import compute_vectorized_sample_correlation
+from gn3.computations.vectorized_correlations import compute_shared_correlation_arrays
+from gn3.computations.process_pool import configure_pool
+from gn3.computations.process_pool import shutdown_pool
+
+TEST_DATA_DIR = os.path.join(
+    os.path.dirname(__file__), "correlation_test_data")
+
+
+def load_test_data():
+    """Load the primary trait and target dataset test data adding a few
+    targets with missing and constant values"""
+    with open(os.path.join(TEST_DATA_DIR, "this_trait_data.json"),
+              encoding="utf-8") as _file:
+        this_trait = json.load(_file)
+    with open(os.path.join(TEST_DATA_DIR, "target_dataset.json"),
+              encoding="utf-8") as _file:
+        target_dataset = [
+            {"trait_id": trait["trait_id"],
+             "trait_sample_data": trait.get(
+                 "trait_sample_data", trait.get("sample_data"))}
+            for trait in json.load(_file)]
+    samples = list(this_trait["trait_sample_data"].keys())
+    target_dataset += [
+        {"trait_id": "missing_at",
+         "trait_sample_data": {
+             sample: (float(idx % 7) if idx % 3 else None)
+             for idx, sample in enumerate(samples)}},
+        {"trait_id": "few_at",
+         "trait_sample_data": dict(zip(samples[:5], [1.0, 2.0, 3, 4, 5]))},
+        {"trait_id": "constant_at",
+         "trait_sample_data": {sample: 6.2 for sample in samples}}]
+    return (this_trait, target_dataset)
+
+
+class TestVectorizedCorrelation(TestCase):
+    """Class for testing the vectorized correlation engine"""
+
+    def test_build_sample_matrix(self):
+        """Test that the matrix is built over the primary trait's samples with
+        NaN for the missing values"""
+        this_trait_samples = {"BXD1": 6.1, "BXD2": 0, "BXD5": "5.2"}
+        target_dataset = [
+            {"trait_id": "1412_at",
+             "trait_sample_data": {"BXD5": 1.0, "BXD1": 2.0, "BXD9": 3.0}},
+            {"trait_id": "1418_at",
+             "trait_sample_data": {"BXD1": None, "BXD2": 4.0}}]
+        (primary_vals, target_matrix,
+         trait_names) = build_sample_matrix(this_trait_samples, target_dataset)
+        np.testing.assert_array_equal(primary_vals, [6.1, np.nan, 5.2])
+        np.testing.assert_array_equal(
+            target_matrix, [[2.0, np.nan], [np.nan, 4.0], [1.0, np.nan]])
+        self.assertEqual(trait_names, ["1412_at", "1418_at"])
+
+    def test_compute_correlation_arrays(self):
+        """Test the coefficients, p values and overlap of the arrays"""
+        primary_vals = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, np.nan])
+        target_matrix = np.array(
+            [[2.0, 6.0], [4.0, 5.0], [6.0, 4.0], [8.0, 3.0], [10.0, 2.0],
+             [12.0, np.nan], [7.0, 1.0]])
+        for corr_method in ("pearson", "spearman"):
+            with self.subTest(corr_method=corr_method):
+                (corr, p_values, num_overlap) = compute_correlation_arrays(
+                    primary_vals, target_matrix, corr_method)
+                np.testing.assert_allclose(corr, [1.0, -1.0])
+                np.testing.assert_allclose(p_values, [0.0, 0.0], atol=1e-12)
+                np.testing.assert_array_equal(num_overlap, [6, 5])
+
+    def test_compute_correlation_arrays_unknown_method(self):
+        """Test that unsupported methods raise an error"""
+        with self.assertRaises(ValueError):
+            compute_correlation_arrays(
+                np.array([1.0, 2.0]), np.array([[1.0], [2.0]]), "kendall")
+
+    def test_format_correlation_results(self):
+        """Test that the results are filtered and sorted by absolute r"""
+        results = format_correlation_results(
+            ["a", "b", "c", "d"], np.array([0.2, -0.9, np.nan, 0.95]),
+            np.array([0.5, 0.01, np.nan, 0.001]), np.array([10, 10, 10, 5]))
+        self.assertEqual(
+            results,
+            [{"b": {"corr_coefficient": -0.9, "p_value": 0.01,
+                    "num_overlap": 10}},
+             {"a": {"corr_coefficient": 0.2, "p_value": 0.5,
+                    "num_overlap": 10}}])
+
+    def test_matches_compute_all_sample_correlation(self):
+        """Test that the vectorized engine gives the same results as the per
+        pair computation"""
+        (this_trait, target_dataset) = load_test_data()
+        self.assert_matches_compute_all_sample_correlation(
+            this_trait, target_dataset)
+
+    def test_grouped_missing_value_patterns(self):
+        """Test that traits grouped by their missing value pattern give the
+        same results as the per pair computation"""
+        (this_trait, target_dataset) = load_test_data()
+        target_dataset = [
+            {"trait_id": f"{trait['trait_id']}_{idx}",
+             "trait_sample_data": {
+                 sample: (value + (position == idx) * (idx + 1) / 10
+                          if value is not None and
+                          trait["trait_id"] != "constant_at" else value)
+                 for position, (sample, value) in enumerate(
+                     trait["trait_sample_data"].items())}}
+            for idx in range(10) for trait in target_dataset]
+        self.assert_matches_compute_all_sample_correlation(
+            this_trait, target_dataset)
+
+    def test_patterns_without_shared_samples(self):
+        """Test that a group of traits sharing no samples, or one sample, with
+        the primary trait gets NaN coefficients instead of failing"""
+        primary_vals = np.array([1.0, 2.0, 3.0, np.nan, np.nan, np.nan])
+        for present in ([3, 4, 5], [2, 3, 4, 5], []):
+            target_matrix = np.full((6, 10), np.nan)
+            target_matrix[present] = np.arange(
+                len(present) * 10).reshape(len(present), 10) + 1.0
+            for corr_method in ("pearson", "spearman", "bicor"):
+                with self.subTest(present=present, corr_method=corr_method):
+                    (corr, p_values, num_overlap) = (
+                        compute_correlation_arrays(
+                            primary_vals, target_matrix, corr_method))
+                    self.assertTrue(np.isnan(corr).all())
+                    self.assertEqual(
+                        format_correlation_results(
+                            list(range(10)), corr, p_values, num_overlap),
+                        [])
+
+    def assert_matches_compute_all_sample_correlation(self, this_trait,
+                                                      target_dataset):
+        """Check the vectorized results against the per pair ones"""
+        for corr_method in ("pearson", "spearman", "bicor"):
+            with self.subTest(corr_method=corr_method):
+                expected = compute_all_sample_correlation(
+                    this_trait=this_trait, target_dataset=target_dataset,
+                    corr_method=corr_method)
+                results = compute_vectorized_sample_correlation(
+                    this_trait=this_trait, target_dataset=target_dataset,
+                    corr_method=corr_method)
+                self.assertEqual([list(item.keys()) for item in results],
+                                 [list(item.keys()) for item in expected])
+                for result, expected_result in zip(results, expected):
+                    (trait_name, values), = result.items()
+                    expected_values = expected_result[trait_name]
+                    self.assertEqual(values["num_overlap"],
+                                     expected_values["num_overlap"])
+                    self.assertAlmostEqual(
+                        values["corr_coefficient"],
+                        expected_values["corr_coefficient"])
+                    self.assertAlmostEqual(values["p_value"],
+                                           expected_values["p_value"])
+
+    def test_compute_shared_correlation_arrays(self):
+        """Test that the shared memory path gives the same arrays as the
+        single process one"""
+        (this_trait, target_dataset) = load_test_data()
+        (primary_vals, target_matrix, _trait_names) = build_sample_matrix(
+            this_trait["trait_sample_data"], target_dataset * 5)
+        configure_pool(processes=2, chunksize=4)
+        try:
+            for corr_method in ("pearson", "spearman"):
+                with self.subTest(corr_method=corr_method):
+                    for result, expected in zip(
+                            compute_shared_correlation_arrays(
+                                primary_vals, target_matrix, corr_method),
+                            compute_correlation_arrays(
+                                primary_vals, target_matrix, corr_method)):
+                        np.testing.assert_allclose(result, expected)
+        finally:
+            shutdown_pool()
@@ -2,7 +2,14 @@
 
 from unittest import mock, TestCase
 from gn3.db.datasets import (
+    cached_dataset_metadata,
     retrieve_dataset_name,
+    retrieve_trait_dataset,
+    invalidate_dataset_metadata,
+    warm_dataset_metadata_cache,
+    configure_dataset_metadata_cache,
+    retrieve_dataset_data_chunks,
+    retrieve_dataset_trait_names,
     retrieve_riset_fields,
     retrieve_geno_riset_fields,
     retrieve_publish_riset_fields,
@@ -11,6 +18,12 @@ from gn3.db.datasets import (
 class TestDatasetsDBFunctions(TestCase):
     """Test cases for datasets functions."""
 
+    def setUp(self):
+        configure_dataset_metadata_cache()
+
+    def tearDown(self):
+        configure_dataset_metadata_cache()
+
     def test_retrieve_dataset_name(self):
         """Test that the function is called correctly."""
         for trait_type, thresh, trait_name, dataset_name, columns, table in [
@@ -131,3 +144,165 @@ class TestDatasetsDBFunctions(TestCase):
                             " WHERE GenoFreeze.InbredSetId = InbredSet.Id"
                             " AND GenoFreeze.Name = %(name)s"),
                         {"name": trait_name})
+
+    @mock.patch("gn3.db.datasets.SSCursor")
+    def test_retrieve_dataset_data_queries(self, _mock_sscursor):
+        """
+        Test that the rows of all the traits in a dataset are streamed from
+        one query for each dataset type.
+        """
+        for dataset_type, table, trait_column in [
+                ["ProbeSet", "ProbeSetData", "ProbeSet.Name"],
+                ["Publish", "PublishData", "PublishXRef.Id"],
+                ["Geno", "GenoData", "Geno.Name"]]:
+            db_mock = mock.MagicMock()
+            with self.subTest(dataset_type=dataset_type):
+                with db_mock.cursor() as cursor:
+                    cursor.fetchmany.side_effect = [
+                        [("trait", "BXD1", 9.1)], []]
+                    self.assertEqual(
+                        list(retrieve_dataset_data_chunks(
+                            dataset_type, "testDatasetName", db_mock)),
+                        [[("trait", "BXD1", 9.1)]])
+                    (query, params), _ = cursor.execute.call_args
+                    self.assertTrue(query.startswith(
+                        f"SELECT {trait_column}, Strain.Name, {table}.value"))
+                    self.assertTrue(query.endswith(
+                        ".StrainId = Strain.Id"))
+                    self.assertIn("Freeze.Name = %(dataset_name)s", query)
+                    self.assertEqual(
+                        params, {"dataset_name": "testDatasetName"})
+
+    def test_retrieve_dataset_trait_names(self):
+        """
+        Test that the names of all the traits in a dataset are retrieved
+        without their data.
+        """
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchall.return_value = [("1412_at",), ("14192_at",)]
+            self.assertEqual(
+                retrieve_dataset_trait_names(
+                    "ProbeSet", "testDatasetName", db_mock),
+                ["1412_at", "14192_at"])
+            (query, params), _ = cursor.execute.call_args
+            self.assertTrue(query.startswith("SELECT ProbeSet.Name FROM"))
+            self.assertNotIn("ProbeSetData", query)
+            self.assertEqual(params, {"dataset_name": "testDatasetName"})
+
+    @mock.patch("gn3.db.datasets.SSCursor")
+    def test_retrieve_dataset_data_chunks(self, mock_sscursor):
+        """
+        Test that the rows of a dataset are streamed with a server side cursor
+        FETCH_SIZE at a time, of the given strains only when they are given.
+        """
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchmany.side_effect = [
+                [("trait", "BXD1", 9.1), ("trait", "BXD2", 8.2)],
+                [("trait", "BXD5", None)], []]
+            self.assertEqual(
+                list(retrieve_dataset_data_chunks(
+                    "Geno", "testDatasetName", db_mock,
+                    strain_names=["BXD1", "BXD2", "BXD5"], fetch_size=2)),
+                [[("trait", "BXD1", 9.1), ("trait", "BXD2", 8.2)],
+                 [("trait", "BXD5", None)]])
+            db_mock.cursor.assert_called_with(mock_sscursor)
+            cursor.fetchmany.assert_called_with(2)
+            (query, params), _ = cursor.execute.call_args
+            self.assertTrue(query.startswith(
+                "SELECT Geno.Name, Strain.Name, GenoData.value"))
+            self.assertTrue(query.endswith(
+                " AND Strain.Name IN (%(strain0)s, %(strain1)s, %(strain2)s)"))
+            self.assertEqual(
+                params, {"dataset_name": "testDatasetName", "strain0": "BXD1",
+                         "strain1": "BXD2", "strain2": "BXD5"})
+            cursor.execute.reset_mock()
+            self.assertEqual(
+                list(retrieve_dataset_data_chunks(
+                    "Geno", "testDatasetName", db_mock, strain_names=[])),
+                [])
+            cursor.execute.assert_not_called()
+
+    def test_cached_dataset_metadata(self):
+        """
+        Test that the metadata of a dataset is retrieved once until it expires
+        or is invalidated, and every time with a TTL of 0.
+        """
+        retrieve = mock.Mock(return_value={"dataset_name": "prbDb"})
+        key = ("ProbeSet", "prbDb", 0)
+        for _ in range(2):
+            self.assertEqual(
+                cached_dataset_metadata(key, retrieve),
+                {"dataset_name": "prbDb"})
+        self.assertEqual(retrieve.call_count, 1)
+        self.assertEqual(invalidate_dataset_metadata("Publish"), 0)
+        self.assertEqual(invalidate_dataset_metadata("ProbeSet", "prbDb"), 1)
+        cached_dataset_metadata(key, retrieve)
+        self.assertEqual(retrieve.call_count, 2)
+        with mock.patch("gn3.db.datasets.time.monotonic",
+                        return_value=float("inf")):
+            cached_dataset_metadata(key, retrieve)
+        self.assertEqual(retrieve.call_count, 3)
+        configure_dataset_metadata_cache(ttl=0)
+        for _ in range(2):
+            cached_dataset_metadata(key, retrieve)
+        self.assertEqual(retrieve.call_count, 5)
+
+    def test_retrieve_trait_dataset(self):
+        """
+        Test that the dataset of the traits of a dataset is retrieved once,
+        and that of `Temp` traits for each trait.
+        """
+        for trait_type, dataset_name, queries in [
+                ["ProbeSet", "prbDb", 2], ["Temp", "tmpDb", 4]]:
+            db_mock = mock.MagicMock()
+            with self.subTest(trait_type=trait_type):
+                with db_mock.cursor() as cursor:
+                    cursor.fetchone.side_effect = [
+                        (1, dataset_name, f"{dataset_name}Full",
+                         f"{dataset_name}Short", "log2"),
+                        ("BXD300", 2)] * 2
+                    datasets = [
+                        retrieve_trait_dataset(
+                            trait_type,
+                            {"trait_name": trait_name,
+                             "db": {"dataset_name": dataset_name}},
+                            0, db_mock)
+                        for trait_name in ("trait1", "trait2")]
+                    self.assertEqual(cursor.execute.call_count, queries)
+                    self.assertEqual(datasets[0], datasets[1])
+                    self.assertEqual(
+                        (datasets[0]["display_name"], datasets[0]["riset"],
+                         datasets[0]["type"]),
+                        (dataset_name, "BXD", trait_type))
+
+    def test_warm_dataset_metadata_cache(self):
+        """
+        Test that the metadata of all the datasets is retrieved with a query
+        for each dataset type and cached under each of their names.
+        """
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchall.side_effect = [
+                [(1, "prbDb", "prbDbFull", None, "log2", "BXD300", 2)],
+                [(3, "pubDb", "pubDbFull", "pubDbShort", "BXD", 1)],
+                []]
+            self.assertEqual(warm_dataset_metadata_cache(0, db_mock), 5)
+            self.assertEqual(cursor.execute.call_count, 3)
+            (query, params), _ = cursor.execute.call_args_list[0]
+            self.assertTrue(query.startswith(
+                "SELECT ProbeSetFreeze.Id, ProbeSetFreeze.Name"))
+            self.assertIn("ProbeSetFreeze.public > %(threshold)s", query)
+            self.assertEqual(params, {"threshold": 0})
+        retrieve = mock.Mock()
+        self.assertEqual(
+            cached_dataset_metadata(("ProbeSet", "prbDbFull", 0), retrieve),
+            {"dataset_id": 1, "dataset_name": "prbDb",
+             "dataset_fullname": "prbDbFull", "dataset_shortname": None,
+             "dataset_datascale": "log2", "riset": "BXD", "risetid": 2})
+        self.assertEqual(
+            cached_dataset_metadata(
+                ("Publish", "pubDbShort", 0), retrieve)["dataset_id"], 3)
+        retrieve.assert_not_called()
+        self.assertEqual(invalidate_dataset_metadata(dataset_name="pubDb"), 3)
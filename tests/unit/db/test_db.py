@@ -39,12 +39,25 @@ class TestCrudMethods(TestCase):
                     submitter="Rob",
                     post_pub_description="Test Post Pub"),
                 where=Phenotype(id_=1, owner="Rob")), 1)
-            cursor.execute.assert_called_once_with(
-                "UPDATE Phenotype SET "
-                "Pre_publication_description = %s, "
-                "Post_publication_description = %s, "
-                "Submitter = %s WHERE id = %s AND Owner = %s",
-                ('Test Pre Pub', 'Test Post Pub', 'Rob', 1, 'Rob'))
+            cursor.execute.assert_has_calls([
+                mock.call(
+                    "INSERT INTO dataset_generation "
+                    "(dataset_type, dataset_name, generation) "
+                    "SELECT DISTINCT %s, PublishFreeze.Name, 1 FROM "
+                    "Phenotype JOIN PublishXRef "
+                    "ON PublishXRef.PhenotypeId = Phenotype.Id "
+                    "JOIN PublishFreeze "
+                    "ON PublishFreeze.InbredSetId = PublishXRef.InbredSetId "
+                    "WHERE Phenotype.id = %s AND Phenotype.Owner = %s "
+                    "ON DUPLICATE KEY UPDATE generation = generation + 1",
+                    ("Publish", 1, "Rob")),
+                mock.call(
+                    "UPDATE Phenotype SET "
+                    "Pre_publication_description = %s, "
+                    "Post_publication_description = %s, "
+                    "Submitter = %s WHERE id = %s AND Owner = %s",
+                    ('Test Pre Pub', 'Test Post Pub', 'Rob', 1, 'Rob'))])
+            self.assertEqual(cursor.execute.call_count, 2)
 
     def test_fetch_phenotype(self):
         """Test that a single phenotype is fetched properly
@@ -0,0 +1,69 @@
+"""Tests for gn3/db/generations.py"""
+from unittest import TestCase
+from unittest import mock
+
+from gn3.db.generations import bump_dataset_generations
+from gn3.db.generations import retrieve_dataset_generation
+
+
+class TestDatasetGenerations(TestCase):
+    """Test cases for the dataset generation counters"""
+
+    def test_bump_dataset_generations(self):
+        """Test that the datasets of the edited rows are bumped"""
+        cursor = mock.MagicMock()
+        type(cursor).rowcount = 2
+        self.assertEqual(
+            bump_dataset_generations(cursor, "PublishData", {"Id": 8967049}),
+            2)
+        cursor.execute.assert_called_once_with(
+            "INSERT INTO dataset_generation "
+            "(dataset_type, dataset_name, generation) "
+            "SELECT DISTINCT %s, PublishFreeze.Name, 1 FROM "
+            "PublishData JOIN PublishXRef ON PublishXRef.DataId = PublishData.Id "
+            "JOIN PublishFreeze "
+            "ON PublishFreeze.InbredSetId = PublishXRef.InbredSetId "
+            "WHERE PublishData.Id = %s "
+            "ON DUPLICATE KEY UPDATE generation = generation + 1",
+            ("Publish", 8967049))
+
+    def test_bump_strain_dataset_generations(self):
+        """Test that the datasets of every type holding a strain are
+        bumped"""
+        cursor = mock.MagicMock()
+        type(cursor).rowcount = 2
+        self.assertEqual(
+            bump_dataset_generations(cursor, "Strain", {"Id": 10}), 6)
+        for (((sql, params), _kwargs), dataset_type) in zip(
+                cursor.execute.call_args_list, ("ProbeSet", "Publish", "Geno")):
+            self.assertEqual(params, (dataset_type, 10))
+            self.assertIn(f"SELECT DISTINCT %s, {dataset_type}Freeze.Name, 1 "
+                          "FROM Strain JOIN StrainXRef "
+                          "ON StrainXRef.StrainId = Strain.Id ", sql)
+            self.assertIn("WHERE Strain.Id = %s", sql)
+        self.assertEqual(cursor.execute.call_count, 3)
+
+    def test_bump_dataset_generations_ignored(self):
+        """Test that tables without dataset data, or an empty WHERE, are
+        ignored"""
+        cursor = mock.MagicMock()
+        self.assertEqual(
+            bump_dataset_generations(cursor, "metadata_audit", {"id": 1}), 0)
+        self.assertEqual(bump_dataset_generations(cursor, "ProbeSet", {}), 0)
+        cursor.execute.assert_not_called()
+
+    def test_retrieve_dataset_generation(self):
+        """Test that a dataset never edited is at generation 0"""
+        for fetched, expected in [[(3,), 3], [None, 0]]:
+            db_mock = mock.MagicMock()
+            with self.subTest(fetched=fetched):
+                with db_mock.cursor() as cursor:
+                    cursor.fetchone.return_value = fetched
+                    self.assertEqual(
+                        retrieve_dataset_generation(
+                            db_mock, "ProbeSet", "HC_M2_0606_P"),
+                        expected)
+                    cursor.execute.assert_called_once_with(
+                        "SELECT generation FROM dataset_generation "
+                        "WHERE dataset_type = %s AND dataset_name = %s",
+                        ("ProbeSet", "HC_M2_0606_P"))
@@ -0,0 +1,43 @@
+"""Tests for gn3/db/lit_correlations.py"""
+from unittest import TestCase
+from unittest import mock
+
+from gn3.db.lit_correlations import retrieve_lit_correlation_checksum
+from gn3.db.lit_correlations import retrieve_lit_correlation_chunks
+from gn3.db.lit_correlations import retrieve_lit_correlation_count
+
+
+class TestLitCorrelations(TestCase):
+    """Test cases for the LCorrRamin3 queries"""
+
+    def test_retrieve_lit_correlation_checksum(self):
+        """Test that the checksum of the table is returned"""
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchone.return_value = ("db_webqtl.LCorrRamin3", 1234)
+            self.assertEqual(retrieve_lit_correlation_checksum(db_mock), 1234)
+            cursor.execute.assert_called_once_with(
+                "CHECKSUM TABLE LCorrRamin3")
+
+    def test_retrieve_lit_correlation_count(self):
+        """Test that the number of rows of the table is returned"""
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchone.return_value = (8,)
+            self.assertEqual(retrieve_lit_correlation_count(db_mock), 8)
+            cursor.execute.assert_called_once_with(
+                "SELECT COUNT(*) FROM LCorrRamin3")
+
+    @mock.patch("gn3.db.lit_correlations.SSCursor")
+    def test_retrieve_lit_correlation_chunks(self, mock_sscursor):
+        """Test that the rows are streamed with a server side cursor
+        FETCH_SIZE at a time"""
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchmany.side_effect = [
+                [(15, 20, 0.5), (20, 17, 0.3)], [(25, 20, 0.9)], []]
+            self.assertEqual(
+                list(retrieve_lit_correlation_chunks(db_mock, fetch_size=2)),
+                [[(15, 20, 0.5), (20, 17, 0.3)], [(25, 20, 0.9)]])
+            cursor.fetchmany.assert_called_with(2)
+            db_mock.cursor.assert_called_with(mock_sscursor)
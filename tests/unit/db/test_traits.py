@@ -1,10 +1,26 @@
 """Tests for gn3/db/traits.py"""
+import tempfile
+from decimal import Decimal
 from unittest import mock, TestCase
+
+import numpy as np
+
+from gn3.computations.dataset_matrix import load_dataset_matrix
+from gn3.db.datasets import configure_dataset_metadata_cache
+from gn3.db.generations import retrieve_dataset_generation
 from gn3.db.traits import (
+    N_STRAIN_SQL,
+    PUBLISH_DATA_SQL,
+    PUBLISH_SE_SQL,
+    STRAIN_ID_SQL,
     build_trait_name,
     set_haveinfo_field,
+    TraitData,
     update_sample_data,
+    retrieve_trait_data,
     retrieve_trait_info,
+    retrieve_traits_info,
+    PROBESET_TRAIT_INFO_KEYS,
     set_confidential_field,
     set_homologene_id_field,
     retrieve_geno_trait_info,
@@ -15,6 +31,12 @@ from gn3.db.traits import (
 class TestTraitsDBFunctions(TestCase):
     "Test cases for traits functions"
 
+    def setUp(self):
+        configure_dataset_metadata_cache()
+
+    def tearDown(self):
+        configure_dataset_metadata_cache()
+
     def test_retrieve_publish_trait_info(self):
         """Test retrieval of type `Publish` traits."""
         db_mock = mock.MagicMock()
@@ -161,21 +183,147 @@ class TestTraitsDBFunctions(TestCase):
                             threshold, trait_fullname, db_mock),
                         expected)
 
+    def test_retrieve_traits_info_no_info(self):
+        """Test that traits without information are retrieved as
+        `retrieve_trait_info` retrieves them."""
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchone.return_value = tuple()
+            cursor.fetchall.return_value = []
+            self.assertEqual(
+                retrieve_traits_info(
+                    9, ["pubDb::PublishTraitName::pubCell",
+                        "prbDb::ProbeSetTraitName::prbCell",
+                        "genDb::GenoTraitName", "tmpDb::TempTraitName"],
+                    db_mock),
+                [{"haveinfo": 0}] * 4)
+
+    @mock.patch("gn3.db.traits.retrieve_trait_dataset")
+    def test_retrieve_traits_info(self, mock_dataset):
+        """Test that the information of many traits of a dataset is that of
+        `retrieve_trait_info`, retrieved with a query for each piece."""
+        mock_dataset.return_value = {
+            "dataset_id": 7, "dataset_name": "prbDb", "riset": "BXD",
+            "risetid": 1, "type": "ProbeSet"}
+        info_rows = [
+            (name, f"{name}-symbol", *[None] * 5, geneid, *[None] * 4,
+             f"{name}-blatseq", *[None] * 14)
+            for (name, geneid) in (("1427571_at", 16),
+                                   ("1457545_at", None),
+                                   ("1451361_a_at", 16))]
+        self.assertEqual(len(info_rows[0]), len(PROBESET_TRAIT_INFO_KEYS))
+        # upper case, as MySQL matches names in any case
+        info_rows[0] = (info_rows[0][0].upper(), *info_rows[0][1:])
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchall.side_effect = [
+                [info_rows[0], info_rows[2], info_rows[1]], [(16, 1220)]]
+            traits_info = retrieve_traits_info(
+                0, ["prbDb::1427571_at", "prbDb::1451361_a_at",
+                    "prbDb::1457545_at", "prbDb::missing_at"],
+                db_mock)
+            self.assertEqual(cursor.execute.call_count, 2)
+            self.assertEqual(mock_dataset.call_count, 1)
+            self.assertEqual(traits_info[3], {"haveinfo": 0})
+            for (row, trait_info) in zip(
+                    (info_rows[0], info_rows[2], info_rows[1]),
+                    traits_info):
+                cursor.fetchone.side_effect = [
+                    row, (1220,) if row[7] else None, (row[12],)]
+                self.assertEqual(
+                    trait_info,
+                    retrieve_trait_info(
+                        0, f"prbDb::{row[0].lower()}", db_mock))
+        self.assertEqual(
+            [trait_info["homologeneid"] for trait_info in traits_info[:3]],
+            [1220, 1220, None])
+
+    def test_trait_data(self):
+        """Test that the rows of a trait's data are kept as aligned columns
+        with constant time strain lookups."""
+        rows = [
+            {"strain_name": "BXD1", "value": 7.5, "se_error": 0.2,
+             "nstrain": 4, "id": 36688172},
+            {"strain_name": "BXD2", "value": None, "se_error": 0.3,
+             "nstrain": 3, "id": 36688172},
+            {"strain_name": "BXD5", "value": 8.1, "se_error": None,
+             "nstrain": None, "id": 36688172}]
+        trait_data = TraitData.from_rows(rows)
+        self.assertEqual((trait_data.mysqlid, trait_data.strain_names),
+                         (36688172, ["BXD1", "BXD5"]))
+        self.assertEqual((len(trait_data), "BXD1" in trait_data,
+                          "BXD2" in trait_data), (2, True, False))
+        (present, values, variances, ndata) = trait_data.align(
+            ["BXD5", "BXD2", "BXD1"])
+        self.assertEqual(present.tolist(), [True, False, True])
+        np.testing.assert_array_equal(
+            np.array([values, variances, ndata]),
+            [[8.1, np.nan, 7.5], [np.nan, np.nan, 0.2], [np.nan, np.nan, 4]])
+        self.assertEqual(
+            TraitData.from_rows(rows, ["BXD2", "BXD5"]).strain_names, ["BXD5"])
+        self.assertEqual(
+            trait_data.as_dict(),
+            {"mysqlid": 36688172,
+             "data": {
+                 "BXD1": {"strain_name": "BXD1", "value": 7.5,
+                          "variance": 0.2, "ndata": 4},
+                 "BXD5": {"strain_name": "BXD5", "value": 8.1,
+                          "variance": None, "ndata": None}}})
+        self.assertEqual(
+            TraitData.from_dict(trait_data.as_dict()).as_dict(),
+            trait_data.as_dict())
+
+    def test_trait_data_duplicate_strains(self):
+        """Test that the last row of a strain is its data, with the length,
+        strain names and arrays agreeing."""
+        rows = [
+            {"strain_name": "BXD1", "value": 7.5, "se_error": 0.2,
+             "nstrain": 4, "id": 11},
+            {"strain_name": "BXD2", "value": 7.8, "se_error": None,
+             "nstrain": None, "id": 11},
+            {"strain_name": "BXD1", "value": 9.5, "se_error": 0.4,
+             "nstrain": 5, "id": 11}]
+        trait_data = TraitData.from_rows(rows)
+        self.assertEqual((len(trait_data), trait_data.strain_names),
+                         (2, ["BXD1", "BXD2"]))
+        np.testing.assert_array_equal(
+            np.array([trait_data.values, trait_data.variances,
+                      trait_data.ndata]),
+            [[9.5, 7.8], [0.4, np.nan], [5, np.nan]])
+
+    def test_retrieve_trait_data(self):
+        """Test that the data of a trait is retrieved in the dict form, of the
+        strains in the strain list only when it is given."""
+        trait = {"trait_name": "1427571_at", "cellid": None,
+                 "db": {"dataset_type": "ProbeSet", "dataset_name": "prbDb"}}
+        db_mock = mock.MagicMock()
+        with db_mock.cursor() as cursor:
+            cursor.fetchall.return_value = [
+                ("BXD1", 7.5, None, 11), ("BXD2", 7.8, 0.1, 11)]
+            self.assertEqual(
+                retrieve_trait_data(trait, db_mock, ("BXD2", "BXD3")),
+                {"mysqlid": 11,
+                 "data": {"BXD2": {"strain_name": "BXD2", "value": 7.8,
+                                   "variance": 0.1, "ndata": None}}})
+            cursor.fetchall.return_value = [("BXD1", Decimal("7.5"), None, 11)]
+            self.assertEqual(
+                retrieve_trait_data(trait, db_mock),
+                {"mysqlid": 11,
+                 "data": {"BXD1": {"strain_name": "BXD1",
+                                   "value": Decimal("7.5"),
+                                   "variance": None, "ndata": None}}})
+            self.assertIsInstance(
+                retrieve_trait_data(trait, db_mock)["data"]["BXD1"]["value"],
+                Decimal)
+            cursor.fetchall.return_value = []
+            self.assertEqual(retrieve_trait_data(trait, db_mock), {})
+
     def test_update_sample_data(self):
         """Test that the SQL queries when calling update_sample_data are called with
         the right calls.
 
         """
         db_mock = mock.MagicMock()
-
-        STRAIN_ID_SQL: str = "UPDATE Strain SET Name = %s WHERE Id = %s"
-        PUBLISH_DATA_SQL: str = ("UPDATE PublishData SET value = %s "
-                                 "WHERE StrainId = %s AND Id = %s")
-        PUBLISH_SE_SQL: str = ("UPDATE PublishSE SET error = %s "
-                               "WHERE StrainId = %s AND DataId = %s")
-        N_STRAIN_SQL: str = ("UPDATE NStrain SET count = %s "
-                             "WHERE StrainId = %s AND DataId = %s")
-
         with db_mock.cursor() as cursor:
             type(cursor).rowcount = 1
             self.assertEqual(update_sample_data(
@@ -185,11 +333,57 @@ class TestTraitsDBFunctions(TestCase):
                              (1, 1, 1, 1))
             cursor.execute.assert_has_calls(
                 [mock.call(STRAIN_ID_SQL, ('BXD11', 10)),
+                 mock.call(mock.ANY, ("ProbeSet", 10)),
+                 mock.call(mock.ANY, ("Publish", 10)),
+                 mock.call(mock.ANY, ("Geno", 10)),
                  mock.call(PUBLISH_DATA_SQL, (18.7, 10, 8967049)),
                  mock.call(PUBLISH_SE_SQL, (2.3, 10, 8967049)),
-                 mock.call(N_STRAIN_SQL, (2, 10, 8967049))]
+                 mock.call(N_STRAIN_SQL, (2, 10, 8967049)),
+                 mock.call(mock.ANY, ("Publish", 8967049))]
             )
 
+    @mock.patch("gn3.computations.dataset_matrix.retrieve_dataset_trait_names")
+    @mock.patch("gn3.computations.dataset_matrix.retrieve_dataset_data_chunks")
+    def test_update_sample_data_strain_rename(self, mock_retrieve, mock_names):
+        """Test that renaming a strain invalidates the cached matrices of the
+        other datasets holding the strain, and that keeping its name does
+        not."""
+        datasets = {"ProbeSet": "HC_M2_0606_P", "Publish": "BXDPublish",
+                    "Geno": "BXDGeno"}
+        generations = {}
+        db_mock = mock.MagicMock()
+
+        def execute(sql, params):
+            if sql.startswith("INSERT INTO dataset_generation") and (
+                    "WHERE Strain.Id = %s" in sql):
+                key = (params[0], datasets[params[0]])
+                generations[key] = generations.get(key, 0) + 1
+            elif sql.startswith("SELECT generation"):
+                cursor.fetchone.return_value = (
+                    (generations[params],) if params in generations else None)
+
+        mock_retrieve.side_effect = lambda *_args: iter(
+            [[("1_at", "BXD11", 1.5)]])
+        mock_names.return_value = ["1_at"]
+        with db_mock.cursor() as cursor, \
+             tempfile.TemporaryDirectory() as cache_dir:
+            cursor.execute.side_effect = execute
+            for (strain_renamed, fetches) in ((0, 1), (1, 2)):
+                type(cursor).rowcount = strain_renamed
+                update_sample_data(
+                    conn=db_mock, strain_name="BXD11", strain_id=10,
+                    publish_data_id=8967049, value=18.7, error=2.3, count=2)
+                for _ in range(2):
+                    load_dataset_matrix(
+                        db_mock, "ProbeSet", "HC_M2_0606_P",
+                        retrieve_dataset_generation(
+                            db_mock, "ProbeSet", "HC_M2_0606_P"),
+                        cache_dir)
+                self.assertEqual(mock_retrieve.call_count, fetches)
+        self.assertEqual(generations, {
+            (dataset_type, name): 1
+            for (dataset_type, name) in datasets.items()})
+
     def test_set_haveinfo_field(self):
         """Test that the `haveinfo` field is set up correctly"""
         for trait_info, expected in [